@@ -4,10 +4,10 @@ requires = [
         'click',
         'colorlog',
         'execnet',
-        'motor >= 1.1',
+        'motor >= 2.0',
         'netifaces',
         'ply',
-        'pymongo',
+        'pymongo >= 3.7',
         'python-dateutil',
         'pyyaml',
         'texttable',
@@ -17,6 +17,7 @@
 """
 
 import base64
+from collections import defaultdict
 from concurrent.futures.thread import ThreadPoolExecutor
 import datetime
 import hashlib
@@ -27,18 +28,20 @@ import uuid
 import time
 
 from tornado import gen, locks
-from inmanta import env, const
+from inmanta import env, const, data
 from inmanta import methods
 from inmanta import protocol
 from inmanta.agent import handler
 from inmanta.loader import CodeLoader
 from inmanta.protocol import Scheduler, AgentEndPoint
-from inmanta.resources import Resource
+from inmanta.resources import Resource, Id
 from tornado.concurrent import Future
 from inmanta.agent.cache import AgentCache
+from inmanta.agent.filecache import FileCache
 from inmanta.agent import config as cfg
 from inmanta.agent.reporting import collect_report
 from inmanta.const import ResourceState
+from inmanta.util import decompress_payload, hash_resource_attributes
 from typing import Tuple
 
 LOGGER = logging.getLogger(__name__)
@@ -63,9 +66,11 @@ class ResourceActionResult(object):
 
 class ResourceAction(object):
 
-    def __init__(self, scheduler, resource, gid):
+    def __init__(self, scheduler, resource, gid, incremental=False):
         """
             :param gid A unique identifier to identify a deploy. This is local to this agent.
+            :param incremental Do not call the handler when the desired state of the resource is the same as the last
+                               successful deploy
         """
         self.scheduler = scheduler
         self.resource = resource
@@ -78,6 +83,7 @@ class ResourceAction(object):
         self.change = None
         self.changes = None
         self.undeployable = None
+        self.incremental = incremental
 
     def is_running(self):
         return self.running
@@ -126,7 +132,10 @@ class ResourceAction(object):
             send_event = (hasattr(self.resource, "send_event") and self.resource.send_event)
 
             try:
-                yield self.scheduler.agent.thread_pool.submit(provider.execute, ctx, self.resource)
+                if provider.can_execute_batch():
+                    yield self.scheduler.batcher.execute(provider, ctx, self.resource)
+                else:
+                    yield self.scheduler.agent.thread_pool.submit(provider.execute, ctx, self.resource)
             except Exception as e:
                 ctx.set_status(const.ResourceState.failed)
                 ctx.exception("An error occurred during deployment of %(resource_id)s (exception: %(exception)s",
@@ -198,6 +207,9 @@ class ResourceAction(object):
             else:
                 received_events = {}
 
+            resource_str = self.resource.id.resource_str()
+            attribute_hash = hash_resource_attributes(self.resource.serialize())
+
             if self.undeployable is not None:
                 ctx.set_status(self.undeployable)
                 success = False
@@ -207,23 +219,29 @@ class ResourceAction(object):
                 success = False
                 send_event = False
                 yield self._execute(ctx=ctx, events=received_events, cache=cache, event_only=True)
+            elif (self.incremental and len(received_events) == 0 and
+                  self.scheduler.deployed_hashes.get(resource_str) == attribute_hash):
+                ctx.set_status(const.ResourceState.deployed)
+                ctx.info("The desired state of %(resource_id)s did not change since its last successful deploy",
+                         resource_id=str(self.resource.id))
+                success = True
+                send_event = False
             else:
                 success, send_event = yield self._execute(ctx=ctx, events=received_events, cache=cache)
 
+            if ctx.status == const.ResourceState.deployed:
+                self.scheduler.deployed_hashes[resource_str] = attribute_hash
+            else:
+                self.scheduler.deployed_hashes.pop(resource_str, None)
+
             LOGGER.info("end run %s", self.resource)
 
             end = datetime.datetime.now()
             changes = {str(self.resource.id): ctx.changes}
-            result = yield self.scheduler.get_client().resource_action_update(tid=self.scheduler._env_id,
-                                                                              resource_ids=[str(self.resource.id)],
-                                                                              action_id=ctx.action_id,
-                                                                              action=const.ResourceAction.deploy,
-                                                                              started=start, finished=end, status=ctx.status,
-                                                                              changes=changes,
-                                                                              messages=ctx.logs, change=ctx.change,
-                                                                              send_events=send_event)
-            if result.code != 200:
-                LOGGER.error("Resource status update failed %s", result.result)
+            self.scheduler.get_status_buffer().add(resource_ids=[str(self.resource.id)], action_id=ctx.action_id,
+                                                   action=const.ResourceAction.deploy, started=start, finished=end,
+                                                   status=ctx.status, changes=changes, messages=ctx.logs,
+                                                   change=ctx.change, send_events=send_event)
 
             self.status = ctx.status
             self.change = ctx.change
@@ -304,6 +322,129 @@ class RemoteResourceAction(ResourceAction):
             self.future.set_result(ResourceActionResult(True, send_events, False))
 
 
+class ResourceActionUpdateBuffer(object):
+    """
+        Coalesces the results of finished resource actions and sends them to the server in batches. A batch is sent when
+        it is full or when the oldest update in it has been buffered for flush_interval seconds.
+
+        :param process: The agent process that owns the buffer
+        :param batch_size: The maximal number of updates in a single call, 1 sends each update immediately
+        :param flush_interval: The maximal time in seconds an update is buffered
+    """
+
+    def __init__(self, process, batch_size: int, flush_interval: float) -> None:
+        self.process = process
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._timeout = None
+        # batches are sent one at a time so updates of the same resource arrive in order
+        self._lock = locks.Lock()
+
+    def add(self, **action) -> None:
+        """
+            Add the result of a finished resource action. The arguments are those of resource_action_update.
+        """
+        self._pending.append(action)
+        if len(self._pending) >= self.batch_size or self.flush_interval <= 0:
+            self.flush()
+        elif self._timeout is None:
+            self._timeout = self.process._io_loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        """
+            Send all buffered updates to the server
+        """
+        if self._timeout is not None:
+            self.process._io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+        if len(self._pending) == 0:
+            return
+
+        actions = self._pending
+        self._pending = []
+        self.process.add_future(self._send(actions))
+
+    @gen.coroutine
+    def _send_one(self, action):
+        result = yield self.process._client.resource_action_update(tid=self.process._env_id, **action)
+        if result.code != 200:
+            LOGGER.error("Resource status update failed %s", result.result)
+
+    @gen.coroutine
+    def _send(self, actions):
+        with (yield self._lock.acquire()):
+            if len(actions) == 1:
+                yield self._send_one(actions[0])
+                return
+
+            result = yield self.process._client.resource_action_update_batched(tid=self.process._env_id, actions=actions)
+            if result.code != 200:
+                # fall back to individual updates, for example when the server does not support batches
+                LOGGER.warning("Batched resource status update failed (%s), sending updates one by one", result.code)
+                for action in actions:
+                    yield self._send_one(action)
+                return
+
+            for action, action_result in zip(actions, result.result["results"]):
+                if action_result["code"] != 200:
+                    LOGGER.error("Resource status update for %s failed %s", action["resource_ids"],
+                                 action_result.get("message"))
+
+
+class ResourceBatcher(object):
+    """
+        Collects the resources that are ready to deploy and whose handler can execute them in batch. The resources of the
+        same type and handler that become ready within window seconds are deployed with a single call to the handler.
+
+        A resource action holds a slot of the rate limiter of the agent. It gives up this slot while it waits for its batch,
+        so other resources can join the batch. The batch itself uses a single slot.
+    """
+
+    def __init__(self, scheduler, window: float) -> None:
+        self.scheduler = scheduler
+        self.window = window
+        # (resource type, handler class) -> list of (provider, ctx, resource, future)
+        self._pending = {}
+
+    @gen.coroutine
+    def execute(self, provider, ctx, resource):
+        key = (resource.id.entity_type, provider.__class__)
+        if key not in self._pending:
+            self._pending[key] = []
+            self.scheduler.agent.add_future(self._execute_batch(key))
+
+        future = Future()
+        self._pending[key].append((provider, ctx, resource, future))
+
+        self.scheduler.ratelimiter.release()
+        try:
+            yield future
+        finally:
+            yield self.scheduler.ratelimiter.acquire()
+
+    @gen.coroutine
+    def _execute_batch(self, key):
+        yield gen.sleep(self.window)
+        items = self._pending.pop(key)
+        provider = items[0][0]
+
+        try:
+            with (yield self.scheduler.ratelimiter.acquire()):
+                LOGGER.debug("Deploying %d resources of type %s in batch", len(items), key[0])
+                yield self.scheduler.agent.thread_pool.submit(provider.execute_batch,
+                                                              [(ctx, resource) for _, ctx, resource, _ in items])
+        except Exception as e:
+            for _, ctx, resource, _ in items:
+                ctx.set_status(const.ResourceState.failed)
+                ctx.exception("An error occurred during deployment of %(resource_id)s (exception: %(exception)s",
+                              resource_id=resource.id, exception=repr(e))
+        finally:
+            for _, _, _, future in items:
+                future.set_result(None)
+
+
 class ResourceScheduler(object):
 
     def __init__(self, agent, env_id, name, cache, ratelimiter):
@@ -315,8 +456,11 @@ class ResourceScheduler(object):
         self.name = name
         self.ratelimiter = ratelimiter
         self.version = 0
+        # resource id -> hash of the attributes of its last successful deploy
+        self.deployed_hashes = {}
+        self.batcher = ResourceBatcher(self, cfg.agent_batch_window.get())
 
-    def reload(self, resources, undeployable={}, reason: str="RELOAD"):
+    def reload(self, resources, undeployable={}, reason: str="RELOAD", incremental: bool=False):
         version = resources[0].id.get_version
 
         self.version = version
@@ -326,7 +470,7 @@ class ResourceScheduler(object):
 
         gid = uuid.uuid4()
         LOGGER.debug("Running %s for reason: %s" % (gid, reason))
-        self.generation = {r.id.resource_str(): ResourceAction(self, r, gid) for r in resources}
+        self.generation = {r.id.resource_str(): ResourceAction(self, r, gid, incremental) for r in resources}
 
         for key, res in self.generation.items():
             vid = str(res.resource.id)
@@ -342,7 +486,17 @@ class ResourceScheduler(object):
         dummy = ResourceAction(self, None, gid)
         for r in self.generation.values():
             self.agent.add_future(r.execute(dummy, self.generation, self.cache))
-        dummy.future.set_result(ResourceActionResult(True, False, False))
+        self.agent.add_future(self._prefetch_and_start(resources, dummy))
+
+    @gen.coroutine
+    def _prefetch_and_start(self, resources, dummy):
+        """
+            Let the handlers prefetch the state of the resources and then start the resource actions
+        """
+        try:
+            yield self.agent.prefetch(resources)
+        finally:
+            dummy.future.set_result(ResourceActionResult(True, False, False))
 
     def notify_ready(self, resourceid, send_events, state, change, changes):
         if resourceid not in self.cad:
@@ -361,6 +515,9 @@ class ResourceScheduler(object):
     def get_client(self):
         return self.agent.get_client()
 
+    def get_status_buffer(self):
+        return self.agent.get_status_buffer()
+
 
 class AgentInstance(object):
 
@@ -378,7 +535,8 @@ class AgentInstance(object):
         # threads to setup connections
         self.provider_thread_pool = ThreadPoolExecutor(1)
         # threads to work
-        self.thread_pool = ThreadPoolExecutor(process.poolsize)
+        # a dryrun holds a single slot of the rate limiter but runs up to agent-dryrun-concurrency handlers
+        self.thread_pool = ThreadPoolExecutor(max(process.poolsize, cfg.agent_dryrun_concurrency.get()))
         self.ratelimiter = locks.Semaphore(process.poolsize)
 
         self._env_id = process._env_id
@@ -386,7 +544,7 @@ class AgentInstance(object):
         self.sessionid = process.sessionid
 
         # init
-        self._cache = AgentCache()
+        self._cache = AgentCache(cfg.agent_cache_size.get())
         self._nq = ResourceScheduler(self, self.process.environment, name, self._cache, ratelimiter=self.ratelimiter)
         self._enabled = None
 
@@ -398,6 +556,10 @@ class AgentInstance(object):
         self._getting_resources = False
         self._get_resource_timeout = 0
 
+        # the most recently pulled version and its resources by resource id, used to only pull changes
+        self._pulled_version = None
+        self._pulled_resources = {}
+
     @property
     def environment(self):
         return self.process.environment
@@ -405,6 +567,12 @@ class AgentInstance(object):
     def get_client(self):
         return self.process._client
 
+    def get_status_buffer(self):
+        return self.process._status_buffer
+
+    def get_file_cache(self) -> FileCache:
+        return self.process._file_cache
+
     @property
     def uri(self):
         return self._uri
@@ -460,9 +628,58 @@ class AgentInstance(object):
         return provider
 
     @gen.coroutine
-    def get_latest_version_for_agent(self, reason="Unknown"):
+    def prefetch(self, resources):
+        """
+            Call the prefetch method of the handler of each resource type once with all resources of that type. Only the
+            types with a handler that overrides prefetch are handled, concurrently on the thread pool.
+        """
+        per_type = defaultdict(list)
+        for resource in resources:
+            resource_type = resource.id.entity_type
+            handlers = handler.Commander.get_handlers().get(resource_type, {})
+            if any(h.prefetch is not handler.ResourceHandler.prefetch for h in handlers.values()):
+                per_type[resource_type].append(resource)
+
+        if len(per_type) == 0:
+            return
+
+        @gen.coroutine
+        def prefetch_type(resource_type, type_resources):
+            try:
+                provider = yield self.get_provider(type_resources[0])
+            except Exception:
+                # the resource actions report that there is no handler
+                return
+
+            try:
+                yield self.thread_pool.submit(provider.prefetch, type_resources)
+            except Exception:
+                LOGGER.exception("Failed to prefetch resources of type %s", resource_type)
+            finally:
+                provider.close()
+
+        version = resources[0].id.version
+        self._cache.open_version(version)
+        try:
+            yield [prefetch_type(resource_type, type_resources) for resource_type, type_resources in per_type.items()]
+        finally:
+            self._cache.close_version(version)
+
+    @gen.coroutine
+    def _is_incremental_deploy_enabled(self):
+        result = yield self.get_client().get_setting(tid=self._env_id, id=data.INCREMENTAL_DEPLOY)
+        if result.code != 200:
+            LOGGER.warning("Unable to get the deploy mode of agent %s, doing a full deploy. %s", self.name, result.result)
+            return False
+
+        return result.result["value"]
+
+    @gen.coroutine
+    def get_latest_version_for_agent(self, reason="Unknown", incremental_deploy=False):
         """
             Get the latest version for the given agent (this is also how we are notified)
+
+            :param incremental_deploy: Do an incremental deploy when this is enabled in the environment
         """
         if not self._can_get_resources():
             return
@@ -473,7 +690,9 @@ class AgentInstance(object):
             self._getting_resources = True
             start = time.time()
             try:
-                result = yield self.get_client().get_resources_for_agent(tid=self._env_id, agent=self.name)
+                since_version = self._pulled_version if len(self._pulled_resources) > 0 else None
+                result = yield self.get_client().get_resources_for_agent(tid=self._env_id, agent=self.name,
+                                                                         since_version=since_version)
             finally:
                 self._getting_resources = False
             end = time.time()
@@ -485,26 +704,54 @@ class AgentInstance(object):
                 LOGGER.warning("Got an error while pulling resources for agent %s. %s", self.name, result.result)
 
             else:
+                unchanged = result.result.get("unchanged", [])
                 restypes = set([res["resource_type"] for res in result.result["resources"]])
-                resources = []
+                restypes.update(Id.parse_id(res["id"]).entity_type for res in unchanged)
                 yield self.process._ensure_code(self._env_id, result.result["version"], restypes)
+
+                resources = []
+                undeployable = {}
                 try:
-                    undeployable = {}
                     for res in result.result["resources"]:
-                        state = const.ResourceState[res["status"]]
-                        if state in const.UNDEPLOYABLE_STATES:
-                            undeployable[res["id"]] = state
-
                         data = res["attributes"]
                         data["id"] = res["id"]
                         resource = Resource.deserialize(data)
                         resources.append(resource)
                         LOGGER.debug("Received update for %s", resource.id)
+
+                    resources.extend(self._merge_unchanged(result.result["version"], unchanged))
+
+                    for res in result.result["resources"] + unchanged:
+                        state = const.ResourceState[res["status"]]
+                        if state in const.UNDEPLOYABLE_STATES:
+                            undeployable[res["id"]] = state
                 except TypeError:
                     LOGGER.exception("Failed to receive update")
+                except KeyError:
+                    if since_version is None:
+                        raise
+                    # we no longer have the version the server compared with, the next pull gets everything again
+                    LOGGER.warning("Unable to apply the changes since version %s for agent %s", since_version, self.name)
+                    self._pulled_resources = {}
+                    self._get_resource_timeout = 0
+                    self.add_future(self.get_latest_version_for_agent(reason, incremental_deploy))
+                    return
+
+                self._pulled_version = result.result["version"]
+                self._pulled_resources = {res.id.resource_str(): res for res in resources}
 
                 if len(resources) > 0:
-                    self._nq.reload(resources, undeployable, reason=reason)
+                    if incremental_deploy:
+                        incremental_deploy = yield self._is_incremental_deploy_enabled()
+                    self._nq.reload(resources, undeployable, reason=reason, incremental=incremental_deploy)
+
+    def _merge_unchanged(self, version: int, unchanged: list):
+        """
+            Create the resources that did not change since the previously pulled version from the previously pulled
+            resources. Raises a KeyError when the previously pulled version does not contain a resource.
+        """
+        return [self._pulled_resources[Id.parse_id(res["id"]).resource_str()].copy_for_version(version)
+                for res in unchanged]
 
     @gen.coroutine
     def dryrun(self, dry_run_id, version):
@@ -513,6 +760,11 @@ class AgentInstance(object):
 
     @gen.coroutine
     def do_run_dryrun(self, version, dry_run_id):
+        """
+            Run a dryrun of all resources of this agent in the given version. A dryrun does not change anything and does
+            not follow the dependencies between resources, so up to agent-dryrun-concurrency resources are processed at
+            the same time. The results are sent to the server in batches.
+        """
         with (yield self.dryrunlock.acquire()):
             with (yield self.ratelimiter.acquire()):
                 result = yield self.get_client().get_resources_for_agent(tid=self._env_id, agent=self.name, version=version)
@@ -532,71 +784,103 @@ class AgentInstance(object):
 
                 self._cache.open_version(version)
 
-                for res in resources:
-                    ctx = handler.HandlerContext(res, True)
-                    started = datetime.datetime.now()
-                    provider = None
-                    try:
-                        if const.ResourceState[res["status"]] in const.UNDEPLOYABLE_STATES:
-                            ctx.exception("Skipping %(resource_id)s because in undeployable state %(status)s",
-                                          resource_id=res["id"], status=res["status"])
-                            yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=res["id"],
-                                                                  changes={})
-                            continue
+                batch_size = cfg.agent_status_batch_size.get()
+                results = {}
+                todo = iter(resources)
 
-                        data = res["attributes"]
-                        data["id"] = res["id"]
-                        resource = Resource.deserialize(data)
-                        LOGGER.debug("Running dryrun for %s", resource.id)
-
-                        try:
-                            provider = yield self.get_provider(resource)
-                        except Exception as e:
-                            ctx.exception("Unable to find a handler for %(resource_id)s (exception: %(exception)s",
-                                          resource_id=str(resource.id), exception=str(e))
-                            yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=res["id"],
-                                                                  changes={"handler": {"current": "FAILED",
-                                                                                       "desired": "Unable to find a handler"}})
-                        else:
-                            try:
-                                yield self.thread_pool.submit(provider.execute, ctx, resource, dry_run=True)
-                                changes = ctx.changes
-                                if changes is None:
-                                    changes = {}
-                                if(ctx.status == ResourceState.failed):
-                                    changes["handler"] = {"current": "FAILED", "desired": "Handler failed"}
-                                yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=res["id"],
-                                                                      changes=changes)
-                            except Exception as e:
-                                ctx.exception("Exception during dryrun for %(resource_id)s (exception: %(exception)s",
-                                              resource_id=str(resource.id), exception=str(e))
-                                changes = ctx.changes
-                                if changes is None:
-                                    changes = {}
-                                changes["handler"] = {"current": "FAILED", "desired": "Handler failed"}
-                                yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=res["id"],
-                                                                      changes=changes)
+                @gen.coroutine
+                def worker():
+                    nonlocal results
+                    for res in todo:
+                        results[res["id"]] = yield self._dryrun_resource(res)
+                        if len(results) >= batch_size:
+                            batch, results = results, {}
+                            yield self._send_dryrun_results(dry_run_id, batch)
 
-                    except Exception:
-                        ctx.exception("Unable to process resource for dryrun.")
-                        changes = {}
-                        changes["handler"] = {"current": "FAILED", "desired": "Resource Deserialization Failed"}
-                        yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=res["id"],
-                                                              changes=changes)
-                    finally:
-                        if provider is not None:
-                            provider.close()
-
-                        finished = datetime.datetime.now()
-                        yield self.get_client().resource_action_update(tid=self._env_id, resource_ids=[res["id"]],
-                                                                       action_id=ctx.action_id,
-                                                                       action=const.ResourceAction.dryrun,
-                                                                       started=started,
-                                                                       finished=finished,
-                                                                       messages=ctx.logs,
-                                                                       status=const.ResourceState.dry)
-
-                self._cache.close_version(version)
+                try:
+                    yield [worker() for _ in range(max(1, cfg.agent_dryrun_concurrency.get()))]
+                    yield self._send_dryrun_results(dry_run_id, results)
+                finally:
+                    self._cache.close_version(version)
+
+    @gen.coroutine
+    def _dryrun_resource(self, res):
+        """
+            Run the dryrun of a single resource
+
+            :return: The changes that are reported to the server for this resource
+        """
+        ctx = handler.HandlerContext(res, True)
+        started = datetime.datetime.now()
+        provider = None
+        changes = {}
+        try:
+            if const.ResourceState[res["status"]] in const.UNDEPLOYABLE_STATES:
+                ctx.exception("Skipping %(resource_id)s because in undeployable state %(status)s",
+                              resource_id=res["id"], status=res["status"])
+                return changes
+
+            data = res["attributes"]
+            data["id"] = res["id"]
+            resource = Resource.deserialize(data)
+            LOGGER.debug("Running dryrun for %s", resource.id)
+
+            try:
+                provider = yield self.get_provider(resource)
+            except Exception as e:
+                ctx.exception("Unable to find a handler for %(resource_id)s (exception: %(exception)s",
+                              resource_id=str(resource.id), exception=str(e))
+                changes["handler"] = {"current": "FAILED", "desired": "Unable to find a handler"}
+                return changes
+
+            try:
+                yield self.thread_pool.submit(provider.execute, ctx, resource, dry_run=True)
+                if ctx.changes is not None:
+                    changes = ctx.changes
+                if ctx.status == ResourceState.failed:
+                    changes["handler"] = {"current": "FAILED", "desired": "Handler failed"}
+            except Exception as e:
+                ctx.exception("Exception during dryrun for %(resource_id)s (exception: %(exception)s",
+                              resource_id=str(resource.id), exception=str(e))
+                if ctx.changes is not None:
+                    changes = ctx.changes
+                changes["handler"] = {"current": "FAILED", "desired": "Handler failed"}
+
+            return changes
+        except Exception:
+            ctx.exception("Unable to process resource for dryrun.")
+            changes["handler"] = {"current": "FAILED", "desired": "Resource Deserialization Failed"}
+            return changes
+        finally:
+            if provider is not None:
+                provider.close()
+
+            self.get_status_buffer().add(resource_ids=[res["id"]], action_id=ctx.action_id,
+                                         action=const.ResourceAction.dryrun, started=started,
+                                         finished=datetime.datetime.now(), messages=ctx.logs,
+                                         status=const.ResourceState.dry)
+
+    @gen.coroutine
+    def _send_dryrun_results(self, dry_run_id, results):
+        """
+            Send the changes of the given resources to the server, with a single call when possible
+        """
+        if len(results) == 0:
+            return
+
+        if len(results) > 1:
+            result = yield self.get_client().dryrun_update_batched(tid=self._env_id, id=dry_run_id, resources=results)
+            if result.code == 200:
+                return
+
+            # fall back to individual updates, for example when the server does not support batches
+            LOGGER.warning("Batched dryrun update failed (%s), sending results one by one", result.code)
+
+        for resource_id, changes in results.items():
+            result = yield self.get_client().dryrun_update(tid=self._env_id, id=dry_run_id, resource=resource_id,
+                                                           changes=changes)
+            if result.code != 200:
+                LOGGER.error("Dryrun update for %s failed %s", resource_id, result.result)
 
     @gen.coroutine
     def do_restore(self, restore_id, snapshot_id, resources):
@@ -792,6 +1076,7 @@ class Agent(AgentEndPoint):
 
         self.agent_map = agent_map
         self._storage = self.check_storage()
+        self._file_cache = FileCache(self._storage["files"], cfg.agent_file_cache_size.get())
 
         if environment is None:
             environment = cfg.environment.get()
@@ -800,6 +1085,8 @@ class Agent(AgentEndPoint):
         self.set_environment(environment)
 
         self._instances = {}
+        self._status_buffer = ResourceActionUpdateBuffer(self, cfg.agent_status_batch_size.get(),
+                                                         cfg.agent_status_flush_interval.get())
 
         if code_loader:
             self._env = env.VirtualEnv(self._storage["env"])
@@ -808,6 +1095,11 @@ class Agent(AgentEndPoint):
         else:
             self._loader = None
 
+        # the version and hash of the last code bundle that was installed
+        self._code_version = None
+        self._code_hash = None
+        self._code_lock = locks.Lock()
+
         if hostname is not None:
             self.add_end_point_name(hostname)
 
@@ -851,6 +1143,10 @@ class Agent(AgentEndPoint):
         else:
             return self.pause(agent)
 
+    def stop(self):
+        self._status_buffer.flush()
+        super().stop()
+
     @gen.coroutine
     def on_reconnect(self):
         for name in self._instances.keys():
@@ -875,20 +1171,74 @@ class Agent(AgentEndPoint):
     @gen.coroutine
     def _ensure_code(self, environment, version, resourcetypes):
         """
-            Ensure that the code for the given environment and version is loaded
+            Ensure that the code for the given environment and version is loaded. The code of all resource types in the
+            version is retrieved as a single bundle. When the bundle did not change since the last installed version, nothing
+            is installed.
+        """
+        if self._loader is None:
+            return
+
+        with (yield self._code_lock.acquire()):
+            if version == self._code_version:
+                return
+
+            result = yield self._client.get_code_bundle(environment, version, code_hash=self._code_hash)
+            if result.code != 200:
+                LOGGER.warning("Unable to get the code bundle of version %s (%s), getting the code per resource type",
+                               version, result.code)
+                yield self._ensure_code_per_type(environment, version, resourcetypes)
+                return
+
+            if not result.result["unchanged"]:
+                sources = decompress_payload(result.result["sources"])
+                LOGGER.debug("Installing code bundle %s of version %s", result.result["hash"], version)
+                success = yield self._install_bundle(sources)
+                if not success:
+                    # try again with the next version
+                    self._code_version = None
+                    self._code_hash = None
+                    return
+
+            self._code_version = version
+            self._code_hash = result.result["hash"]
+
+    @gen.coroutine
+    def _ensure_code_per_type(self, environment, version, resourcetypes):
+        for rt in resourcetypes:
+            result = yield self._client.get_code(environment, version, rt)
+
+            if result.code == 200:
+                for key, source in result.result["sources"].items():
+                    try:
+                        LOGGER.debug("Installing handler %s for %s", rt, source[1])
+                        yield self._install(key, source)
+                        LOGGER.debug("Installed handler %s for %s", rt, source[1])
+                    except Exception:
+                        LOGGER.exception("Failed to install handler %s for %s", rt, source[1])
+
+    @gen.coroutine
+    def _install_bundle(self, sources):
+        """
+            Install the requirements of all sources in a bundle at once and load the sources
+
+            :return: True when all code was installed
         """
-        if self._loader is not None:
-            for rt in resourcetypes:
-                result = yield self._client.get_code(environment, version, rt)
+        success = True
+        requirements = sorted(set(req for source in sources.values() for req in source[3]))
+        try:
+            yield self.thread_pool.submit(self._env.install_from_list, requirements, True)
+        except Exception:
+            LOGGER.exception("Failed to install the requirements %s", requirements)
+            success = False
 
-                if result.code == 200:
-                    for key, source in result.result["sources"].items():
-                        try:
-                            LOGGER.debug("Installing handler %s for %s", rt, source[1])
-                            yield self._install(key, source)
-                            LOGGER.debug("Installed handler %s for %s", rt, source[1])
-                        except Exception:
-                            LOGGER.exception("Failed to install handler %s for %s", rt, source[1])
+        for key, source in sources.items():
+            try:
+                yield self.thread_pool.submit(self._loader.deploy_version, key, source)
+            except Exception:
+                LOGGER.exception("Failed to install handler %s", source[1])
+                success = False
+
+        return success
 
     @gen.coroutine
     def _install(self, key, source):
@@ -908,7 +1258,7 @@ class Agent(AgentEndPoint):
             return 500, "Agent is not _enabled"
 
         LOGGER.info("Agent %s got a trigger to update in environment %s", agent, env)
-        future = self._instances[agent].get_latest_version_for_agent(reason="call to trigger_update")
+        future = self._instances[agent].get_latest_version_for_agent(reason="call to trigger_update", incremental_deploy=True)
         self.add_future(future)
         return 200
 
@@ -975,6 +1325,11 @@ class Agent(AgentEndPoint):
         if not os.path.exists(env_dir):
             os.mkdir(env_dir)
 
+        file_dir = os.path.join(agent_state_dir, "files")
+        dir_map["files"] = file_dir
+        if not os.path.exists(file_dir):
+            os.mkdir(file_dir)
+
         return dir_map
 
     @protocol.handle(methods.AgentRestore.do_restore, env="tid")
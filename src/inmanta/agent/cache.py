@@ -16,15 +16,21 @@
     Contact: code@inmanta.com
 """
 
+import heapq
+import itertools
 import time
-import sys
-import bisect
 import logging
-from threading import Lock
+from collections import OrderedDict
+from threading import Lock, RLock
+
+from typing import Dict, List
 
 
 LOGGER = logging.getLogger()
 
+# the minimal number of removed items on the timer heap before it is compacted
+MIN_COMPACT_SIZE = 100
+
 
 class Scope(object):
 
@@ -46,13 +52,26 @@ class CacheItem(object):
         return self.time < other.time
 
     def delete(self):
-        if callable(self.call_on_delete):
-            self.call_on_delete(self.value)
+        call_on_delete = self.call_on_delete
+        # only call the callback once, whether the item is removed from the cache or garbage collected
+        self.call_on_delete = None
+        if callable(call_on_delete):
+            call_on_delete(self.value)
 
     def __del__(self):
         self.delete()
 
 
+class KeyLock(object):
+    """
+        A lock to load the value of a single key, with the number of threads that use it
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.users = 0
+
+
 class AgentCache(object):
     """
         Caching system for the agent:
@@ -63,16 +82,28 @@ class AgentCache(object):
 
         versions are opened and closed
         when a version is closed as many times as it was opened, all cache items linked to this version are dropped
+
+        When max_size is set and the cache holds more items, the least recently used items are dropped. Items expire from
+        a heap ordered on expiry time. Items that were removed in an other way stay on the heap until they expire and are
+        ignored then.
     """
 
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, max_size: int=None):
+        self.cache = OrderedDict()  # type: Dict[str, CacheItem]
         self.counterforVersion = {}
         self.keysforVersion = {}
+        # heap of (expiry time, sequence number, item)
         self.timerqueue = []
-        self.nextAction = sys.maxsize
-        self.addLock = Lock()
-        self.addLocks = {}
+        self.sequence = itertools.count()
+        self.max_size = max_size
+        # protects the structure of the cache, the callbacks of items are called after it is released
+        self.lock = RLock()
+        self.keyLocks = {}  # type: Dict[str, KeyLock]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def is_open(self, version: int) -> bool:
         """
@@ -86,12 +117,13 @@ class AgentCache(object):
 
             :param verion the version id to open the cache for
         """
-        if version in self.counterforVersion:
-            self.counterforVersion[version] += 1
-        else:
-            LOGGER.debug("Cache open version %d", version)
-            self.counterforVersion[version] = 1
-            self.keysforVersion[version] = set()
+        with self.lock:
+            if version in self.counterforVersion:
+                self.counterforVersion[version] += 1
+            else:
+                LOGGER.debug("Cache open version %d", version)
+                self.counterforVersion[version] = 1
+                self.keysforVersion[version] = set()
 
     def close_version(self, version: int):
         """
@@ -101,63 +133,115 @@ class AgentCache(object):
 
             :param verion the version id to close the cache for
         """
-        if version not in self.counterforVersion:
-            raise Exception("Closed version that does not exist")
+        removed = []
+        with self.lock:
+            if version not in self.counterforVersion:
+                raise Exception("Closed version that does not exist")
 
-        self.counterforVersion[version] -= 1
+            self.counterforVersion[version] -= 1
 
-        if self.counterforVersion[version] != 0:
-            return
+            if self.counterforVersion[version] != 0:
+                return
 
-        LOGGER.debug("Cache close version %d", version)
-        for x in self.keysforVersion[version]:
-            try:
-                item = self.cache[x]
-                item.delete()
-                del self.cache[x]
-            except KeyError:
-                # already gone
-                pass
+            LOGGER.debug("Cache close version %d", version)
+            for x in self.keysforVersion[version]:
+                item = self.cache.pop(x, None)
+                if item is not None:
+                    removed.append(item)
+
+            del self.counterforVersion[version]
+            del self.keysforVersion[version]
+
+        self._delete_items(removed)
+
+    def _delete_items(self, items: List[CacheItem]) -> None:
+        for item in items:
+            item.delete()
 
-        del self.counterforVersion[version]
-        del self.keysforVersion[version]
+    def _remove(self, item: CacheItem) -> None:
+        """
+            Remove an item from the cache and from the keys of its version. The lock should be held.
+        """
+        del self.cache[item.key]
+        version = item.scope.version
+        if version != 0 and version in self.keysforVersion:
+            self.keysforVersion[version].discard(item.key)
 
-    def _advance_time(self):
+    def _advance_time(self) -> List[CacheItem]:
+        """
+            Remove the expired items. The lock should be held.
+
+            :return: The removed items, to delete after the lock is released
+        """
+        removed = []
         now = time.time()
-        while now > self.nextAction and len(self.timerqueue) > 0:
-            item = self.timerqueue.pop(0)
-            try:
-                del self.cache[item.key]
-            except KeyError:
-                # already gone
-                pass
-            if len(self.timerqueue) > 0:
-                self.nextAction = self.timerqueue[0].time
-            else:
-                self.nextAction = sys.maxsize
+        while len(self.timerqueue) > 0 and now > self.timerqueue[0][0]:
+            item = heapq.heappop(self.timerqueue)[2]
+            if self.cache.get(item.key) is item:
+                self._remove(item)
+                removed.append(item)
+                self.expirations += 1
+
+        return removed
+
+    def _evict(self) -> List[CacheItem]:
+        """
+            Remove the least recently used items when the cache is too large. The lock should be held.
+        """
+        removed = []
+        if self.max_size is None:
+            return removed
+
+        while len(self.cache) > self.max_size:
+            item = next(iter(self.cache.values()))
+            self._remove(item)
+            removed.append(item)
+            self.evictions += 1
+
+        return removed
+
+    def _compact(self) -> None:
+        """
+            Drop the entries of removed items from the heap when they are the majority. The lock should be held.
+        """
+        if len(self.timerqueue) > 2 * len(self.cache) + MIN_COMPACT_SIZE:
+            self.timerqueue = [entry for entry in self.timerqueue if self.cache.get(entry[2].key) is entry[2]]
+            heapq.heapify(self.timerqueue)
 
     def _get(self, key):
-        self._advance_time()
-        return self.cache[key]
+        with self.lock:
+            removed = self._advance_time()
+            item = self.cache.get(key)
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+
+        self._delete_items(removed)
+        if item is None:
+            raise KeyError(key)
+        return item
 
     def _cache(self, item: CacheItem):
         scope = item.scope
 
-        if item.key in self.cache:
-            raise Exception("Added same item twice")
+        with self.lock:
+            if item.key in self.cache:
+                raise Exception("Added same item twice")
 
-        self.cache[item.key] = item
+            if scope.version != 0:
+                try:
+                    self.keysforVersion[scope.version].add(item.key)
+                except KeyError:
+                    raise Exception("Added data to version that is not open")
 
-        if scope.version != 0:
-            try:
-                self.keysforVersion[scope.version].add(item.key)
-            except KeyError:
-                raise Exception("Added data to version that is not open")
+            self.cache[item.key] = item
+            heapq.heappush(self.timerqueue, (item.time, next(self.sequence), item))
+            removed = self._advance_time() + self._evict()
+            self._compact()
 
-        bisect.insort_right(self.timerqueue, item)
-        if item.time < self.nextAction:
-            self.nextAction = item.time
-        self._advance_time()
+        self._delete_items(removed)
 
     def cache_value(self, key, value, resource=None, version=0, timeout=5000, call_on_delete=None):
         """
@@ -218,22 +302,32 @@ class AgentCache(object):
         try:
             return self.find(key, **args)
         except KeyError:
-            with self.addLock:
-                if key in self.addLocks:
-                    lock = self.addLocks[key]
-                else:
-                    lock = Lock()
-                    self.addLocks[key] = lock
-            with lock:
-                try:
-                    value = self.find(key, **args)
-                except KeyError:
-                    value = function(**kwargs)
-                    if cache_none or value is not None:
-                        self.cache_value(key, value, timeout=timeout, call_on_delete=call_on_delete, **args)
-            with self.addLock:
-                del self.addLocks[key]
+            # only one thread loads the value of a key, the others wait for it
+            with self.lock:
+                key_lock = self.keyLocks.get(key)
+                if key_lock is None:
+                    key_lock = KeyLock()
+                    self.keyLocks[key] = key_lock
+                key_lock.users += 1
+            try:
+                with key_lock.lock:
+                    try:
+                        value = self.find(key, **args)
+                    except KeyError:
+                        value = function(**kwargs)
+                        if cache_none or value is not None:
+                            self.cache_value(key, value, timeout=timeout, call_on_delete=call_on_delete, **args)
+            finally:
+                with self.lock:
+                    key_lock.users -= 1
+                    if key_lock.users == 0:
+                        del self.keyLocks[key]
             return value
 
+    def get_statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations,
+                    "entries": len(self.cache)}
+
     def report(self):
         return "\n".join([str(k) + " " + str(v) for k, v in self.counterforVersion.items()])
@@ -65,6 +65,37 @@ server_timeout = \
     Option("config", "server-timeout", 125,
            "Amount of time to wait for a response from the server before we try to reconnect, must be smaller than server.agent-hold", is_time)
 
+agent_status_batch_size = \
+    Option("config", "agent-status-batch-size", 100,
+           """The maximal number of resource status updates the agent sends to the server in a single call.
+Set this to 1 to send each update as soon as the resource is deployed.""", is_int)
+
+agent_status_flush_interval = \
+    Option("config", "agent-status-flush-interval", 0.1,
+           """The maximal time in seconds a resource status update is buffered by the agent before it is sent to the
+server. Cross agent dependencies are notified by the server, so this delays their deployment by at most this amount.""",
+           is_float)
+
+agent_dryrun_concurrency = \
+    Option("config", "agent-dryrun-concurrency", 4,
+           """The number of resources an agent processes at the same time during a dryrun. A dryrun does not change
+anything and does not follow the dependencies between resources.""", is_int)
+
+agent_batch_window = \
+    Option("config", "agent-batch-window", 0.1,
+           """The time in seconds the agent waits for other resources of the same type to become ready before it deploys
+them in a single batch. Only applies to handlers that support batch execution.""", is_float)
+
+agent_cache_size = \
+    Option("config", "agent-cache-size", 10000,
+           """The maximal number of items in the cache of each agent instance. When the cache holds more items, the least
+recently used items are dropped.""", is_int)
+
+agent_file_cache_size = \
+    Option("config", "agent-file-cache-size", 512 * 1024 * 1024,
+           """The maximal size in bytes of the files the agent keeps on disk after retrieving them from the server. When the
+files exceed this size, the least recently used files are removed.""", is_int)
+
 
 ##############################
 # agent_rest_transport
@@ -0,0 +1,158 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+
+import logging
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+from inmanta.util import hash_file
+from typing import Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+HASH_RE = re.compile("^[0-9a-f]{40}$")
+# the number of characters of the hash that is used as the name of the directory a file is stored in
+SHARD_PREFIX_LENGTH = 2
+
+
+class FileCache(object):
+    """
+        A cache on disk of the files the handlers retrieve from the server. A file is stored under the sha1 hash of its
+        content, so it never has to be invalidated. It is shared by all agent instances of an agent process and survives a
+        restart of the agent.
+
+        When the total size of the files exceeds max_size, the least recently used files are removed. The handlers use the
+        cache from their threads, so all operations hold a lock.
+    """
+
+    def __init__(self, root: str, max_size: int) -> None:
+        self._root = root
+        self._max_size = max_size
+        self._lock = Lock()
+        # hash -> size, from least to most recently used
+        self._files = OrderedDict()  # type: Dict[str, int]
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self._load()
+
+    def _load(self) -> None:
+        """
+            Index the files that are already in the cache, the modification time is the time they were last used
+        """
+        found = []
+        for shard in os.listdir(self._root):
+            shard_dir = os.path.join(self._root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                if HASH_RE.match(name):
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, name, stat.st_size))
+                else:
+                    # an incomplete write
+                    os.remove(path)
+
+        for _, name, size in sorted(found):
+            self._files[name] = size
+            self._size += size
+
+        with self._lock:
+            self._evict()
+
+    def _get_path(self, file_hash: str) -> str:
+        return os.path.join(self._root, file_hash[:SHARD_PREFIX_LENGTH], file_hash)
+
+    def _remove(self, file_hash: str) -> None:
+        self._size -= self._files.pop(file_hash)
+        try:
+            os.remove(self._get_path(file_hash))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        while self._size > self._max_size:
+            file_hash = next(iter(self._files))
+            LOGGER.debug("Removing file %s from the file cache", file_hash)
+            self._remove(file_hash)
+
+    def get(self, file_hash: str) -> Optional[bytes]:
+        """
+            Get the content of a file or None when it is not in the cache
+        """
+        with self._lock:
+            if file_hash not in self._files:
+                self.misses += 1
+                return None
+
+        # read and verify the file without the lock, so other threads are not blocked by it
+        path = self._get_path(file_hash)
+        try:
+            with open(path, "rb") as fd:
+                content = fd.read()
+        except FileNotFoundError:
+            content = None
+
+        valid = content is not None and hash_file(content) == file_hash
+
+        with self._lock:
+            if not valid:
+                self.misses += 1
+                # the file can be evicted or stored again by another thread in the meantime
+                if file_hash in self._files and (content is not None or not os.path.exists(path)):
+                    LOGGER.warning("File %s in the file cache is missing or corrupt, removing it", file_hash)
+                    self._remove(file_hash)
+                return None
+
+            if file_hash in self._files:
+                self._files.move_to_end(file_hash)
+                os.utime(path)
+            self.hits += 1
+            return content
+
+    def put(self, file_hash: str, content: bytes) -> None:
+        """
+            Add a file to the cache. Files that do not match their hash or that are larger than the cache are not stored.
+        """
+        if not HASH_RE.match(file_hash) or len(content) > self._max_size or hash_file(content) != file_hash:
+            return
+
+        with self._lock:
+            if file_hash in self._files:
+                return
+
+            shard_dir = os.path.dirname(self._get_path(file_hash))
+            os.makedirs(shard_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=shard_dir, prefix=".download-", delete=False) as fd:
+                fd.write(content)
+            os.rename(fd.name, self._get_path(file_hash))
+
+            self._files[file_hash] = len(content)
+            self._size += len(content)
+            self._evict()
+
+    def get_statistics(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._files), "size": self._size}
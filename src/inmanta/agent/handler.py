@@ -454,6 +454,16 @@ class ResourceHandler(object):
             :param resource: The resource to query facts for.
         """
 
+    def prefetch(self, resources: typing.List[resources.Resource]) -> None:
+        """
+            Method executed once per deploy run with all resources of the type of this handler that the agent deploys,
+            before any of them is deployed. Override this method to retrieve the current state of all these resources at
+            once, for example with the batched methods of the io such as file_stat_many, and store it in the cache for the
+            version of the resources.
+
+            :param resources: The resources that will be deployed, all of the same type and version.
+        """
+
     def close(self) -> None:
         pass
 
@@ -547,6 +557,41 @@ class ResourceHandler(object):
             ctx.exception("An error occurred during deployment of %(resource_id)s (exception: %(exception)s",
                           resource_id=resource.id, exception=repr(e))
 
+    def can_execute_batch(self) -> bool:
+        """
+            Can this handler deploy many resources with a single call to
+            :func:`~inmanta.agent.handler.ResourceHandler.execute_batch`. When this method returns True, the agent groups
+            the resources of this type that are ready to deploy at the same time.
+        """
+        return False
+
+    def execute_batch(self, items: typing.List[typing.Tuple[HandlerContext, resources.Resource]], dry_run: bool=False) -> None:
+        """
+            Update the given resources. This method is called by the agent with resources of the same type when
+            :func:`~inmanta.agent.handler.ResourceHandler.can_execute_batch` returns True. The status and changes of each
+            resource are reported on its own context. The default implementation calls execute for each resource.
+
+            :param items: A list of (context, resource) tuples
+            :param dry_run: True will only determine the required changes but will not execute them.
+        """
+        for ctx, resource in items:
+            self.execute(ctx, resource, dry_run)
+
+    def _set_error(self, ctx: HandlerContext, resource: resources.Resource, exception: Exception) -> None:
+        """
+            Report an exception raised while deploying a resource on its context
+        """
+        if isinstance(exception, SkipResource):
+            ctx.set_status(const.ResourceState.skipped)
+            ctx.warning(msg="Resource %(resource_id)s was skipped: %(reason)s", resource_id=resource.id,
+                        reason=exception.args)
+        else:
+            ctx.set_status(const.ResourceState.failed)
+            ctx.exception("An error occurred during deployment of %(resource_id)s (exception: %(exception)s)",
+                          resource_id=resource.id, exception=repr(exception),
+                          traceback="".join(traceback.format_exception(type(exception), exception,
+                                                                       exception.__traceback__)))
+
     def facts(self, ctx: HandlerContext, resource: resources.Resource) -> dict:
         """
             Returns facts about this resource. Override this method to implement fact querying.
@@ -607,11 +652,22 @@ class ResourceHandler(object):
     def get_file(self, hash_id) -> bytes:
         """
             Retrieve a file from the fileserver identified with the given id. The convention is to use the sha1sum of the
-            content to identify it.
+            content to identify it. Retrieved files are kept in the file cache of the agent on disk.
 
             :param hash_id: The id of the content/file to retrieve from the server.
             :return: The content in the form of a bytestring or none is the content does not exist.
         """
+        file_cache = self._agent.get_file_cache()
+        content = file_cache.get(hash_id)
+        if content is not None:
+            return content
+
+        result = self.run_sync(lambda: self.get_client().get_file_content(hash_id))
+        if result.code == 200:
+            file_cache.put(hash_id, result.result)
+            return result.result
+
+        # the file does not exist or the server does not serve raw files yet
         def call():
             return self.get_client().get_file(hash_id)
 
@@ -619,7 +675,9 @@ class ResourceHandler(object):
         if result.code == 404:
             return None
         elif result.code == 200:
-            return base64.b64decode(result.result["content"])
+            content = base64.b64decode(result.result["content"])
+            file_cache.put(hash_id, content)
+            return content
         else:
             raise Exception("An error occurred while retrieving file %s" % hash_id)
 
@@ -647,7 +705,10 @@ class ResourceHandler(object):
             return self.get_client().upload_file(id=hash_id, content=base64.b64encode(content).decode("ascii"))
 
         try:
-            self.run_sync(call)
+            result = self.run_sync(lambda: self.get_client().put_file_content(hash_id, content))
+            if result.code in (404, 405):
+                # the server does not accept raw files yet
+                self.run_sync(call)
         except Exception:
             raise Exception("Unable to upload file to the server.")
 
@@ -702,6 +763,46 @@ class CRUDHandler(ResourceHandler):
             :param resource: The desired resource state.
         """
 
+    def read_resources(self, items: typing.List[typing.Tuple[HandlerContext, resources.PurgeableResource]]) -> None:
+        """
+            This method reads the current state of many resources at once, for example with a single call to a remote api.
+            It is used by :func:`~inmanta.agent.handler.CRUDHandler.execute_batch`. The default implementation calls
+            read_resource for each resource.
+
+            :param items: A list of (context, resource) tuples. Each resource is a clone of the desired state with purged set
+                          to false. The implementation should modify its attributes to the current state and set purged to
+                          true when the resource does not exist. Report a resource that should be skipped or that failed
+                          by setting the status of its context.
+        """
+        for ctx, current in items:
+            try:
+                self.read_resource(ctx, current)
+            except ResourcePurged:
+                current.purged = True
+            except Exception as e:
+                self._set_error(ctx, current, e)
+
+    def apply_changes(self, items: typing.List[typing.Tuple[HandlerContext, resources.PurgeableResource, dict]]) -> None:
+        """
+            This method creates, deletes or updates many resources at once. It is used by
+            :func:`~inmanta.agent.handler.CRUDHandler.execute_batch` with the resources that have changes. The default
+            implementation calls create_resource, delete_resource or update_resource for each resource.
+
+            :param items: A list of (context, resource, changes) tuples. Report a resource that failed by setting the status
+                          of its context.
+        """
+        for ctx, resource, changes in items:
+            try:
+                if "purged" in changes:
+                    if not changes["purged"]["desired"]:
+                        self.create_resource(ctx, resource)
+                    else:
+                        self.delete_resource(ctx, resource)
+                else:
+                    self.update_resource(ctx, changes, resource)
+            except Exception as e:
+                self._set_error(ctx, resource, e)
+
     def execute(self, ctx: HandlerContext, resource: resources.PurgeableResource, dry_run: bool=None) -> None:
         """
             Update the given resource. This method is called by the agent. Override the CRUD methods of this class.
@@ -752,6 +853,63 @@ class CRUDHandler(ResourceHandler):
             ctx.exception("An error occurred during deployment of %(resource_id)s (exception: %(exception)s)",
                           resource_id=resource.id, exception=repr(e), traceback=traceback.format_exc())
 
+    def execute_batch(self, items: typing.List[typing.Tuple[HandlerContext, resources.PurgeableResource]],
+                      dry_run: bool=False) -> None:
+        """
+            Update the given resources with a bulk read of their current state followed by a bulk apply of the changes.
+            Override :func:`~inmanta.agent.handler.CRUDHandler.read_resources` and
+            :func:`~inmanta.agent.handler.CRUDHandler.apply_changes` to use the bulk operations of the managed system.
+
+            :param items: A list of (context, resource) tuples
+            :param dry_run: True will only determine the required changes but will not execute them.
+        """
+        def active(items):
+            return [item for item in items if item[0].status is None]
+
+        for ctx, resource in items:
+            try:
+                self.pre(ctx, resource)
+            except Exception as e:
+                self._set_error(ctx, resource, e)
+
+        # see execute for why purged is false
+        current = [(ctx, resource.clone(purged=False)) for ctx, resource in active(items)]
+        try:
+            self.read_resources(current)
+        except Exception as e:
+            for ctx, resource in active(current):
+                self._set_error(ctx, resource, e)
+
+        desired = {ctx: resource for ctx, resource in items}
+        to_apply = []
+        for ctx, current_resource in active(current):
+            resource = desired[ctx]
+            if current_resource.purged:
+                changes = {} if resource.purged else {"purged": dict(desired=resource.purged, current=True)}
+            else:
+                changes = self._diff(current_resource, resource)
+
+            for field, values in changes.items():
+                ctx.add_change(field, desired=values["desired"], current=values["current"])
+
+            if len(changes) > 0:
+                to_apply.append((ctx, resource, changes))
+
+        if not dry_run:
+            try:
+                self.apply_changes(active(to_apply))
+            except Exception as e:
+                for ctx, resource, _ in active(to_apply):
+                    self._set_error(ctx, resource, e)
+
+        for ctx, resource in items:
+            if ctx.status is None:
+                ctx.set_status(const.ResourceState.dry if dry_run else const.ResourceState.deployed)
+                try:
+                    self.post(ctx, resource)
+                except Exception as e:
+                    self._set_error(ctx, resource, e)
+
 
 class Commander(object):
     """
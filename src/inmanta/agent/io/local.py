@@ -23,6 +23,7 @@ import subprocess
 import grp  # @UnresolvedImport
 import shutil
 import sys
+from multiprocessing.pool import ThreadPool
 
 
 try:
@@ -35,6 +36,11 @@ try:
 except ImportError:
     getgrnam = None
 
+# the maximal number of threads a batched operation uses
+MAX_THREADS = 8
+# the maximal number of paths that are passed to a single command
+MAX_PATHS_PER_COMMAND = 500
+
 
 class IOBase(object):
     """
@@ -64,6 +70,41 @@ class IOBase(object):
             Close any resources
         """
 
+    def batch(self, calls):
+        """
+            Execute a list of calls on this IO. A remote IO executes them in a single round trip. The calls are executed in
+            order and the first exception is raised.
+
+            :param list calls: A list of (method name, args, kwargs) tuples
+            :return: The result of each call
+            :rtype: list
+        """
+        return [getattr(self, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+    def _map_paths(self, function, paths):
+        """
+            Call the function for each path in a thread pool
+
+            :return: A dict with the result for each path, None when the function raised an exception
+            :rtype: dict
+        """
+        def call(path):
+            try:
+                return function(path)
+            except Exception:
+                return None
+
+        if len(paths) <= 1:
+            results = [call(path) for path in paths]
+        else:
+            pool = ThreadPool(min(len(paths), MAX_THREADS))
+            try:
+                results = pool.map(call, paths)
+            finally:
+                pool.close()
+
+        return dict(zip(paths, results))
+
     def __del__(self):
         """
             An agent caches IO instances to reuse them for multiple resources. This method is called when an item is removed
@@ -232,6 +273,63 @@ class BashIO(IOBase):
 
         return status
 
+    def _run_many(self, command, paths):
+        """
+            Run a command that accepts many paths with as few invocations as possible and return the records of its output.
+            The command has to terminate each record with a NUL character, so paths that contain a newline are handled. The
+            command fails for paths that do not exist, their records are missing from the output.
+        """
+        cwd = os.curdir
+        if not os.path.exists(cwd):
+            cwd = "/"
+
+        records = []
+        for i in range(0, len(paths), MAX_PATHS_PER_COMMAND):
+            args = command + list(paths[i:i + MAX_PATHS_PER_COMMAND])
+            result = subprocess.Popen(self._run_as_args(*args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+            data = result.communicate()
+            records.extend(x for x in data[0].decode("utf-8").split("\0") if x != "")
+
+        return records
+
+    def file_stat_many(self, paths):
+        """
+            Do a stat call on many files with a single stat command
+
+            :return: A dict with the result of file_stat for each path, None when the path does not exist
+        """
+        paths = list(paths)
+        result = dict.fromkeys(paths)
+        for record in self._run_many(["stat", "--printf", "%a %U %G %n\\0"], paths):
+            parts = record.split(" ", 3)
+            if len(parts) == 4 and parts[3] in result:
+                result[parts[3]] = {"owner": parts[1], "group": parts[2], "permissions": int(parts[0])}
+
+        return result
+
+    def hash_files(self, paths):
+        """
+            Hash many files with a single sha1sum command
+
+            :return: A dict with the sha1sum of each path, None when the path does not exist
+        """
+        paths = list(paths)
+        result = dict.fromkeys(paths)
+        for record in self._run_many(["sha1sum", "-z"], paths):
+            parts = record.split("  ", 1)
+            if len(parts) == 2 and parts[1] in result:
+                result[parts[1]] = parts[0]
+
+        return result
+
+    def read_many(self, paths):
+        """
+            Read many files at the same time
+
+            :return: A dict with the content of each path, None when the path can not be read
+        """
+        return self._map_paths(self.read, list(paths))
+
     def remove(self, path):
         """
             Remove a file
@@ -462,6 +560,36 @@ class LocalIO(IOBase):
 
         return status
 
+    def file_stat_many(self, paths):
+        """
+            Do a stat call on many files
+
+            :param list paths: The files or directories to stat
+            :return: A dict with the result of file_stat for each path, None when the path does not exist
+            :rtype: dict[str, dict[str, str]]
+        """
+        return self._map_paths(self.file_stat, list(paths))
+
+    def hash_files(self, paths):
+        """
+            Return the sha1sum of many files
+
+            :param list paths: The paths of the files to hash
+            :return: A dict with the sha1sum of each path, None when the path does not exist
+            :rtype: dict[str, str]
+        """
+        return self._map_paths(self.hash_file, list(paths))
+
+    def read_many(self, paths):
+        """
+            Read many files as string
+
+            :param list paths: The paths of the files to read
+            :return: A dict with the content of each path, None when the path can not be read
+            :rtype: dict[str, str]
+        """
+        return self._map_paths(self.read, list(paths))
+
     def remove(self, path):
         """
             Remove a file
@@ -573,16 +701,16 @@ if __name__ == '__channelexec__':
     else:
         local_io = BashIO(uri="local:", config={}, run_as="root")
 
+    # the channel stays open to handle the calls of the agent one after the other
     for item in channel:  # NOQA
-        if hasattr(local_io, item[0]):
-            try:
-                method = getattr(local_io, item[0])
-                result = method(*item[1], **item[2])
-                channel.send(result)  # NOQA
-            except Exception as e:
-                import traceback
-                channel.send({"__type__": "RemoteException", "exception_type": str(e.__class__),  # noqa
-                              "exception_string": str(e), "traceback": str(traceback.format_exc())})
-
-        else:
-            raise AttributeError("Method %s is not supported" % item[0])
+        try:
+            if not hasattr(local_io, item[0]):
+                raise AttributeError("Method %s is not supported" % item[0])
+
+            method = getattr(local_io, item[0])
+            result = method(*item[1], **item[2])
+            channel.send(result)  # NOQA
+        except Exception as e:
+            import traceback
+            channel.send({"__type__": "RemoteException", "exception_type": str(e.__class__),  # noqa
+                          "exception_string": str(e), "traceback": str(traceback.format_exc())})
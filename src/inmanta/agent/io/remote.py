@@ -27,6 +27,9 @@ from inmanta import resources
 
 LOGGER = logging.getLogger()
 
+# the default number of channels that are opened to a host
+DEFAULT_CHANNELS = 4
+
 
 class CannotLoginException(Exception):
     pass
@@ -45,6 +48,11 @@ class SshIO(local.IOBase):
          * python: The python interpreter to use. The default value is python
          * retries: The number of retries before giving up. The default number of retries 10
          * retry_wait: The time to wait between retries for the remote target to become available. The default wait is 30s
+         * channels: The maximal number of operations that are executed on the remote target at the same time. The default
+                     is 4
+
+        Each channel runs the local io module on the remote target once and then handles one operation after the other.
+        The channels are kept open until this io is closed.
     """
     def is_remote(self):
         return True
@@ -72,7 +80,15 @@ class SshIO(local.IOBase):
         else:
             self._retry_wait = 30
 
+        if "channels" in config and config["channels"] is not None:
+            channels = int(config["channels"])
+        else:
+            channels = DEFAULT_CHANNELS
+
+        # protects the idle channels, the semaphore limits the number of channels
         self._lock = threading.Lock()
+        self._channels = threading.BoundedSemaphore(channels)
+        self._idle_channels = []
         self._group = multi.Group()
         self._gw = None
         connect = self._build_connect_string()
@@ -119,12 +135,43 @@ class SshIO(local.IOBase):
 
         return "ssh=%s %s@%s//python=%s" % (opts, self._user, self._host, python)
 
-    def _execute(self, function_name, *args, **kwargs):
+    def _get_channel(self):
+        """
+            Get an idle channel or open a new one when less than the maximal number of channels are open
+        """
+        self._channels.acquire()
         with self._lock:
-            ch = self._gw.remote_exec(local)
+            if len(self._idle_channels) > 0:
+                return self._idle_channels.pop()
+
+        try:
+            return self._gw.remote_exec(local)
+        except Exception:
+            self._channels.release()
+            raise
+
+    def _release_channel(self, ch, reuse):
+        if reuse:
+            with self._lock:
+                self._idle_channels.append(ch)
+        else:
+            # the state of the channel is unknown after an error
+            try:
+                ch.close()
+            except Exception:
+                LOGGER.debug("Failed to close channel to %s", self.uri, exc_info=True)
+
+        self._channels.release()
+
+    def _execute(self, function_name, *args, **kwargs):
+        ch = self._get_channel()
+        reuse = False
+        try:
             ch.send((function_name, args, kwargs))
             result = ch.receive()
-            ch.close()
+            reuse = True
+        finally:
+            self._release_channel(ch, reuse)
 
         # check if we got an exception
         if isinstance(result, dict) and "__type__" in result and result["__type__"] == "RemoteException":
@@ -150,7 +197,18 @@ class SshIO(local.IOBase):
 
         return call
 
+    def batch(self, calls):
+        """
+            Execute a list of (method name, args, kwargs) calls in a single round trip to the remote target
+        """
+        return self._execute("batch", calls)
+
     def close(self):
         LOGGER.info("Terminating execnet connection group %s", id(self._group))
+        with self._lock:
+            for ch in self._idle_channels:
+                ch.close()
+            self._idle_channels = []
+
         if self._group is not None:
             self._group.terminate(0.1)
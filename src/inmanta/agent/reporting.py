@@ -118,3 +118,17 @@ def report_resources(agent):
 
 
 reports["resources"] = report_resources
+
+
+def report_cache(agent):
+    return {name: instance._cache.get_statistics() for name, instance in agent._instances.items()}
+
+
+reports["cache"] = report_cache
+
+
+def report_file_cache(agent):
+    return agent._file_cache.get_statistics()
+
+
+reports["file_cache"] = report_file_cache
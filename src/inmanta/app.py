@@ -43,6 +43,7 @@ import colorlog
 from inmanta.command import command, Commander, CLIException
 from inmanta.compiler import do_compile
 from inmanta.config import Config
+from inmanta.execute.scheduler import SchedulerStatistics
 from tornado.ioloop import IOLoop
 from inmanta import protocol, module, moduletool
 from inmanta.export import cfg_env, ModelExporter
@@ -95,6 +96,11 @@ def compiler_config(parser):
     parser.add_argument("--ssl", help="Enable SSL", action="store_true", default=False)
     parser.add_argument("--ssl-ca-cert", dest="ca_cert", help="Certificate authority for SSL")
     parser.add_argument("-f", dest="main_file", help="Main file", default="main.cf")
+    parser.add_argument("--profile", dest="compile_profile", help="Print statistics about each iteration of the compiler "
+                        "scheduler", action="store_true", default=False)
+    parser.add_argument("--daemon", dest="daemon", help="Run as a long lived compiler process that reads the arguments of "
+                        "compile or export commands as json from stdin and keeps the project loaded between them",
+                        action="store_true", default=False)
 
 
 @command("compile", help_msg="Compile the project to a configuration model",
@@ -121,18 +127,31 @@ def compile_project(options):
     if options.ca_cert is not None:
         Config.set("compiler_rest_transport", "ssl-ca-cert-file", options.ca_cert)
 
+    if options.daemon:
+        from inmanta.compiledaemon import CompileDaemon
+        CompileDaemon(module.Project.get_project_dir(os.curdir), options.main_file, app).serve()
+        return
+
     module.Project.get(options.main_file)
 
+    statistics = None
+    if options.profile or options.compile_profile:
+        statistics = SchedulerStatistics()
+
     if options.profile:
         import cProfile
         import pstats
-        result = cProfile.runctx('do_compile()', globals(), {}, "run.profile")
+        result = cProfile.runctx('do_compile(statistics=statistics)', globals(), {"statistics": statistics}, "run.profile")
         p = pstats.Stats('run.profile')
         p.strip_dirs().sort_stats("time").print_stats(20)
     else:
         t1 = time.time()
-        result = do_compile()
+        result = do_compile(statistics=statistics)
         LOGGER.debug("Compile time: %0.03f seconds", time.time() - t1)
+
+    if statistics is not None:
+        print(statistics.format())
+        print(statistics.format_indices())
     return result
 
 
@@ -28,7 +28,7 @@ from inmanta.util import memoize
 from inmanta.execute.runtime import Instance
 from inmanta.execute.util import AnyType
 
-from typing import Any, Dict, Sequence, List, Optional, Union, Tuple, Set  # noqa: F401
+from typing import Any, Dict, Sequence, List, Optional, Union, Tuple, Set, FrozenSet, Hashable  # noqa: F401
 from abc import abstractmethod
 
 try:
@@ -43,6 +43,31 @@ if TYPE_CHECKING:
     from inmanta.ast.attribute import Attribute  # noqa: F401
 
 
+# the attribute names of an index and the value of each attribute
+IndexKey = Tuple[Tuple[str, ...], Tuple[Hashable, ...]]
+
+
+def index_value(value: object) -> Hashable:
+    """
+        Convert a value to a hashable value that can be used in an index key
+    """
+    if isinstance(value, list):
+        return tuple(index_value(v) for v in value)
+
+    if isinstance(value, dict):
+        return tuple(sorted((k, index_value(v)) for k, v in value.items()))
+
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return (value.__class__, repr(value))
+
+
+def format_index_key(key: IndexKey) -> str:
+    return ", ".join("%s=%s" % (attribute, repr(value)) for attribute, value in zip(*key))
+
+
 class EntityLike(Type):
 
     @abstractmethod
@@ -88,10 +113,16 @@ class Entity(EntityLike, NamedType):
         self.__default_value = {}  # type: Dict[str,object]
 
         self._index_def = []  # type: List[List[str]]
-        self._index = {}  # type: Dict[str,Instance]
-        self.index_queue = {}  # type: Dict[str,List[Tuple[ResultVariable, Statement]]]
+        # attribute names of a lookup -> sorted attribute names of the index
+        self._index_attributes = {}  # type: Dict[FrozenSet[str],Tuple[str, ...]]
+        self._index = {}  # type: Dict[IndexKey,Instance]
+        self.index_queue = {}  # type: Dict[IndexKey,List[Tuple[ResultVariable, Statement]]]
+        self._index_lookups = 0
+        self._index_queued = 0
 
         self._instance_list = set()  # type: Set[Instance]
+        # attribute name -> attribute, shared by all instances
+        self._slot_layout = None  # type: Optional[Dict[str, Attribute]]
 
         self.comment = ""
 
@@ -226,6 +257,15 @@ class Entity(EntityLike, NamedType):
 
         return names
 
+    def get_slot_layout(self) -> "Dict[str, Attribute]":
+        """
+            Return all attributes of this entity by name, including parents. The layout is computed when the first instance is
+            created, no attributes are added after that.
+        """
+        if self._slot_layout is None:
+            self._slot_layout = {name: self.get_attribute(name) for name in self.get_all_attribute_names()}
+        return self._slot_layout
+
     def add_attribute(self, attribute: "Attribute") -> None:
         """
             Add an attribute to this entity. The attribute should not exist yet.
@@ -393,11 +433,12 @@ class Entity(EntityLike, NamedType):
             Add an index over the given attributes.
         """
         # duplicate check
-        for index in self._index_def:
-            if len(index) == len(attributes) and all((a == b for a, b in zip(index, attributes))):
-                return
+        index = sorted(attributes)
+        if index in self._index_def:
+            return
 
-        self._index_def.append(sorted(attributes))
+        self._index_def.append(index)
+        self._index_attributes[frozenset(index)] = tuple(index)
         for child in self.child_entities:
             child.add_index(attributes)
 
@@ -409,29 +450,23 @@ class Entity(EntityLike, NamedType):
             Update indexes based on the instance and the attribute that has
             been set
         """
-        attributes = {k: repr(v.get_value()) for (k, v) in instance.slots.items() if v.is_ready()}
+        slots = instance.slots
         # check if an index entry can be added
-        for index_attributes in self.get_indices():
-            index_ok = True
-            key = []
-            for attribute in index_attributes:
-                if attribute not in attributes:
-                    index_ok = False
-                else:
-                    key.append("%s=%s" % (attribute, attributes[attribute]))
+        for index_attributes in self._index_attributes.values():
+            if not all(attribute in slots and slots[attribute].is_ready() for attribute in index_attributes):
+                continue
 
-            if index_ok:
-                keys = ", ".join(key)
+            key = (index_attributes, tuple(index_value(slots[attribute].get_value()) for attribute in index_attributes))
 
-                if keys in self._index and self._index[keys] is not instance:
-                    raise DuplicateException(instance, self._index[keys], "Duplicate key in index. %s" % keys)
+            if key in self._index and self._index[key] is not instance:
+                raise DuplicateException(instance, self._index[key], "Duplicate key in index. %s" % format_index_key(key))
 
-                self._index[keys] = instance
+            self._index[key] = instance
 
-                if keys in self.index_queue:
-                    for x, stmt in self.index_queue[keys]:
-                        x.set_value(instance, stmt.location)
-                    self.index_queue.pop(keys)
+            if key in self.index_queue:
+                for x, stmt in self.index_queue[key]:
+                    x.set_value(instance, stmt.location)
+                self.index_queue.pop(key)
 
     def lookup_index(self,
                      params: "List[str,object]",
@@ -440,18 +475,15 @@ class Entity(EntityLike, NamedType):
         """
             Search an instance in the index.
         """
-        attributes = set([x[0] for x in params])
-
-        found_index = False
-        for index_attributes in self.get_indices():
-            if set(index_attributes) == attributes:
-                found_index = True
+        index_attributes = self._index_attributes.get(frozenset(x[0] for x in params))
 
-        if not found_index:
+        if index_attributes is None:
             raise NotFoundException(
                 stmt, self.get_full_name(), "No index defined on %s for this lookup: " % self.get_full_name() + str(params))
 
-        key = ", ".join(["%s=%s" % (k, repr(v)) for (k, v) in sorted(params, key=lambda x:x[0])])
+        values = dict(params)
+        key = (index_attributes, tuple(index_value(values[attribute]) for attribute in index_attributes))
+        self._index_lookups += 1
 
         if target is None:
             if key in self._index:
@@ -461,12 +493,25 @@ class Entity(EntityLike, NamedType):
         elif key in self._index:
             target.set_value(self._index[key], stmt.location)
         else:
+            self._index_queued += 1
             if key in self.index_queue:
                 self.index_queue[key].append((target, stmt))
             else:
                 self.index_queue[key] = [(target, stmt)]
         return None
 
+    def get_index_statistics(self) -> Dict[str, int]:
+        """
+            Get statistics about the indices of this entity: the number of indices, the number of instances in all indices,
+            the number of lookups, the number of lookups that had to wait for an instance and the number of lookups that are
+            still waiting.
+        """
+        return {"indices": len(self._index_def),
+                "size": len(self._index),
+                "lookups": self._index_lookups,
+                "queued": self._index_queued,
+                "pending": sum(len(waiting) for waiting in self.index_queue.values())}
+
     def get_entity(self) -> "Entity":
         """
             Get the entity (follow through defaults if needed)
@@ -475,9 +520,10 @@ class Entity(EntityLike, NamedType):
 
     def final(self, excns: List[Exception]) -> None:
         for key, indices in self.index_queue.items():
+            key_str = format_index_key(key)
             for _, stmt in indices:
-                excns.append(NotFoundException(stmt, key,
-                                               "No match in index on type %s with key %s" % (self.get_full_name(), key)))
+                excns.append(NotFoundException(stmt, key_str,
+                                               "No match in index on type %s with key %s" % (self.get_full_name(), key_str)))
         for _, attr in self.get_attributes().items():
             attr.final(excns)
 
@@ -0,0 +1,249 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+
+
+    A long lived compiler process. The daemon keeps the project loaded (parsed files, virtual environment and plugins) and
+    forks a child process for every compile request. Each child starts from the pristine, preloaded project, so only the
+    files that changed since the previous request have to be parsed again.
+
+    The protocol is line based json over stdin and stdout:
+     - request: {"args": ["export", "-e", "..."]}
+     - reply: {"returncode": 0, "stdout": "...", "stderr": "..."}
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import traceback
+
+from tornado import gen, locks, process
+from tornado.iostream import StreamClosedError
+
+from inmanta.module import Project, Module
+from inmanta.parser.cache import ParseCache
+from typing import Callable, Dict, List, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CompileDaemon(object):
+    """
+        The worker side of the compile daemon
+
+        :param project_dir: The directory of the project to compile
+        :param main_file: The main file of the project
+        :param entry_point: The entry point of the inmanta command line (:func:`inmanta.app.app`), it is executed in the child
+                            process with sys.argv set to the arguments of the request
+    """
+
+    def __init__(self, project_dir: str, main_file: str, entry_point: Callable[[], None]) -> None:
+        self.project_dir = os.path.abspath(project_dir)
+        self.main_file = main_file
+        self.entry_point = entry_point
+        self._parse_cache = ParseCache(os.path.join(self.project_dir, ".env", ".cache", "parser"), keep_in_memory=True)
+        self._project = None
+        self._sources = None
+
+    def _get_sources(self, project: Project) -> Dict[str, Tuple[int, int]]:
+        """
+            Get the modification time and size of all files that influence the loaded project
+        """
+        paths = [os.path.join(self.project_dir, Project.PROJECT_FILE), os.path.join(self.project_dir, self.main_file)]
+        for module in project.modules.values():
+            paths.append(module.get_config_file_name())
+            for subdir in [Module.MODEL_DIR, "plugins"]:
+                for dirpath, _, filenames in os.walk(os.path.join(module._path, subdir)):
+                    paths.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(".cf") or f.endswith(".py"))
+
+        sources = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                sources[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                sources[path] = None
+        return sources
+
+    def preload(self) -> None:
+        """
+            Load the project when it is not loaded yet or when one of its sources changed
+        """
+        if self._project is not None and self._get_sources(self._project) == self._sources:
+            LOGGER.debug("Project sources are unchanged, reusing the loaded project")
+            return
+
+        LOGGER.info("Loading project in %s", self.project_dir)
+        self._project = None
+        self._sources = None
+        try:
+            project = Project(self.project_dir, main_file=self.main_file, parse_cache=self._parse_cache)
+            Project.set(project)
+            project.load()
+            self._project = project
+            self._sources = self._get_sources(project)
+            LOGGER.info("Project loaded (parse cache hits: %d, misses: %d)", self._parse_cache.hits,
+                        self._parse_cache.misses)
+        except Exception:
+            # the child process will load the project itself and report the error
+            LOGGER.exception("Unable to preload the project")
+            Project._project = None
+
+    def _run_child(self, args: List[str], out_fd: int, err_fd: int) -> None:
+        """
+            Run the command in the forked child. This method never returns.
+        """
+        returncode = 1
+        try:
+            os.dup2(out_fd, 1)
+            os.dup2(err_fd, 2)
+            sys.argv = ["inmanta"] + args
+
+            try:
+                self.entry_point()
+                returncode = 0
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode)
+
+    def execute(self, args: List[str]) -> Dict[str, object]:
+        """
+            Execute a single request in a forked child process
+        """
+        self.preload()
+
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                self._run_child(args, out.fileno(), err.fileno())
+
+            _, status = os.waitpid(pid, 0)
+            if os.WIFEXITED(status):
+                returncode = os.WEXITSTATUS(status)
+            else:
+                returncode = -os.WTERMSIG(status)
+
+            out.seek(0)
+            err.seek(0)
+            return {"returncode": returncode,
+                    "stdout": out.read().decode(errors="replace"),
+                    "stderr": err.read().decode(errors="replace")}
+
+    def serve(self) -> None:
+        """
+            Serve requests from stdin until it is closed
+        """
+        os.chdir(self.project_dir)
+
+        # only replies are written to the original stdout, everything else that is printed ends up on stderr
+        reply_stream = os.fdopen(os.dup(1), "w")
+        os.dup2(2, 1)
+
+        self.preload()
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+                reply = self.execute([str(x) for x in request["args"]])
+            except Exception:
+                LOGGER.exception("Unable to handle request %s", line)
+                reply = {"returncode": 1, "stdout": "", "stderr": traceback.format_exc()}
+
+            reply_stream.write(json.dumps(reply) + "\n")
+            reply_stream.flush()
+
+
+class CompileDaemonClient(object):
+    """
+        Runs a compile daemon as a subprocess and sends it requests
+
+        :param cmd: The command to start the daemon
+        :param cwd: The project directory
+        :param log_file: The file to append the log output of the daemon to
+    """
+
+    def __init__(self, cmd: List[str], cwd: str, log_file: str=None, **kwargs) -> None:
+        self._cmd = cmd
+        self._cwd = cwd
+        self._log_file = log_file
+        self._kwargs = kwargs
+        self._process = None
+        self._lock = locks.Lock()
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.proc.poll() is None
+
+    def _start(self) -> None:
+        LOGGER.info("Starting compile daemon in %s", self._cwd)
+        log = None
+        try:
+            if self._log_file is not None:
+                log = open(self._log_file, "a")
+            self._process = process.Subprocess(self._cmd, stdin=process.Subprocess.STREAM, stdout=process.Subprocess.STREAM,
+                                               stderr=log, cwd=self._cwd, **self._kwargs)
+        finally:
+            if log is not None:
+                log.close()
+
+    @gen.coroutine
+    def run(self, args: List[str]) -> Tuple[int, str, str]:
+        """
+            Execute the given inmanta command line in the daemon
+
+            :return: A tuple with the return code, the stdout and the stderr of the command
+        """
+        with (yield self._lock.acquire()):
+            if not self.is_running():
+                self._start()
+
+            try:
+                yield self._process.stdin.write((json.dumps({"args": args}) + "\n").encode())
+                line = yield self._process.stdout.read_until(b"\n")
+            except StreamClosedError:
+                self.stop()
+                raise Exception("The compile daemon in %s stopped unexpectedly" % self._cwd)
+
+            reply = json.loads(line.decode())
+            return reply["returncode"], reply["stdout"], reply["stderr"]
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+
+        if self._process.proc.poll() is None:
+            self._process.stdin.close()
+            try:
+                self._process.proc.terminate()
+                self._process.proc.wait()
+            except OSError:
+                pass
+
+        self._process.stdout.close()
+        self._process = None
@@ -31,9 +31,12 @@ from inmanta.plugins import PluginMeta
 LOGGER = logging.getLogger(__name__)
 
 
-def do_compile(refs={}):
+def do_compile(refs={}, statistics=None):
     """
         Run run run
+
+        :param statistics: An optional :class:`~inmanta.execute.scheduler.SchedulerStatistics` object that collects
+                           statistics about the scheduler iterations
     """
     project = Project.get()
     compiler = Compiler(os.path.join(project.project_path, project.main_file), refs=refs)
@@ -41,7 +44,7 @@ def do_compile(refs={}):
     LOGGER.debug("Starting compile")
 
     (statements, blocks) = compiler.compile()
-    sched = scheduler.Scheduler()
+    sched = scheduler.Scheduler(statistics)
     success = sched.run(compiler, statements, blocks)
 
     LOGGER.debug("Compile done")
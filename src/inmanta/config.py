@@ -146,6 +146,11 @@ def is_int(value):
     return int(value)
 
 
+def is_float(value):
+    """float"""
+    return float(value)
+
+
 def is_time(value):
     """time"""
     return int(value)
@@ -289,6 +294,17 @@ nodename = Option("config", "node-name", get_default_nodename,
                   "Force the hostname of this machine to a specific value", is_str)
 
 
+def get_default_wheel_cache_dir():
+    """ ~/.cache/inmanta/wheels """
+    return os.path.join(os.path.expanduser("~"), ".cache", "inmanta", "wheels")
+
+
+wheel_cache_dir = Option("config", "wheel-cache-dir", get_default_wheel_cache_dir,
+                         "The directory where the python packages that are installed in the virtual environments of the "
+                         "compiler and the agents are kept as wheels. It is shared by all virtual environments on a host. "
+                         "Set it to an empty value to always install from the package index.", is_str)
+
+
 ###############################
 # Transport Config
 ###############################
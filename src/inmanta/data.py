@@ -16,6 +16,7 @@
     Contact: code@inmanta.com
 """
 
+import base64
 from configparser import RawConfigParser
 import copy
 import datetime
@@ -23,6 +24,7 @@ import enum
 import logging
 import uuid
 
+from bson import json_util
 from motor import motor_tornado
 import pymongo
 from tornado import gen
@@ -35,16 +37,43 @@ LOGGER = logging.getLogger(__name__)
 
 DBLIMIT = 100000
 
+
+def encode_page_key(values):
+    """
+        Encode the values of the sort keys of the last document of a page in an opaque key that a client passes back to
+        get the next page
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_page_key(key):
+    """
+        Decode a key created by encode_page_key
+
+        :raises ValueError: The key is not valid
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(key.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page key %s" % key)
+
+    if not isinstance(values, list):
+        raise ValueError("Invalid page key %s" % key)
+
+    return values
+
+
 # TODO: disconnect
 # TODO: difference between None and not set
 
 
 class Field(object):
 
-    def __init__(self, field_type, required=False, unique=False, **kwargs):
+    def __init__(self, field_type, required=False, unique=False, deprecated=False, **kwargs):
 
         self._field_type = field_type
         self._required = required
+        self._deprecated = deprecated
 
         if "default" in kwargs:
             self._default = True
@@ -80,6 +109,11 @@ class Field(object):
 
     unique = property(is_unique)
 
+    def is_deprecated(self):
+        return self._deprecated
+
+    deprecated = property(is_deprecated)
+
 
 ESCAPE_CHARS = {".": "\uff0E", "\\": "\\\\", "$": "\u0024"}
 ESCAPE_CHARS_R = {v: k for k, v in ESCAPE_CHARS.items()}
@@ -316,6 +350,9 @@ class BaseDocument(object, metaclass=DocumentMeta):
         """
         result = {}
         for name, typing in self._fields.items():
+            if typing.deprecated and not mongo_pk:
+                continue
+
             value = None
             if name in self.__fields:
                 value = self.__fields[name]
@@ -357,12 +394,15 @@ class BaseDocument(object, metaclass=DocumentMeta):
 
     @classmethod
     @gen.coroutine
-    def insert_many(cls, documents):
+    def insert_many(cls, documents, ordered=True):
         """
             Insert multiple objects at once
+
+            :param ordered: Insert the documents in order and stop at the first error. When false, mongodb can insert the
+                            documents in parallel and attempts all of them.
         """
         if len(documents) > 0:
-            yield cls._coll.insert_many((d.to_mongo() for d in documents))
+            yield cls._coll.insert_many((d.to_mongo() for d in documents), ordered=ordered)
 
     @gen.coroutine
     def update(self, **kwargs):
@@ -388,6 +428,26 @@ class BaseDocument(object, metaclass=DocumentMeta):
 
         yield self._coll.update_one({"_id": self.id}, {"$set": items})
 
+    @classmethod
+    @gen.coroutine
+    def update_fields_many(cls, updates):
+        """
+            Update the fields of multiple documents with a single bulk write. The updates are applied in order, so when
+            a document is updated more than once the last update wins.
+
+            :param updates: A list of (document, fields) tuples. fields is a dict with the new value of each field.
+        """
+        operations = []
+        for document, fields in updates:
+            items = {}
+            for name, value in fields.items():
+                setattr(document, name, value)
+                items[name] = cls._value_to_dict(value)
+            operations.append(pymongo.UpdateOne({"_id": document.id}, {"$set": items}))
+
+        if len(operations) > 0:
+            yield cls._coll.bulk_write(operations)
+
     @classmethod
     @gen.coroutine
     def get_by_id(cls, doc_id: uuid.UUID):
@@ -445,6 +505,78 @@ class BaseDocument(object, metaclass=DocumentMeta):
 
         return objects
 
+    @classmethod
+    def _get_mongo_name(cls, name):
+        if name not in cls._fields:
+            raise ValueError("%s field is not defined for this document %s" % (name, cls.collection_name()))
+
+        if name == "id":
+            return "_id"
+        return name
+
+    @classmethod
+    @gen.coroutine
+    def get_page(cls, query, sort=None, start=0, limit=DBLIMIT, after=None, fields=None):
+        """
+            Get a single page of the documents that match the query. Sorting, skipping, limiting and the projection are done
+            by mongodb, so only the requested fields of the documents in the page are transferred.
+
+            :param query: The mongodb filter
+            :param sort: A list of (field, direction) tuples. The id is added as the last sort key, so documents with the
+                         same values for the sort keys are always returned in the same order.
+            :param start: The number of documents to skip
+            :param limit: The maximal number of documents in the page
+            :param after: The next key that was returned with the previous page. Unlike start, mongodb does not have to
+                          walk over all documents of the previous pages to continue after this key.
+            :param fields: Only return these fields. The documents are returned as dicts because they are incomplete.
+            :return: A tuple with the documents and the key of the next page. The key is None for the last page.
+            :raises ValueError: A field, the limit or the key is not valid
+        """
+        if limit <= 0:
+            raise ValueError("The limit should be larger than 0")
+
+        sort_keys = [(cls._get_mongo_name(name), direction) for name, direction in (sort or [])]
+        if "_id" not in [name for name, _ in sort_keys]:
+            sort_keys.append(("_id", pymongo.ASCENDING))
+
+        if after is not None:
+            values = decode_page_key(after)
+            if len(values) != len(sort_keys):
+                raise ValueError("The page key %s does not belong to this query" % after)
+
+            # documents that sort after the key on the first key that differs
+            clauses = []
+            for i, (name, direction) in enumerate(sort_keys):
+                clause = {prev_name: value for (prev_name, _), value in zip(sort_keys[:i], values)}
+                clause[name] = {"$gt" if direction == pymongo.ASCENDING else "$lt": values[i]}
+                clauses.append(clause)
+            query = {"$and": [query, {"$or": clauses}]}
+
+        projection = None
+        if fields is not None:
+            projection = {cls._get_mongo_name(name): True for name in fields}
+            projection.update({name: True for name, _ in sort_keys})
+
+        # fetch one document more to know whether there is a next page
+        cursor = cls._coll.find(query, projection).sort(sort_keys).skip(start).limit(limit + 1)
+        documents = []
+        last = None
+        next_key = None
+        while (yield cursor.fetch_next):
+            document = cursor.next_object()
+            if len(documents) == limit:
+                next_key = encode_page_key([last.get(name) for name, _ in sort_keys])
+                break
+
+            last = document
+            if fields is None:
+                documents.append(cls(from_mongo=True, **document))
+            else:
+                documents.append({name: cls._dict_to_value(document[cls._get_mongo_name(name)])
+                                  for name in fields if cls._get_mongo_name(name) in document})
+
+        return documents, next_key
+
 
 class Project(BaseDocument):
     """
@@ -503,6 +635,7 @@ AUTOSTART_AGENT_MAP = "autostart_agent_map"
 AUTOSTART_AGENT_INTERVAL = "autostart_agent_interval"
 AGENT_AUTH = "agent_auth"
 SERVER_COMPILE = "server_compile"
+INCREMENTAL_DEPLOY = "incremental_deploy"
 
 
 class Setting(object):
@@ -573,6 +706,10 @@ class Environment(BaseDocument):
                                           doc="Agent interval for autostarted agents in seconds", agent_restart=True),
         SERVER_COMPILE: Setting(name=SERVER_COMPILE, default=True, typ="bool",
                                 validator=convert_boolean, doc="Allow the server to compile the configuration model."),
+        INCREMENTAL_DEPLOY: Setting(name=INCREMENTAL_DEPLOY, default=False, typ="bool", validator=convert_boolean,
+                                    doc="When a new version is pushed to an agent, it does not call the handler of resources "
+                                        "with the same desired state as their last successful deploy. The periodic deploy "
+                                        "of the agent (agent interval) still checks all resources."),
     }
 
     __indexes__ = [
@@ -1051,6 +1188,45 @@ class ResourceAction(BaseDocument):
 
         return log
 
+    @classmethod
+    @gen.coroutine
+    def get_logs_for_version(cls, environment, resource_version_ids, action=None, limit=0):
+        """
+            Get the log of multiple resources with a single query. This is the same as calling get_log for each resource.
+
+            :return: A dict with the list of actions, most recent first, for each resource version id
+        """
+        query = {"environment": environment, "resource_version_ids": {"$in": list(resource_version_ids)}}
+        if action is not None:
+            query["action"] = action
+
+        logs = {rvid: [] for rvid in resource_version_ids}
+        if limit is None or limit <= 0:
+            cursor = cls._coll.find(query).sort("started", direction=pymongo.DESCENDING)
+            while (yield cursor.fetch_next):
+                obj = cls(from_mongo=True, **cursor.next_object())
+                for rvid in obj.resource_version_ids:
+                    if rvid in logs:
+                        logs[rvid].append(obj)
+
+            return logs
+
+        # group the most recent actions per resource in the database, so only limit actions per resource are returned
+        cursor = cls._coll.aggregate([
+            {"$match": query},
+            {"$sort": {"started": pymongo.DESCENDING}},
+            {"$project": {"rvid": "$resource_version_ids", "action": "$$ROOT"}},
+            {"$unwind": "$rvid"},
+            {"$match": {"rvid": {"$in": list(resource_version_ids)}}},
+            {"$group": {"_id": "$rvid", "actions": {"$push": "$action"}}},
+            {"$project": {"actions": {"$slice": ["$actions", limit]}}},
+        ], allowDiskUse=True)
+        while (yield cursor.fetch_next):
+            result = cursor.next_object()
+            logs[result["_id"]] = [cls(from_mongo=True, **action) for action in result["actions"]]
+
+        return logs
+
     @classmethod
     @gen.coroutine
     def get(cls, environment, action_id):
@@ -1099,6 +1275,7 @@ class Resource(BaseDocument):
         :param resource The resource for which this defines the state
         :param model The configuration model (versioned) this resource state is associated with
         :param attributes The state of this version of the resource
+        :param attribute_hash A hash of the attributes that is equal for all versions with the same desired state
     """
     environment = Field(field_type=uuid.UUID, required=True)
     model = Field(field_type=int, required=True)
@@ -1117,6 +1294,7 @@ class Resource(BaseDocument):
 
     # State related
     attributes = Field(field_type=dict)
+    attribute_hash = Field(field_type=str)
     status = Field(field_type=const.ResourceState, default=const.ResourceState.available)
 
     # internal field to handle cross agent dependencies
@@ -1126,7 +1304,8 @@ class Resource(BaseDocument):
 
     __indexes__ = [
         dict(keys=[("environment", pymongo.ASCENDING), ("model", pymongo.ASCENDING), ("agent", pymongo.ASCENDING)]),
-        dict(keys=[("environment", pymongo.ASCENDING), ("resource_id", pymongo.ASCENDING)]),
+        dict(keys=[("environment", pymongo.ASCENDING), ("resource_id", pymongo.ASCENDING), ("model", pymongo.ASCENDING)]),
+        dict(keys=[("environment", pymongo.ASCENDING), ("resource_id", pymongo.ASCENDING), ("status", pymongo.ASCENDING)]),
         dict(keys=[("environment", pymongo.ASCENDING), ("resource_version_id", pymongo.ASCENDING)], unique=True),
     ]
 
@@ -1194,27 +1373,37 @@ class Resource(BaseDocument):
                 "holds_state": self.holds_state,
                 }
         """
-        resources = yield cls._coll.find({"environment": environment}, ["resource_id"]).distinct("resource_id")
-        result = []
-        for res in resources:
-            latest = (yield cls._coll.find({"environment": environment,
-                                            "resource_id": res}).sort("version", pymongo.DESCENDING).limit(1).to_list(1))[0]
-            if latest["status"] != const.ResourceState.available.name:
-                cursor = cls._coll.find({"environment": environment, "resource_id": res,
-                                         "status": {"$ne": const.ResourceState.available.name}})
-                deployed = (yield cursor.sort("version", pymongo.DESCENDING).limit(1).to_list(1))[0]
+        # the latest version of a resource is the first one in each group. The deployed version is the latest version that
+        # has been deployed. Documents compare field by field, so the maximum of {model, last_deploy} is the latest deploy.
+        deployed = {"$cond": [{"$and": [{"$ne": ["$status", const.ResourceState.available.name]},
+                                        {"$ne": [{"$type": "$last_deploy"}, "missing"]}]},
+                              {"model": "$model", "last_deploy": "$last_deploy"},
+                              None]}
+        cursor = cls._coll.aggregate([
+            {"$match": {"environment": environment}},
+            {"$sort": {"resource_id": pymongo.ASCENDING, "model": pymongo.DESCENDING}},
+            {"$group": {"_id": "$resource_id",
+                        "resource_type": {"$first": "$resource_type"},
+                        "agent": {"$first": "$agent"},
+                        "id_attribute_name": {"$first": "$id_attribute_name"},
+                        "id_attribute_value": {"$first": "$id_attribute_value"},
+                        "latest_version": {"$first": "$model"},
+                        "deployed": {"$max": deployed}}},
+            {"$sort": {"_id": pymongo.ASCENDING}},
+        ], allowDiskUse=True)
 
-            else:
-                deployed = latest
-
-            result.append({"resource_id": res,
-                           "resource_type": latest["resource_type"],
-                           "agent": latest["agent"],
-                           "id_attribute_name": latest["id_attribute_name"],
-                           "id_attribute_value": latest["id_attribute_value"],
-                           "latest_version": latest["model"],
-                           "deployed_version": deployed["model"] if "last_deploy" in deployed else None,
-                           "last_deploy": deployed["last_deploy"] if "last_deploy" in deployed else None})
+        result = []
+        while (yield cursor.fetch_next):
+            res = cursor.next_object()
+            deployed = res["deployed"]
+            result.append({"resource_id": res["_id"],
+                           "resource_type": res["resource_type"],
+                           "agent": res["agent"],
+                           "id_attribute_name": res["id_attribute_name"],
+                           "id_attribute_value": res["id_attribute_value"],
+                           "latest_version": res["latest_version"],
+                           "deployed_version": deployed["model"] if deployed is not None else None,
+                           "last_deploy": deployed["last_deploy"] if deployed is not None else None})
 
         return result
 
@@ -1329,21 +1518,23 @@ class Resource(BaseDocument):
         # 1- resources from versions that have not been deployed
         # 2- resources that are already recorded as purged (purged and deployed)
         should_purge = []
-        for deleted_resource in deleted:
-            # get the full resource history, and determine the purge status of this resource
-            cursor = cls._coll.find({"environment": environment, "model": {"$lt": current_version},
-                                     "resource_id": deleted_resource}).sort("model", pymongo.DESCENDING)
-
-            while (yield cursor.fetch_next):
-                obj = cursor.next_object()
+        if len(deleted) == 0:
+            return should_purge
+
+        # if a resource is part of a released version and it is deployed (this last condition is actually enough at the
+        # moment), we have found the last status of the resource. If it was not purged in that version, add it to the should
+        # purge list. The latest such version of all deleted resources is selected in a single aggregation.
+        cursor = cls._coll.aggregate([
+            {"$match": {"environment": environment, "model": {"$lt": current_version, "$in": list(versions)},
+                        "resource_id": {"$in": list(deleted)}, "status": const.ResourceState.deployed.name}},
+            {"$sort": {"model": pymongo.DESCENDING}},
+            {"$group": {"_id": "$resource_id", "resource": {"$first": "$$ROOT"}}},
+        ], allowDiskUse=True)
 
-                # if a resource is part of a released version and it is deployed (this last condition is actually enough
-                # at the moment), we have found the last status of the resource. If it was not purged in that version,
-                # add it to the should purge list.
-                if obj["model"] in versions and obj["status"] == const.ResourceState.deployed.name:
-                    if not obj["attributes"]["purged"]:
-                        should_purge.append(cls(from_mongo=True, **obj))
-                    break
+        while (yield cursor.fetch_next):
+            obj = cursor.next_object()["resource"]
+            if not obj["attributes"]["purged"]:
+                should_purge.append(cls(from_mongo=True, **obj))
 
         return should_purge
 
@@ -1369,9 +1560,9 @@ class ConfigurationModel(BaseDocument):
         :param released: Is this model released and available for deployment?
         :param deployed: Is this model deployed?
         :param result: The result of the deployment. Success or error.
-        :param status: The deployment status of all included resources
         :param version_info: Version metadata
         :param total: The total number of resources
+        :param done: The number of resources that have a deployment status, see ConfigurationModelStatus
     """
     version = Field(field_type=int, required=True)
     environment = Field(field_type=uuid.UUID, required=True)
@@ -1380,34 +1571,22 @@ class ConfigurationModel(BaseDocument):
     released = Field(field_type=bool, default=False)
     deployed = Field(field_type=bool, default=False)
     result = Field(field_type=const.VersionState, default=const.VersionState.pending)
-    status = Field(field_type=dict, default={})
     version_info = Field(field_type=dict)
 
     total = Field(field_type=int, default=0)
+    done = Field(field_type=int, default=0)
 
     # cached state for release
     undeployable = Field(field_type=list, required=False)
     skipped_for_undeployable = Field(field_type=list, required=False)
 
+    # the status of the resources, moved to ConfigurationModelStatus by migrate_embedded_results
+    status = Field(field_type=dict, deprecated=True)
+
     __indexes__ = [
         dict(keys=[("environment", pymongo.ASCENDING), ("version", pymongo.ASCENDING)], unique=True)
     ]
 
-    @property
-    def done(self):
-        return len(self.status)
-
-    @classmethod
-    def mongo_to_dict(cls, **kwargs):
-        dct = super(DryRun, cls).mongo_to_dict(**kwargs)
-        dct["done"] = len(dct["status"])
-        return dct
-
-    def to_dict(self):
-        dct = BaseDocument.to_dict(self)
-        dct["done"] = self.done
-        return dct
-
     @classmethod
     @gen.coroutine
     def get_version(cls, environment, version):
@@ -1466,10 +1645,60 @@ class ConfigurationModel(BaseDocument):
         """
             Mark a resource as deployed in the configuration model status
         """
-        entry_uuid = uuid.uuid5(resource_uuid, resource_id)
-        resource_key = "status.%s" % entry_uuid
-        yield cls._coll.update_one({"environment": environment, "version": version},
-                                   {"$set": {resource_key: {"status": cls._value_to_dict(status), "id": resource_id}}})
+        yield cls.set_ready_many(environment, version, [(resource_uuid, resource_id, status)])
+
+    @classmethod
+    @gen.coroutine
+    def set_ready_many(cls, environment, version, entries):
+        """
+            Mark multiple resources as deployed in the configuration model status. The status of each resource is stored in
+            its own document, the done counter of the version is incremented with the number of resources that did not have
+            a status yet.
+
+            :param entries: A list of (resource_uuid, resource_id, status) tuples
+        """
+        operations = []
+        for resource_uuid, resource_id, status in entries:
+            operations.append(pymongo.UpdateOne({"_id": uuid.uuid5(resource_uuid, resource_id)},
+                                                {"$set": {"status": cls._value_to_dict(status)},
+                                                 "$setOnInsert": {"environment": environment, "model": version,
+                                                                  "resource_version_id": resource_id}},
+                                                upsert=True))
+
+        if len(operations) == 0:
+            return
+
+        result = yield ConfigurationModelStatus._coll.bulk_write(operations, ordered=False)
+        if result.upserted_count > 0:
+            yield cls._coll.update_one({"environment": environment, "version": version},
+                                       {"$inc": {"done": result.upserted_count}})
+
+    @gen.coroutine
+    def get_deploy_result(self):
+        """
+            The result of the deployment of this version, based on the status of its resources
+        """
+        failed = yield ConfigurationModelStatus._coll.find_one({"environment": self.environment, "model": self.version,
+                                                                "status": {"$ne": const.ResourceState.deployed.name}},
+                                                               projection={"_id": True})
+        if failed is None:
+            return const.VersionState.success
+
+        return const.VersionState.failed
+
+    @gen.coroutine
+    def get_resource_status(self, start=0, limit=DBLIMIT):
+        """
+            Get the deployment status of the resources in this version, ordered by resource version id
+        """
+        cursor = ConfigurationModelStatus._coll.find({"environment": self.environment, "model": self.version})
+        cursor = cursor.sort("resource_version_id", pymongo.ASCENDING).skip(start).limit(limit)
+
+        result = []
+        while (yield cursor.fetch_next):
+            result.append(ConfigurationModelStatus(from_mongo=True, **cursor.next_object()))
+
+        return result
 
     @gen.coroutine
     def delete_cascade(self):
@@ -1481,7 +1710,10 @@ class ConfigurationModel(BaseDocument):
             yield snap.delete_cascade()
         yield UnknownParameter.delete_all(environment=self.environment, model=self.version)
         yield Code.delete_all(environment=self.environment, model=self.version)
-        yield DryRun.delete_all(environment=self.environment, model=self.version)
+        dryruns = yield DryRun.get_list(environment=self.environment, model=self.version)
+        for dryrun in dryruns:
+            yield dryrun.delete_cascade()
+        yield ConfigurationModelStatus.delete_all(environment=self.environment, model=self.version)
         yield self.delete()
 
     @gen.coroutine
@@ -1526,6 +1758,30 @@ class ConfigurationModel(BaseDocument):
         return self.skipped_for_undeployable
 
 
+class ConfigurationModelStatus(BaseDocument):
+    """
+        The deployment status of a resource in a configuration model
+
+        :param environment: The environment of the configuration model
+        :param model: The version of the configuration model
+        :param resource_version_id: The resource this status is about
+        :param status: The status of the last deployment of this resource
+    """
+    environment = Field(field_type=uuid.UUID, required=True)
+    model = Field(field_type=int, required=True)
+    resource_version_id = Field(field_type=str, required=True)
+    status = Field(field_type=const.ResourceState, required=True)
+
+    __indexes__ = [
+        dict(keys=[("environment", pymongo.ASCENDING), ("model", pymongo.ASCENDING),
+                   ("resource_version_id", pymongo.ASCENDING)]),
+        dict(keys=[("environment", pymongo.ASCENDING), ("model", pymongo.ASCENDING), ("status", pymongo.ASCENDING)]),
+    ]
+
+    def to_dict(self):
+        return {"id": self.resource_version_id, "status": self.status}
+
+
 class Code(BaseDocument):
     """
         A code deployment
@@ -1574,14 +1830,19 @@ class DryRun(BaseDocument):
         :param date The date the run was requested
         :param resource_total The number of resources that do a dryrun for
         :param resource_todo The number of resources left to do
-        :param resources Changes for each of the resources in the version
+        :param failed The number of resources for which the handler failed
+        :param last_update The date of the last result that was stored
     """
     environment = Field(field_type=uuid.UUID, required=True)
     model = Field(field_type=int, required=True)
     date = Field(field_type=datetime.datetime)
     total = Field(field_type=int, default=0)
     todo = Field(field_type=int, default=0)
-    resources = Field(field_type=dict, default={})
+    failed = Field(field_type=int, default=0)
+    last_update = Field(field_type=datetime.datetime)
+
+    # the results of the resources, moved to DryRunResult by migrate_embedded_results
+    resources = Field(field_type=dict, deprecated=True)
 
     __indexes__ = [
         dict(keys=[("environment", pymongo.ASCENDING), ("model", pymongo.DESCENDING)])
@@ -1594,33 +1855,92 @@ class DryRun(BaseDocument):
             Register a resource update with a specific query that sets the dryrun_data and decrements the todo counter, only
             if the resource has not been saved yet.
         """
-        entry_uuid = uuid.uuid5(dryrun_id, resource_id)
-        resource_key = "resources.%s" % entry_uuid
+        yield cls.update_resources(dryrun_id, {resource_id: dryrun_data})
+
+    @classmethod
+    @gen.coroutine
+    def update_resources(cls, dryrun_id, dryrun_data):
+        """
+            Register the results of many resources. Each result is stored in its own document, only if the resource has not
+            been saved yet. The counters of the dryrun are updated with the number of new results.
 
-        query = {"_id": dryrun_id, resource_key: {"$exists": False}}
-        update = {"$inc": {"todo": int(-1)}, "$set": {resource_key: cls._value_to_dict(dryrun_data)}}
+            :param dryrun_data: A dict with the dryrun data for each resource id
+        """
+        operations = []
+        failed = []
+        for resource_id, data in dryrun_data.items():
+            result = {"dryrun": dryrun_id, "resource_version_id": resource_id,
+                      "changes": cls._value_to_dict(data["changes"]), "id_fields": cls._value_to_dict(data["id_fields"])}
+            operations.append(pymongo.UpdateOne({"_id": uuid.uuid5(dryrun_id, resource_id)}, {"$setOnInsert": result},
+                                                upsert=True))
+            failed.append("handler" in data["changes"] and data["changes"]["handler"].get("current") == "FAILED")
+
+        if len(operations) == 0:
+            return
+
+        result = yield DryRunResult._coll.bulk_write(operations, ordered=False)
+        if result.upserted_count > 0:
+            counters = {"todo": -result.upserted_count, "failed": sum(1 for i in result.upserted_ids if failed[i])}
+            yield cls._coll.update_one({"_id": dryrun_id},
+                                       {"$inc": counters, "$set": {"last_update": datetime.datetime.now()}})
+
+    @gen.coroutine
+    def get_resources(self, start=0, limit=DBLIMIT):
+        """
+            Get the changes of the resources in this dryrun, ordered by resource version id
+
+            :return: A dict with the dryrun data for each resource id
+        """
+        cursor = DryRunResult._coll.find({"dryrun": self.id}).sort("resource_version_id", pymongo.ASCENDING)
+        cursor = cursor.skip(start).limit(limit)
 
-        yield cls._coll.update_one(query, update)
+        resources = {}
+        while (yield cursor.fetch_next):
+            result = DryRunResult(from_mongo=True, **cursor.next_object())
+            resources[result.resource_version_id] = result.to_dict()
+
+        return resources
+
+    @gen.coroutine
+    def delete_cascade(self):
+        yield DryRunResult.delete_all(dryrun=self.id)
+        yield self.delete()
+
+    def get_progress(self):
+        """
+            The progress of this dryrun as reported by the dryrun list
+        """
+        return {"id": self.id, "version": self.model, "date": self.date, "total": self.total, "todo": self.todo,
+                "done": self.total - self.todo, "failed": self.failed, "last_update": self.last_update}
 
     @classmethod
     @gen.coroutine
     def create(cls, environment, model, total, todo):
-        obj = cls(environment=environment, model=model, date=datetime.datetime.now(), resources={}, total=total, todo=todo)
+        obj = cls(environment=environment, model=model, date=datetime.datetime.now(), total=total, todo=todo)
         obj.insert()
         return obj
 
-    @classmethod
-    def mongo_to_dict(cls, **kwargs):
-        dct = super(DryRun, cls).mongo_to_dict(**kwargs)
-        resources = {r["id"]: r for r in dct["resources"].values()}
-        dct["resources"] = resources
-        return dct
+
+class DryRunResult(BaseDocument):
+    """
+        The result of the dryrun of a single resource
+
+        :param dryrun The dryrun this result belongs to
+        :param resource_version_id The resource this result is about
+        :param changes The required changes
+        :param id_fields The fields of the id of the resource
+    """
+    dryrun = Field(field_type=uuid.UUID, required=True)
+    resource_version_id = Field(field_type=str, required=True)
+    changes = Field(field_type=dict, default={})
+    id_fields = Field(field_type=dict, default={})
+
+    __indexes__ = [
+        dict(keys=[("dryrun", pymongo.ASCENDING), ("resource_version_id", pymongo.ASCENDING)])
+    ]
 
     def to_dict(self):
-        dict_result = BaseDocument.to_dict(self)
-        resources = {r["id"]: r for r in dict_result["resources"].values()}
-        dict_result["resources"] = resources
-        return dict_result
+        return {"id": self.resource_version_id, "changes": self.changes, "id_fields": self.id_fields}
 
 
 class ResourceSnapshot(BaseDocument):
@@ -1726,8 +2046,8 @@ class Snapshot(BaseDocument):
 
 
 _classes = [Project, Environment, Parameter, UnknownParameter, AgentProcess, AgentInstance, Agent, Report, Compile, Form,
-            FormRecord, Resource, ResourceAction, ConfigurationModel, Code, DryRun, ResourceSnapshot, ResourceRestore,
-            SnapshotRestore, Snapshot]
+            FormRecord, Resource, ResourceAction, ConfigurationModel, ConfigurationModelStatus, Code, DryRun, DryRunResult,
+            ResourceSnapshot, ResourceRestore, SnapshotRestore, Snapshot]
 
 
 def use_motor(motor):
@@ -1741,6 +2061,40 @@ def create_indexes():
         yield cls.create_indexes()
 
 
+@gen.coroutine
+def migrate_embedded_results():
+    """
+        Move the status of resources and the dryrun results that older versions embedded in the configuration model and
+        dryrun documents to their own collections. The done counter of a version is recomputed from the stored statuses, so
+        the statuses that were stored while the migration ran are counted as well.
+    """
+    cursor = ConfigurationModel._coll.find({"status": {"$exists": True}})
+    while (yield cursor.fetch_next):
+        model = cursor.next_object()
+        operations = [pymongo.UpdateOne({"_id": uuid.UUID(key)},
+                                        {"$setOnInsert": {"environment": model["environment"], "model": model["version"],
+                                                          "resource_version_id": entry["id"], "status": entry["status"]}},
+                                        upsert=True)
+                      for key, entry in model["status"].items()]
+        if len(operations) > 0:
+            yield ConfigurationModelStatus._coll.bulk_write(operations, ordered=False)
+        done = yield ConfigurationModelStatus._coll.count_documents({"environment": model["environment"],
+                                                                     "model": model["version"]})
+        yield ConfigurationModel._coll.update_one({"_id": model["_id"]}, {"$set": {"done": done}, "$unset": {"status": ""}})
+
+    cursor = DryRun._coll.find({"resources": {"$exists": True}})
+    while (yield cursor.fetch_next):
+        dryrun = cursor.next_object()
+        operations = [pymongo.UpdateOne({"_id": uuid.UUID(key)},
+                                        {"$setOnInsert": {"dryrun": dryrun["_id"], "resource_version_id": entry["id"],
+                                                          "changes": entry["changes"], "id_fields": entry["id_fields"]}},
+                                        upsert=True)
+                      for key, entry in dryrun["resources"].items()]
+        if len(operations) > 0:
+            yield DryRunResult._coll.bulk_write(operations, ordered=False)
+        yield DryRun._coll.update_one({"_id": dryrun["_id"]}, {"$unset": {"resources": ""}})
+
+
 def connect(host, port, database, io_loop):
     client = motor_tornado.MotorClient(host, port, io_loop=io_loop)
     db = client[database]
@@ -44,6 +44,9 @@ class VirtualEnv(object):
         self.virtual_python = None
         self.__cache_done = set()
 
+        from inmanta import config
+        self.wheel_cache_dir = config.wheel_cache_dir.get() or None
+
         self._old = {}
 
     def init_env(self):
@@ -158,9 +161,67 @@ class VirtualEnv(object):
 
         return requirements_file
 
+    def _get_requirement_key(self, req_line: str) -> str:
+        """
+            Get the key of the distribution a requirement line refers to or None when it can not be determined, for
+            example for an url without an egg name
+        """
+        name, req_spec = self._parse_line(req_line)
+        try:
+            return pkg_resources.Requirement.parse(name if name is not None else req_spec).key
+        except (pkg_resources.RequirementParseError, ValueError):
+            return None
+
+    def _get_missing_requirements(self, requirements_list: list) -> list:
+        """
+            Plan an install: return the requirements that are not satisfied by the distributions in the current working set.
+            When one requirement on a distribution is not satisfied, all requirements on that distribution are returned, so
+            pip installs a version that satisfies all of them. Requirements that can not be checked are always returned.
+        """
+        unsatisfied = set()
+        for req_line in requirements_list:
+            name, req_spec = self._parse_line(req_line)
+            key = self._get_requirement_key(req_line)
+            if key is None:
+                unsatisfied.add(req_line)
+                continue
+
+            try:
+                # an url is satisfied by any installed version of the distribution
+                pkg_resources.working_set.resolve([pkg_resources.Requirement.parse(name if name is not None else req_spec)])
+            except pkg_resources.ResolutionError:
+                unsatisfied.add(key)
+
+        return [req_line for req_line in requirements_list
+                if req_line in unsatisfied or self._get_requirement_key(req_line) in unsatisfied]
+
+    def _run_pip(self, args: list) -> bool:
+        """
+            Run pip in the virtual environment
+
+            :return: True when pip succeeded
+        """
+        cmd = [self.virtual_python, "-m", "pip"] + args
+        output = b""
+        try:
+            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        except CalledProcessError as e:
+            LOGGER.debug("%s: %s", cmd, e.output.decode())
+            return False
+        except Exception:
+            LOGGER.debug("%s: %s", cmd, output.decode())
+            raise
+
+        LOGGER.debug("%s: %s", cmd, output.decode())
+        return True
+
     def _install(self, requirements_list: []) -> None:
         """
             Install requirements in the given requirements file
+
+            When a wheel cache is configured, the requirements are installed from the wheels in the cache without contacting
+            the package index. Only when that fails, the wheels are built or downloaded into the cache first. Should that
+            fail as well, pip installs the requirements from the package index.
         """
         requirements_file = self._gen_requirements_file(requirements_list)
 
@@ -170,19 +231,21 @@ class VirtualEnv(object):
             fd.write(requirements_file)
             fd.close()
 
-            cmd = [self.virtual_python, "-m", "pip", "install", "-r", path]
-            output = b""
-            try:
-                output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
-            except CalledProcessError as e:
-                LOGGER.debug("%s: %s", cmd, e.output.decode())
-                LOGGER.debug("requirements: %s", requirements_file)
-            except Exception:
-                LOGGER.debug("%s: %s", cmd, output.decode())
+            installed = False
+            if self.wheel_cache_dir is not None:
+                try:
+                    os.makedirs(self.wheel_cache_dir, exist_ok=True)
+                except OSError:
+                    LOGGER.warning("Unable to create the wheel cache %s, installing without it", self.wheel_cache_dir,
+                                   exc_info=True)
+                else:
+                    from_cache = ["install", "--no-index", "--find-links", self.wheel_cache_dir, "-r", path]
+                    installed = (self._run_pip(from_cache) or
+                                 (self._run_pip(["wheel", "--wheel-dir", self.wheel_cache_dir, "--find-links",
+                                                 self.wheel_cache_dir, "-r", path]) and self._run_pip(from_cache)))
+
+            if not installed and not self._run_pip(["install", "-r", path]):
                 LOGGER.debug("requirements: %s", requirements_file)
-                raise
-            else:
-                LOGGER.debug("%s: %s", cmd, output.decode())
 
         finally:
             if os.path.exists(path):
@@ -211,7 +274,8 @@ class VirtualEnv(object):
 
     def install_from_list(self, requirements_list: list, detailed_cache=False, cache=True) -> None:
         """
-            Install requirements from a list of requirement strings
+            Install requirements from a list of requirement strings. pip is only called for the requirements that are not
+            satisfied by the installed distributions, unless cache is false.
         """
         requirements_list = sorted(requirements_list)
 
@@ -230,7 +294,15 @@ class VirtualEnv(object):
         if new_req_hash == current_hash and cache:
             return
 
-        self._install(requirements_list)
+        to_install = requirements_list
+        if cache:
+            to_install = self._get_missing_requirements(requirements_list)
+
+        if len(to_install) > 0:
+            self._install(to_install)
+        else:
+            LOGGER.debug("All requirements are already installed: %s", requirements_list)
+
         self._set_current_requirements_hash(new_req_hash)
         for x in requirements_list:
             self.__cache_done.add(x)
@@ -21,13 +21,22 @@ from inmanta.execute.proxy import UnsetException
 from inmanta.ast import RuntimeException, NotFoundException, DoubleSetException, OptionalValueException, AttributeException, \
     Locatable, Location
 from inmanta.ast.type import Type
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from inmanta.ast.attribute import Attribute  # noqa: F401
 
 
 class ResultCollector(object):
     """
         Helper interface for gradual execution
     """
+    __slots__ = ()
 
     def receive_result(self, value, location):
         """
@@ -48,6 +57,7 @@ class ResultVariable(ResultCollector):
 
         In order to assist heuristic evaluation, result variables keep track of any statement that will assign a value to it
     """
+    __slots__ = ("provider", "waiters", "value", "hasValue", "type", "location")
 
     def __init__(self, value: object=None):
         self.provider = None
@@ -122,6 +132,7 @@ class AttributeVariable(ResultVariable):
 
         when assigned a value, it will also assign a value to its inverse relation
     """
+    __slots__ = ("attribute", "myself")
 
     def __init__(self, attribute, instance):
         self.attribute = attribute
@@ -162,7 +173,10 @@ class DelayedResultVariable(ResultVariable):
           - it contains enough elements
           - there are no providers which still have to provide some values (tracked inexactly)
             (a queue variable can be dequeued by the scheduler when a provider is added)
+
+        A DelayedResultVariable without a queue is created after the execution has finished and is never queued.
     """
+    __slots__ = ("queued", "queues")
 
     def __init__(self, queue: "QueueScheduler", value=None):
         ResultVariable.__init__(self, value)
@@ -180,7 +194,7 @@ class DelayedResultVariable(ResultVariable):
             waiter.ready(self)
 
     def queue(self):
-        if self.queued:
+        if self.queued or self.queues is None:
             return
         self.queued = True
         self.queues.add_possible(self)
@@ -198,6 +212,7 @@ class DelayedResultVariable(ResultVariable):
 
 
 class Promise(object):
+    __slots__ = ("provider", "owner")
 
     def __init__(self, owner, provider):
         self.provider = provider
@@ -208,6 +223,7 @@ class Promise(object):
 
 
 class ListVariable(DelayedResultVariable):
+    __slots__ = ("attribute", "myself", "promisses", "done_promisses", "listeners", "value_ids")
 
     def __init__(self, attribute, instance, queue: "QueueScheduler"):
         self.attribute = attribute
@@ -215,6 +231,8 @@ class ListVariable(DelayedResultVariable):
         self.promisses = []
         self.done_promisses = []
         self.listeners = []
+        # identities of the values in self.value, the list keeps the insertion order
+        self.value_ids = set()
         DelayedResultVariable.__init__(self, queue, [])
 
     def get_promise(self, provider):
@@ -235,7 +253,7 @@ class ListVariable(DelayedResultVariable):
 
     def set_value(self, value, location, recur=True):
         if self.hasValue:
-            if value in self.value:
+            if id(value) in self.value_ids:
                 return
             else:
                 if isinstance(value, list):
@@ -243,7 +261,7 @@ class ListVariable(DelayedResultVariable):
                         # empty list terminates list addition
                         return
                     for subvalue in value:
-                        if subvalue not in self.value:
+                        if id(subvalue) not in self.value_ids:
                             raise RuntimeException(None, "List modified after freeze")
                 else:
                     raise RuntimeException(None, "List modified after freeze")
@@ -256,19 +274,20 @@ class ListVariable(DelayedResultVariable):
                     self.queue()
             else:
                 for v in value:
-                    self.set_value(v, recur, location)
+                    self.set_value(v, location, recur)
             return
 
         if self.type is not None:
             self.type.validate(value)
 
-        if value in self.value:
+        if id(value) in self.value_ids:
             # any set_value may fulfill a promise, allowing this object to be queued
             if self.can_get():
                 self.queue()
             return
 
         self.value.append(value)
+        self.value_ids.add(id(value))
 
         for l in self.listeners:
             l.receive_result(value, location)
@@ -311,6 +330,7 @@ class ListVariable(DelayedResultVariable):
 
 
 class OptionVariable(DelayedResultVariable):
+    __slots__ = ("attribute", "myself")
 
     def __init__(self, attribute, instance, queue: "QueueScheduler"):
         DelayedResultVariable.__init__(self, queue)
@@ -620,6 +640,61 @@ class ExecutionContext(object):
         return NamespaceResolver(self, namespace)
 
 
+class InstanceSlots(dict):
+    """
+        The result variables of the attributes of an instance. The result variable of an attribute is created when it is first
+        used, many instances never use most of their relations.
+
+        When the instance is final, the attributes that were never used are complete when they are empty. Their result
+        variables are created frozen and are not stored.
+    """
+    __slots__ = ("instance", "layout", "queue")
+
+    def __init__(self, instance: "Instance", layout: "Dict[str, Attribute]", queue: "QueueScheduler") -> None:
+        dict.__init__(self)
+        self.instance = instance
+        self.layout = layout
+        self.queue = queue
+
+    def __missing__(self, name: str) -> ResultVariable:
+        if name not in self.layout:
+            raise KeyError(name)
+
+        out = self.layout[name].get_new_result_variable(self.instance, self.queue)
+        if self.queue is None:
+            out.freeze()
+        else:
+            self[name] = out
+        return out
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.layout or dict.__contains__(self, name)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self):
+        return list(self.layout.keys()) + [name for name in dict.keys(self) if name not in self.layout]
+
+    def values(self):
+        return [self[name] for name in self.keys()]
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def get_used(self, name: str) -> "Optional[ResultVariable]":
+        """
+            Get the result variable of an attribute or None when the attribute was never used
+        """
+        return dict.get(self, name)
+
+    def set_final(self) -> None:
+        self.queue = None
+
+
 class Instance(ExecutionContext, Locatable, Resolver):
 
     def __init__(self, mytype, resolver, queue):
@@ -627,7 +702,7 @@ class Instance(ExecutionContext, Locatable, Resolver):
         # ExecutionContext, Resolver -> this class only uses it as an "interface", so no constructor call!
         self.resolver = resolver.get_root_resolver()
         self.type = mytype
-        self.slots = {n: mytype.get_attribute(n).get_new_result_variable(self, queue) for n in mytype.get_all_attribute_names()}
+        self.slots = InstanceSlots(self, mytype.get_slot_layout(), queue)
         self.slots["self"] = ResultVariable()
         self.slots["self"].set_value(self, None)
         self.sid = id(self)
@@ -675,7 +750,12 @@ class Instance(ExecutionContext, Locatable, Resolver):
             excns.append(RuntimeException(self, "Unable to select implementation for entity %s" %
                                           self.type.name))
 
-        for k, v in self.slots.items():
+        for k in self.slots.keys():
+            v = self.slots.get_used(k)
+            if v is None:
+                # an attribute that was never used, check whether it is complete when it is empty
+                v = self.slots.layout[k].get_new_result_variable(self, None)
+
             if not v.is_ready():
                 if v.can_get():
                     v.freeze()
@@ -693,6 +773,8 @@ class Instance(ExecutionContext, Locatable, Resolver):
                         excns.append(UnsetException("The object %s is not complete: attribute %s (%s) is not set" %
                                                     (self, k, attr.location), self, attr))
 
+        self.slots.set_final()
+
     def dump(self):
         print("------------ ")
         print(str(self))
@@ -706,7 +788,10 @@ class Instance(ExecutionContext, Locatable, Resolver):
                 print("BAD: %s\t\t%s" % (n, v.provider))
 
     def verify_done(self):
-        for v in self.slots.values():
+        for k in self.slots.keys():
+            v = self.slots.get_used(k)
+            if v is None:
+                v = self.slots.layout[k].get_new_result_variable(self, None)
             if not v.can_get():
                 return False
         return True
@@ -18,6 +18,7 @@
 
 import logging
 import time
+from collections import deque
 
 from inmanta.ast.statements import DefinitionStatement, TypeDefinitionStatement
 from inmanta.execute.proxy import UnsetException
@@ -37,13 +38,87 @@ LOGGER = logging.getLogger(__name__)
 MAX_ITERATIONS = 2000
 
 
+class IterationStatistics(object):
+    """
+        Statistics about a single iteration of the scheduler loop
+    """
+
+    def __init__(self, iteration: int, runnable: int, waiting: int, zerowaiters: int) -> None:
+        self.iteration = iteration
+        # queue sizes at the start of the iteration
+        self.runnable = runnable
+        self.waiting = waiting
+        self.zerowaiters = zerowaiters
+        # number of execution units that completed
+        self.executed = 0
+        # number of execution units that were requeued because they were waiting for an unset value
+        self.requeued = 0
+        # number of result variables frozen
+        self.freezes = 0
+        # number of zerowaiters that were moved back to the waitqueue
+        self.promotions = 0
+        # time spent in each phase
+        self.execute_time = 0.0
+        self.freeze_time = 0.0
+
+
+class SchedulerStatistics(object):
+    """
+        Statistics collected by the scheduler during a compile run
+    """
+
+    def __init__(self) -> None:
+        self.define_types_time = 0.0
+        self.iterations = []
+        # entity name -> index statistics of the entity, see Entity.get_index_statistics
+        self.indices = {}
+
+    def new_iteration(self, runnable: int, waiting: int, zerowaiters: int) -> IterationStatistics:
+        stat = IterationStatistics(len(self.iterations) + 1, runnable, waiting, zerowaiters)
+        self.iterations.append(stat)
+        return stat
+
+    def get_total(self, field: str):
+        return sum(getattr(it, field) for it in self.iterations)
+
+    def format(self) -> str:
+        """
+            Format the statistics as a table
+        """
+        lines = ["Define types: %0.03f seconds" % self.define_types_time,
+                 "%5s %10s %10s %10s %10s %10s %10s %10s %10s %10s" %
+                 ("iter", "runnable", "waiting", "zero", "executed", "requeued", "freezes", "promoted", "exec(s)",
+                  "freeze(s)")]
+        for it in self.iterations:
+            lines.append("%5d %10d %10d %10d %10d %10d %10d %10d %10.03f %10.03f" %
+                         (it.iteration, it.runnable, it.waiting, it.zerowaiters, it.executed, it.requeued, it.freezes,
+                          it.promotions, it.execute_time, it.freeze_time))
+        lines.append("%5s %10s %10s %10s %10d %10d %10d %10d %10.03f %10.03f" %
+                     ("total", "", "", "", self.get_total("executed"), self.get_total("requeued"),
+                      self.get_total("freezes"), self.get_total("promotions"), self.get_total("execute_time"),
+                      self.get_total("freeze_time")))
+        return "\n".join(lines)
+
+    def format_indices(self) -> str:
+        """
+            Format the index statistics of all entities that have an index as a table
+        """
+        lines = ["%-50s %8s %10s %10s %10s %10s" % ("entity", "indices", "size", "lookups", "queued", "pending")]
+        for name, stat in sorted(self.indices.items()):
+            lines.append("%-50s %8d %10d %10d %10d %10d" %
+                         (name, stat["indices"], stat["size"], stat["lookups"], stat["queued"], stat["pending"]))
+        return "\n".join(lines)
+
+
 class Scheduler(object):
     """
         This class schedules statements for execution
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, statistics: SchedulerStatistics=None):
+        if statistics is None:
+            statistics = SchedulerStatistics()
+        self.statistics = statistics
 
     def freeze_all(self, exns):
         for t in [t for t in self.types.values() if isinstance(t, Entity)]:
@@ -193,9 +268,11 @@ class Scheduler(object):
             Evaluate the current graph
         """
         prev = time.time()
+        stats = self.statistics
 
         # first evaluate all definitions, this should be done in one iteration
         self.define_types(compiler, statements, blocks)
+        stats.define_types_time = time.time() - prev
 
         # give all loose blocks an empty XC
         # register the XC's as scopes
@@ -208,9 +285,9 @@ class Scheduler(object):
 
         # setup queues
         # queue for runnable items
-        basequeue = []
+        basequeue = deque()
         # queue for RV's that are delayed
-        waitqueue = []
+        waitqueue = deque()
         # queue for RV's that are delayed and had no effective waiters when they were first in the waitqueue
         zerowaiters = []
         # queue containing everything, to find hanging statements
@@ -238,23 +315,29 @@ class Scheduler(object):
             LOGGER.debug("Iteration %d (e: %d, w: %d, p: %d, done: %d, time: %f)", i,
                          len(basequeue), len(waitqueue), len(zerowaiters), count, now - prev)
             prev = now
+            iteration = stats.new_iteration(len(basequeue), len(waitqueue), len(zerowaiters))
 
             # evaluate all that is ready
             while len(basequeue) > 0:
-                next = basequeue.pop(0)
+                next = basequeue.popleft()
                 try:
                     next.execute()
                     count = count + 1
+                    iteration.executed += 1
                 except UnsetException as e:
                     # some statements don't know all their dependencies up front,...
                     next.await(e.get_result_variable())
+                    iteration.requeued += 1
+
+            executed = time.time()
+            iteration.execute_time = executed - now
 
             # all safe stmts are done
             progress = False
 
             # find a RV that has waiters, so freezing creates progress
             while len(waitqueue) > 0 and not progress:
-                next = waitqueue.pop(0)
+                next = waitqueue.popleft()
                 if next.get_progress_potential() == 0:
                     zerowaiters.append(next)
                 elif next.get_waiting_providers() > 0:
@@ -265,21 +348,24 @@ class Scheduler(object):
                 else:
                     # freeze it and go to next iteration, new statements will be on the basequeue
                     next.freeze()
+                    iteration.freezes += 1
                     progress = True
 
             # no waiters in waitqueue,...
             # see if any zerowaiters have become gotten waiters
             if not progress:
-                waitqueue = [w for w in zerowaiters if w.get_progress_potential() is not 0]
-                queue.waitqueue = waitqueue
-                zerowaiters = [w for w in zerowaiters if w.get_progress_potential() is 0]
+                # the waitqueue is empty here, refill it in place as the QueueScheduler holds a reference to it
+                waitqueue.extend(w for w in zerowaiters if w.get_progress_potential() != 0)
+                zerowaiters = [w for w in zerowaiters if w.get_progress_potential() == 0]
+                iteration.promotions += len(waitqueue)
                 while len(waitqueue) > 0 and not progress:
                     LOGGER.debug("Moved zerowaiters to waiters")
-                    next = waitqueue.pop(0)
+                    next = waitqueue.popleft()
                     if next.get_waiting_providers() > 0:
                         next.unqueue()
                     else:
                         next.freeze()
+                        iteration.freezes += 1
                         progress = True
 
             # no one waiting anymore, all done, freeze and finish
@@ -288,6 +374,9 @@ class Scheduler(object):
                 while len(zerowaiters) > 0:
                     next = zerowaiters.pop()
                     next.freeze()
+                    iteration.freezes += 1
+
+            iteration.freeze_time = time.time() - executed
 
         now = time.time()
         LOGGER.debug("Iteration %d (e: %d, w: %d, p: %d, done: %d, time: %f)", i,
@@ -305,6 +394,10 @@ class Scheduler(object):
         # self.dump()
         # rint(len(self.types["std::Entity"].get_all_instances()))
 
+        for t in self.types.values():
+            if isinstance(t, Entity) and len(t.get_indices()) > 0:
+                self.statistics.indices[t.get_full_name()] = t.get_index_statistics()
+
         excns = []
         self.freeze_all(excns)
 
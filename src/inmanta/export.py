@@ -26,7 +26,7 @@ from inmanta import protocol, const
 from inmanta.agent.handler import Commander
 from inmanta.execute.util import Unknown, NoneValue
 from inmanta.resources import resource, Resource, to_id, IgnoreResourceException
-from inmanta.config import Option, is_uuid_opt, is_list, is_str
+from inmanta.config import Option, is_uuid_opt, is_list, is_str, is_int
 from inmanta.execute.proxy import DynamicProxy, UnknownException
 from inmanta.ast import RuntimeException, CompilerException, Locatable, OptionalValueException
 from tornado.ioloop import IOLoop
@@ -45,6 +45,11 @@ unknown_parameters = []
 cfg_env = Option("config", "environment", None, "The environment this model is associated with", is_uuid_opt)
 cfg_export = Option("config", "export", "", "The list of exporters to use", is_list)
 cfg_unknown_handler = Option("unknown_handler", "default", "prune-agent", "default method to handle unknown values ", is_str)
+cfg_upload_concurrency = Option("config", "upload-concurrency", 10,
+                                "The maximum number of files that are uploaded to the server at the same time", is_int)
+
+# the number of resources that are serialized before the uploads that run at the same time can make progress
+SERIALIZE_BATCH_SIZE = 100
 
 
 class DependencyCycleException(Exception):
@@ -273,14 +278,13 @@ class Exporter(object):
         # validate the dependency graph
         self._validate_graph()
 
-        resources = self.resources_to_list()
-
         if len(self._resources) == 0:
             LOGGER.warning("Empty deployment model.")
 
         model = {}
 
         if self.options and self.options.json:
+            resources = self.resources_to_list()
             with open(self.options.json, "wb+") as fd:
                 fd.write(protocol.json_encode(resources).encode("utf-8"))
             if len(self._resources) > 0 or len(unknown_parameters) > 0:
@@ -292,7 +296,7 @@ class Exporter(object):
             if types is not None and model_export:
                 model = ModelExporter(types).export_all()
 
-            self.commit_resources(self._version, resources, metadata, model)
+            self.commit_resources(self._version, None, metadata, model)
             LOGGER.info("Committed resources with version %d" % self._version)
 
         if include_status:
@@ -364,6 +368,19 @@ class Exporter(object):
 
         return resources
 
+    @gen.coroutine
+    def _serialize_resources(self):
+        """
+            Serialize the resources in batches, between batches other coroutines such as the file uploads can continue.
+        """
+        resources = []
+        for i, res in enumerate(self._resources.values()):
+            resources.append(res.serialize())
+            if (i + 1) % SERIALIZE_BATCH_SIZE == 0:
+                yield gen.moment
+
+        return resources
+
     def run_sync(self, function):
         return self._io_loop.run_sync(function, 300)
 
@@ -371,6 +388,11 @@ class Exporter(object):
         """
             Deploy code to the server
         """
+        conn = protocol.Client("compiler")
+        self.run_sync(lambda: self._deploy_code(conn, tid, version))
+
+    @gen.coroutine
+    def _deploy_code(self, conn, tid, version=None):
         if version is None:
             version = int(time.time())
 
@@ -390,75 +412,88 @@ class Exporter(object):
         merge_dict(sources, Commander.sources())
 
         LOGGER.info("Uploading source files")
+        yield upload_code(conn, tid, version, sources)
 
-        conn = protocol.Client("compiler")
+    @gen.coroutine
+    def _upload_files(self, conn):
+        """
+            Upload all files that the server does not have yet. At most upload-concurrency files are uploaded at the same
+            time. The raw content is sent to the file store of the server, a file is only encoded in json for servers
+            that do not have the file store routes.
+        """
+        LOGGER.info("Uploading %d files" % len(self._file_store))
+
+        # collect all hashes and send them at once to the server to check
+        # if they are already uploaded
+        hashes = list(self._file_store.keys())
+        res = yield conn.stat_files(files=hashes)
+
+        if res.code != 200:
+            raise Exception("Unable to check status of files at server")
+
+        to_upload = list(res.result["files"])
+        LOGGER.info("Only %d files are new and need to be uploaded" % len(to_upload))
 
         @gen.coroutine
-        def call():
-            yield upload_code(conn, tid, version, sources)
+        def upload_worker():
+            while len(to_upload) > 0:
+                hash_id = to_upload.pop()
+                res = yield conn.put_file_content(hash_id, self._file_store[hash_id])
+                if res.code in (404, 405):
+                    # the server does not accept raw files yet
+                    content = base64.b64encode(self._file_store[hash_id]).decode("ascii")
+                    res = yield conn.upload_file(id=hash_id, content=content)
+
+                if res.code != 200:
+                    LOGGER.error("Unable to upload file with hash %s" % hash_id)
+                else:
+                    LOGGER.debug("Uploaded file with hash %s" % hash_id)
 
-        self.run_sync(call)
+        yield [upload_worker() for _ in range(min(cfg_upload_concurrency.get(), len(to_upload)))]
 
     def commit_resources(self, version: int, resources: List[Dict[str, str]],
                          metadata: Dict[str, str], model: Dict) -> None:
         """
             Commit the entire list of resource to the configurations server.
+
+            :param resources: The serialized resources. When None, the resources of this exporter are serialized while the
+                              code and the files are uploaded.
         """
         tid = cfg_env.get()
         if tid is None:
             LOGGER.error("The environment for this model should be set!")
             return
 
-        self.deploy_code(tid, version)
-
         conn = protocol.Client("compiler")
-        LOGGER.info("Uploading %d files" % len(self._file_store))
-
-        # collect all hashes and send them at once to the server to check
-        # if they are already uploaded
-        hashes = list(self._file_store.keys())
 
+        @gen.coroutine
         def call():
-            return conn.stat_files(files=hashes)
-
-        res = self.run_sync(call)
+            # the code and the files are uploaded while the resources are serialized
+            uploads = [self._deploy_code(conn, tid, version), self._upload_files(conn)]
 
-        if res.code != 200:
-            raise Exception("Unable to check status of files at server")
+            if resources is None:
+                serialized = yield self._serialize_resources()
+            else:
+                serialized = resources
 
-        to_upload = res.result["files"]
+            yield uploads
 
-        LOGGER.info("Only %d files are new and need to be uploaded" % len(to_upload))
-        for hash_id in to_upload:
-            content = self._file_store[hash_id]
+            # Collecting version information
+            version_info = {const.EXPORT_META_DATA: metadata,
+                            "model": model}
 
-            def call():
-                return conn.upload_file(id=hash_id, content=base64.b64encode(content).decode("ascii"))
+            # TODO: start transaction
+            LOGGER.info("Sending resource updates to server")
+            for res in serialized:
+                LOGGER.debug("  %s", res["id"])
 
-            res = self.run_sync(call)
+            res = yield conn.put_version(tid=tid, version=version, resources=serialized, unknowns=unknown_parameters,
+                                         resource_state=self._resource_state, version_info=version_info)
 
             if res.code != 200:
-                LOGGER.error("Unable to upload file with hash %s" % hash_id)
-            else:
-                LOGGER.debug("Uploaded file with hash %s" % hash_id)
-
-        # Collecting version information
-        version_info = {const.EXPORT_META_DATA: metadata,
-                        "model": model}
+                LOGGER.error("Failed to commit resource updates (%s)", res.result["message"])
 
-        # TODO: start transaction
-        LOGGER.info("Sending resource updates to server")
-        for res in resources:
-            LOGGER.debug("  %s", res["id"])
-
-        def put_call():
-            return conn.put_version(tid=tid, version=version, resources=resources, unknowns=unknown_parameters,
-                                    resource_state=self._resource_state, version_info=version_info)
-
-        res = self.run_sync(put_call)
-
-        if res.code != 200:
-            LOGGER.error("Failed to commit resource updates (%s)", res.result["message"])
+        self.run_sync(call)
 
     def get_unknown_resources(self, hostname):
         """
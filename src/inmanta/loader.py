@@ -128,8 +128,6 @@ class CodeLoader(object):
             with open(os.path.join(self.__code_dir, PERSIST_FILE), "w+") as fd:
                 json.dump(mod, fd)
 
-        pkg_resources.working_set = pkg_resources.WorkingSet._build_master()
-
     def get_module_payload(self):
         """
             Get the lastest module code payload in json formatted string
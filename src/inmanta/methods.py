@@ -398,7 +398,7 @@ class ResourceMethod(Method):
         """
 
     @protocol(operation="GET", index=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
-    def get_resources_for_agent(self, tid: uuid.UUID, agent: str, version: int=None):
+    def get_resources_for_agent(self, tid: uuid.UUID, agent: str, version: int=None, since_version: int=None):
         """
             Return the most recent state for the resources associated with agent, or the version requested
 
@@ -406,6 +406,11 @@ class ResourceMethod(Method):
             :param agent: The agent
             :param version: The version to retrieve. If none, the latest available version is returned. With a specific version
                             that version is returned, even if it has not been released yet.
+            :param since_version: The version the agent already has. When set, resources with the same desired state as in
+                                  since_version are not returned in full. Instead the reply contains since_version, a list
+                                  unchanged with the id and status of these resources and a list removed with the
+                                  resource ids that are no longer present. When since_version does not exist anymore, the
+                                  full version is returned without these keys.
         """
 
     @protocol(operation="POST", index=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
@@ -433,6 +438,27 @@ class ResourceMethod(Method):
         """
 
 
+class ResourceActionBatchedMethod(Method):
+    """
+        Report the result of multiple resource actions at once
+    """
+    __method_name__ = "resourceactionbatched"
+
+    @protocol(operation="POST", index=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
+    def resource_action_update_batched(self, tid: uuid.UUID, actions: list):
+        """
+            Send the result of multiple finished resource actions to the server. This is equivalent to calling
+            resource_action_update for each action, but all database updates are grouped.
+
+            :param tid: The id of the environment the resources belong to
+            :param actions: A list of finished resource actions. Each action is a dict with the arguments of
+                            resource_action_update: resource_ids, action_id, action, started, finished, status, messages,
+                            changes, change and send_events. started, finished and status are required.
+            :return: A list with the result of each action, in the same order. Each entry is a dict with a code and,
+                     when the action failed, a message.
+        """
+
+
 class VersionMethod(Method):
     """
         Manage configuration model versions
@@ -440,13 +466,15 @@ class VersionMethod(Method):
     __method_name__ = "version"
 
     @protocol(index=True, operation="GET", arg_options=ENV_OPTS, client_types=["api"])
-    def list_versions(self, tid: uuid.UUID, start: int=None, limit: int=None):
+    def list_versions(self, tid: uuid.UUID, start: int=None, limit: int=None, after: str=None, fields: str=None):
         """
             Returns a list of all available versions
 
             :param tid: The id of the environment
             :param start: Optional, parameter to control the amount of results that are returned. 0 is the latest version.
             :param limit: Optional, parameter to control the amount of results returned.
+            :param after: Optional, return the page after this key. The key of the next page is returned as next.
+            :param fields: Optional, a comma separated list of the fields to return for each version.
         """
 
     @protocol(operation="GET", id=True, arg_options=ENV_OPTS, client_types=["api"])
@@ -495,6 +523,41 @@ class VersionMethod(Method):
         """
 
 
+class VersionStatusMethod(Method):
+    """
+        Get the deployment status of the resources in a configuration model version
+    """
+    __method_name__ = "versionstatus"
+
+    @protocol(operation="GET", id=True, arg_options=ENV_OPTS, client_types=["api"])
+    def get_version_status(self, tid: uuid.UUID, id: int, start: int=None, limit: int=None):
+        """
+            Get the deployment status of the resources in a version, ordered by resource id. Only resources that have been
+            deployed at least once have a status.
+
+            :param tid: The id of the environment
+            :param id: The version of the configuration model
+            :param start: Optional, the index of the first status to return
+            :param limit: Optional, the maximal number of statuses to return
+        """
+
+
+class CacheStatisticsMethod(Method):
+    """
+        Get the statistics of the caches of the server
+    """
+    __method_name__ = "cachestatistics"
+
+    @protocol(operation="GET", index=True, client_types=["api"])
+    def get_cache_statistics(self):
+        """
+            Get the hits, misses and number of entries of the caches of the server
+
+            :return: A dict with the statistics of the cache of the resources served to agents (resources) and of the code
+                     bundle cache (code_bundles)
+        """
+
+
 class DryRunMethod(Method):
     """
         Method for requesting and quering a dryrun
@@ -511,21 +574,26 @@ class DryRunMethod(Method):
         """
 
     @protocol(operation="GET", arg_options=ENV_OPTS, client_types=["api"])
-    def dryrun_list(self, tid: uuid.UUID, version: int=None):
+    def dryrun_list(self, tid: uuid.UUID, version: int=None, start: int=None, limit: int=None, after: str=None):
         """
-            Create a list of dry runs
+            Create a list of dry runs, the most recent first
 
             :param tid: The id of the environment
             :param version: Only for this version
+            :param start: Optional, the number of dryruns to skip
+            :param limit: Optional, the maximal number of dryruns to return
+            :param after: Optional, return the page after this key. The key of the next page is returned as next.
         """
 
     @protocol(operation="GET", id=True, arg_options=ENV_OPTS, client_types=["api"])
-    def dryrun_report(self, tid: uuid.UUID, id: uuid.UUID):
+    def dryrun_report(self, tid: uuid.UUID, id: uuid.UUID, start: int=None, limit: int=None):
         """
             Create a dryrun report
 
             :param tid: The id of the environment
             :param id: The version dryrun to report
+            :param start: Optional, the index of the first resource to include, resources are ordered by id
+            :param limit: Optional, the maximal number of resources to include
         """
 
     @protocol(operation="PUT", id=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
@@ -540,6 +608,24 @@ class DryRunMethod(Method):
         """
 
 
+class DryRunBatchedMethod(Method):
+    """
+        Store the dryrun results of multiple resources at once
+    """
+    __method_name__ = "dryrunbatched"
+
+    @protocol(operation="PUT", id=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
+    def dryrun_update_batched(self, tid: uuid.UUID, id: uuid.UUID, resources: dict):
+        """
+            Store dryrun results at the server. This is equivalent to calling dryrun_update for each resource, but all
+            results are stored with a single database update.
+
+            :param tid: The id of the environment
+            :param id: The version dryrun to report
+            :param resources: A dict with the required changes for each resource id
+        """
+
+
 class AgentDryRun(Method):
     """
         Method for requesting a dryrun from an agent
@@ -638,12 +724,17 @@ class ParameterMethod(Method):
         """
 
     @protocol(operation="POST", index=True, arg_options=ENV_OPTS, client_types=["api", "compiler"])
-    def list_params(self, tid: uuid.UUID, query: dict={}):
+    def list_params(self, tid: uuid.UUID, query: dict={}, start: int=None, limit: int=None, after: str=None,
+                    fields: str=None):
         """
             List/query parameters in this environment
 
             :param tid: The id of the environment
             :param query: A query to match against metadata
+            :param start: Optional, the number of parameters to skip
+            :param limit: Optional, the maximal number of parameters to return
+            :param after: Optional, return the page after this key. The key of the next page is returned as next.
+            :param fields: Optional, a comma separated list of the fields to return for each parameter.
         """
 
 
@@ -792,6 +883,28 @@ class CodeMethod(Method):
         """
 
 
+class CodeBundleMethod(Method):
+    """
+        Get all code of a version at once
+    """
+    __method_name__ = "codebundle"
+
+    @protocol(operation="GET", id=True, agent_server=True, arg_options=ENV_OPTS, client_types=["agent"])
+    def get_code_bundle(self, tid: uuid.UUID, id: int, code_hash: str=None):
+        """
+            Get the code of all resource types in a version of the configuration model. The bundle is identified by a hash
+            of the code it contains.
+
+            :param tid: The environment the code belongs to
+            :param id: The id (version) of the configuration model
+            :param code_hash: The hash of the bundle the caller already has. When the bundle of this version has the same
+                              hash, only the hash is returned and unchanged is true.
+            :return: The version, the hash of the bundle and whether it is unchanged. When it changed, a dict with the code
+                     hashes for each resource type and the sources, compressed with util.compress_payload, in the same
+                     format as get_code.
+        """
+
+
 class CodeBatchedMethod(Method):
     """
         Upload code to the server
@@ -855,9 +968,14 @@ class Snapshot(Method):
     __method_name__ = "snapshot"
 
     @protocol(operation="GET", index=True, arg_options=ENV_OPTS, client_types=["api"])
-    def list_snapshots(self, tid: uuid.UUID):
+    def list_snapshots(self, tid: uuid.UUID, start: int=None, limit: int=None, after: str=None, fields: str=None):
         """
-            Create a list of all snapshots
+            Create a list of all snapshots, the most recent first
+
+            :param start: Optional, the number of snapshots to skip
+            :param limit: Optional, the maximal number of snapshots to return
+            :param after: Optional, return the page after this key. The key of the next page is returned as next.
+            :param fields: Optional, a comma separated list of the fields to return for each snapshot.
         """
 
     @protocol(operation="GET", id=True, arg_options=ENV_OPTS, client_types=["api"])
@@ -37,6 +37,7 @@ from inmanta.ast.blocks import BasicBlock
 from inmanta.ast.statements import DefinitionStatement, BiStatement, Statement
 from inmanta.ast.statements.define import DefineImport
 from inmanta.parser import plyInmantaParser
+from inmanta.parser.cache import ParseCache
 from inmanta.util import memoize, get_compiler_version
 from typing import Tuple, List, Dict
 
@@ -328,10 +329,20 @@ class ModuleLike(object):
 
     name = property(get_name)
 
+    def get_parse_cache(self) -> ParseCache:
+        """
+            Get the cache for parsed files, None if no cache should be used
+        """
+        return None
+
     def _load_file(self, ns, file) -> Tuple[List[Statement], BasicBlock]:
         ns.location = Location(file, 1)
         statements = []
-        stmts = plyInmantaParser.parse(ns, file)
+        cache = self.get_parse_cache()
+        if cache is not None:
+            stmts = cache.parse(ns, file)
+        else:
+            stmts = plyInmantaParser.parse(ns, file)
         block = BasicBlock(ns)
         for s in stmts:
             if isinstance(s, BiStatement):
@@ -383,7 +394,7 @@ class Project(ModuleLike):
     PROJECT_FILE = "project.yml"
     _project = None
 
-    def __init__(self, path, autostd=True, main_file="main.cf"):
+    def __init__(self, path, autostd=True, main_file="main.cf", parse_cache: ParseCache=None):
         """
             Initialize the project, this includes
              * Loading the project.yaml (into self._meta)
@@ -393,6 +404,7 @@ class Project(ModuleLike):
              * verify if project.yml corresponds to the modules in self.modules
 
             @param path: The directory where the project is located
+            @param parse_cache: The cache to use for parsed files, by default a cache in the .env directory is used
 
         """
         super().__init__(path)
@@ -439,6 +451,9 @@ class Project(ModuleLike):
                 os.mkdir(self.downloadpath)
 
         self.virtualenv = env.VirtualEnv(os.path.join(path, ".env"))
+        if parse_cache is None:
+            parse_cache = ParseCache(os.path.join(path, ".env", ".cache", "parser"))
+        self.parse_cache = parse_cache
 
         self.loaded = False
         self.modules = {}
@@ -454,6 +469,9 @@ class Project(ModuleLike):
             else:
                 self._install_mode = mode
 
+    def get_parse_cache(self) -> ParseCache:
+        return self.parse_cache
+
     @classmethod
     def get_project_dir(cls, cur_dir):
         """
@@ -757,6 +775,11 @@ class Module(ModuleLike):
         self.load_module_file()
         self.is_versioned()
 
+    def get_parse_cache(self) -> ParseCache:
+        if self._project is None:
+            return None
+        return self._project.get_parse_cache()
+
     def rewrite_version(self, new_version):
         new_version = str(new_version)  # make sure it is a string!
         with open(self.get_config_file_name(), "r") as fd:
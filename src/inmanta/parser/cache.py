@@ -0,0 +1,193 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+
+import inmanta
+from inmanta.ast import Namespace
+from inmanta.ast.statements import Statement
+from inmanta.parser import plyInmantaParser
+from inmanta.util import get_compiler_version
+from typing import List
+
+LOGGER = logging.getLogger(__name__)
+
+# the packages that define the parser and the classes of the pickled ast objects
+SOURCE_PACKAGES = ["parser", "ast", "execute"]
+# the namespace is not stored in the cache, it is replaced by a reference to the namespace of the file that is loaded
+NAMESPACE_ID = "namespace"
+
+
+def _get_parser_hash() -> str:
+    """
+        Hash of the compiler version and the source of the parser and the ast, so the cache is invalidated when the grammar
+        or the state of the pickled objects changes
+    """
+    sha1sum = hashlib.sha1()
+    sha1sum.update(("%s-%d" % (get_compiler_version(), pickle.HIGHEST_PROTOCOL)).encode())
+    base_dir = os.path.dirname(inmanta.__file__)
+    for package in SOURCE_PACKAGES:
+        for root, dirs, files in os.walk(os.path.join(base_dir, package)):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(".py") or name == "parsetab.py":
+                    continue
+                path = os.path.join(root, name)
+                sha1sum.update(os.path.relpath(path, base_dir).encode())
+                with open(path, "rb") as fd:
+                    sha1sum.update(fd.read())
+    return sha1sum.hexdigest()
+
+
+class _AstPickler(pickle.Pickler):
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Namespace):
+            return NAMESPACE_ID
+        return None
+
+
+class _AstUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, namespace: Namespace):
+        super().__init__(file)
+        self.namespace = namespace
+
+    def persistent_load(self, pid):
+        if pid != NAMESPACE_ID:
+            raise pickle.UnpicklingError("Unknown persistent id %s" % pid)
+        return self.namespace
+
+
+class ParseCache(object):
+    """
+        An on-disk cache of parsed configuration files. Entries are keyed on the path of the file, its content and the
+        version of the parser. Unchanged files are unpickled instead of being lexed and parsed again. Only the most recent
+        entry of each file is kept.
+
+        :param cache_dir: The directory to store the cache in
+        :param keep_in_memory: Also keep the most recent entry of each file in memory. This is useful for long running
+                               processes that parse the same files over and over again.
+    """
+
+    def __init__(self, cache_dir: str, keep_in_memory: bool=False) -> None:
+        self.cache_dir = cache_dir
+        self.keep_in_memory = keep_in_memory
+        # filename -> (key, pickled statements)
+        self._memory = {}
+        self._parser_hash = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_key(self, filename: str, content: str) -> str:
+        if self._parser_hash is None:
+            self._parser_hash = _get_parser_hash()
+
+        sha1sum = hashlib.sha1()
+        sha1sum.update(self._parser_hash.encode())
+        sha1sum.update(content.encode())
+        return sha1sum.hexdigest()
+
+    def _get_file_dir(self, filename: str) -> str:
+        """
+            The directory that holds the entries of a file
+        """
+        file_hash = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+        return os.path.join(self.cache_dir, file_hash[:2], file_hash)
+
+    def _get_path(self, filename: str, key: str) -> str:
+        return os.path.join(self._get_file_dir(filename), key)
+
+    def _load(self, filename: str, key: str, namespace: Namespace) -> List[Statement]:
+        path = self._get_path(filename, key)
+        try:
+            if filename in self._memory and self._memory[filename][0] == key:
+                data = self._memory[filename][1]
+            else:
+                with open(path, "rb") as fd:
+                    data = fd.read()
+
+            statements = _AstUnpickler(io.BytesIO(data), namespace).load()
+        except FileNotFoundError:
+            return None
+        except Exception:
+            LOGGER.warning("Unable to load cached ast from %s, ignoring it", path, exc_info=True)
+            return None
+
+        if self.keep_in_memory:
+            self._memory[filename] = (key, data)
+        return statements
+
+    def _store(self, filename: str, key: str, statements: List[Statement]) -> None:
+        path = self._get_path(filename, key)
+        data = io.BytesIO()
+        try:
+            _AstPickler(data, pickle.HIGHEST_PROTOCOL).dump(statements)
+        except Exception:
+            LOGGER.debug("Unable to pickle ast for %s", path, exc_info=True)
+            return
+
+        if self.keep_in_memory:
+            self._memory[filename] = (key, data.getvalue())
+
+        try:
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # write to a temporary file first so concurrent compiles never see a partial entry
+            fdnum, tmp_path = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(fdnum, "wb") as fd:
+                    fd.write(data.getvalue())
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        except OSError:
+            LOGGER.warning("Unable to write cached ast to %s", path, exc_info=True)
+            return
+
+        # remove the entries of previous versions of the file
+        for name in os.listdir(directory):
+            if name != key and not name.startswith("tmp"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def parse(self, namespace: Namespace, filename: str) -> List[Statement]:
+        """
+            Parse the given file, using the cache when the file has not changed
+        """
+        with open(filename, "r") as fd:
+            content = fd.read()
+
+        key = self._get_key(filename, content)
+        statements = self._load(filename, key, namespace)
+        if statements is not None:
+            self.hits += 1
+            return statements
+
+        self.misses += 1
+        statements = plyInmantaParser.parse(namespace, filename, content)
+        self._store(filename, key, statements)
+        return statements
@@ -277,6 +277,106 @@ class Result(object):
 
 
 # Shared
+class ArgumentBinder(object):
+    """
+        Binds the arguments of a request to the arguments of the method that handles it. The argspec of the method and the
+        conversion of each argument are determined once, when the method is mapped to a url.
+    """
+
+    def __init__(self, properties, method):
+        argspec = inspect.getfullargspec(method)
+        self.accepts_kwargs = argspec.varkw is not None
+
+        args = [arg for arg in argspec.args if arg != "self"]
+        defaults = argspec.defaults if argspec.defaults is not None else ()
+        defaults_start = len(args) - len(defaults)
+
+        # (name, has default, default, arg options, type, type conversion) for each argument
+        self.args = []
+        for i, arg in enumerate(args):
+            has_default = i >= defaults_start
+            default = defaults[i - defaults_start] if has_default else None
+            opts = properties["arg_options"].get(arg)
+            arg_type = argspec.annotations.get(arg)
+            self.args.append((arg, has_default, default, opts, arg_type, self._get_conversion(arg_type)))
+
+    @classmethod
+    def get(cls, properties, method):
+        """
+            Get the binder of the given method. It is created on first use and stored on the method.
+        """
+        binder = getattr(method, "__protocol_binder__", None)
+        if binder is None:
+            binder = cls(properties, method)
+            method.__protocol_binder__ = binder
+        return binder
+
+    @staticmethod
+    def _get_conversion(arg_type):
+        if arg_type is None:
+            return None
+
+        if arg_type == datetime:
+            return lambda value: datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+
+        if issubclass(arg_type, enum.Enum):
+            return lambda value: arg_type[value]
+
+        if arg_type == bool:
+            return inmanta_config.is_bool
+
+        return arg_type
+
+    @gen.coroutine
+    def bind(self, message, request_headers, headers):
+        """
+            Validate the message against the arguments of the method, convert the arguments to their type and execute the
+            getters. Header mappings are added to the message and, when requested, to the reply headers.
+
+            :return: A tuple with the metadata of the getters and the fields in the message that are not an argument
+            :raise methods.HTTPException: The message is not valid
+        """
+        all_fields = set(message.keys())
+        metadata = {}
+        for arg, has_default, default, opts, arg_type, convert in self.args:
+            # handle defaults and header mapping
+            if opts is not None:
+                if "header" in opts:
+                    message[arg] = request_headers[opts["header"]]
+                    if "reply_header" in opts and opts["reply_header"]:
+                        headers[opts["header"]] = message[arg]
+                all_fields.add(arg)
+
+            if arg not in message:
+                if has_default:
+                    message[arg] = default
+                else:
+                    raise methods.HTTPException(500, "Invalid request. Field '%s' is required." % arg)
+
+            else:
+                all_fields.remove(arg)
+
+            # validate the type
+            if convert is not None and message[arg] is not None and not isinstance(message[arg], arg_type):
+                try:
+                    message[arg] = convert(message[arg])
+                except (ValueError, TypeError, KeyError):
+                    error_msg = ("Invalid type for argument %s. Expected %s but received %s" %
+                                 (arg, arg_type, message[arg].__class__))
+                    LOGGER.exception(error_msg)
+                    raise methods.HTTPException(500, error_msg)
+
+            # execute any getters that are defined
+            if opts is not None and "getter" in opts:
+                try:
+                    message[arg] = yield opts["getter"](message[arg], metadata)
+                except methods.HTTPException:
+                    LOGGER.exception("Failed to use getter for arg %s", arg)
+                    raise
+
+        return metadata, all_fields
+
+
 class RESTBase(object):
 
     def _create_base_url(self, properties, msg=None, versioned=True):
@@ -336,85 +436,24 @@ class RESTBase(object):
                     return self.return_error_msg(500, "The sid %s is not valid." % message['sid'], headers)
 
             # validate message against the arguments
-            argspec = inspect.getfullargspec(config[2])
-            args = argspec.args
-
-            if "self" in args:
-                args.remove("self")
-
-            all_fields = set(message.keys())
-            if argspec.defaults is not None:
-                defaults_start = len(args) - len(argspec.defaults)
-            else:
-                defaults_start = -1
-
-            metadata = {}
-            for i in range(len(args)):
-                arg = args[i]
-
-                opts = {}
-                # handle defaults and header mapping
-                if arg in config[0]["arg_options"]:
-                    opts = config[0]["arg_options"][arg]
-
-                    if "header" in opts:
-                        message[arg] = request_headers[opts["header"]]
-                        if "reply_header" in opts and opts["reply_header"]:
-                            headers[opts["header"]] = message[arg]
-                    all_fields.add(arg)
-
-                if arg not in message:
-                    if (defaults_start >= 0 and (i - defaults_start) < len(argspec.defaults)):
-                        message[arg] = argspec.defaults[i - defaults_start]
-                    else:
-                        return self.return_error_msg(500, "Invalid request. Field '%s' is required." % arg, headers)
-
-                else:
-                    all_fields.remove(arg)
-
-                # validate the type
-                if arg in argspec.annotations:
-                    arg_type = argspec.annotations[arg]
-                    if message[arg] is not None and not isinstance(message[arg], arg_type):
-                        try:
-                            if arg_type == datetime:
-                                message[arg] = datetime.strptime(message[arg], "%Y-%m-%dT%H:%M:%S.%f")
-
-                            elif issubclass(arg_type, enum.Enum):
-                                message[arg] = arg_type[message[arg]]
-
-                            elif arg_type == bool:
-                                message[arg] = inmanta_config.is_bool(message[arg])
-
-                            else:
-                                message[arg] = arg_type(message[arg])
-
-                        except (ValueError, TypeError):
-                            error_msg = ("Invalid type for argument %s. Expected %s but received %s" %
-                                         (arg, arg_type, message[arg].__class__))
-                            LOGGER.exception(error_msg)
-                            return self.return_error_msg(500, error_msg, headers)
-
-                # execute any getters that are defined
-                if "getter" in opts:
-                    try:
-                        result = yield opts["getter"](message[arg], metadata)
-                        message[arg] = result
-                    except methods.HTTPException as e:
-                        LOGGER.exception("Failed to use getter for arg %s", arg)
-                        return self.return_error_msg(e.code, e.message, headers)
+            binder = config[3]
+            try:
+                metadata, all_fields = yield binder.bind(message, request_headers, headers)
+            except methods.HTTPException as e:
+                return self.return_error_msg(e.code, e.message, headers)
 
             if config[0]["agent_server"]:
                 if 'sid' in all_fields:
                     del message['sid']
                     all_fields.remove('sid')
 
-            if len(all_fields) > 0 and argspec.varkw is None:
+            if len(all_fields) > 0 and not binder.accepts_kwargs:
                 return self.return_error_msg(500, ("Request contains fields %s " % all_fields) +
                                              "that are not declared in method and no kwargs argument is provided.", headers)
 
-            LOGGER.debug("Calling method %s(%s)", config[1][1], ", ".join(["%s='%s'" % (name, sh(str(value)))
-                                                                           for name, value in message.items()]))
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug("Calling method %s(%s)", config[1][1], ", ".join(["%s='%s'" % (name, sh(str(value)))
+                                                                               for name, value in message.items()]))
             method_call = getattr(config[1][0], config[1][1])
 
             if hasattr(method_call, "__protocol_mapping__"):
@@ -445,7 +484,8 @@ class RESTBase(object):
 
             if reply is not None:
                 if "reply" in config[0] and config[0]:
-                    LOGGER.debug("%s returned %d: %s", config[1][1], code, sh(str(reply), 70))
+                    if LOGGER.isEnabledFor(logging.DEBUG):
+                        LOGGER.debug("%s returned %d: %s", config[1][1], code, sh(str(reply), 70))
                     return reply, headers, code
 
                 else:
@@ -538,14 +578,16 @@ class RESTTransport(RESTBase):
                     if "header" in opts:
                         headers.add(opts["header"])
 
+            binder = ArgumentBinder.get(properties, method.__wrapped__)
+
             url = self._create_base_url(properties)
             properties["api_version"] = "1"
-            url_map[url][properties["operation"]] = (properties, call, method.__wrapped__)
+            url_map[url][properties["operation"]] = (properties, call, method.__wrapped__, binder)
 
             url = self._create_base_url(properties, versioned=False)
             properties = properties.copy()
             properties["api_version"] = None
-            url_map[url][properties["operation"]] = (properties, call, method.__wrapped__)
+            url_map[url][properties["operation"]] = (properties, call, method.__wrapped__, binder)
 
         headers.add("Authorization")
         self.headers = headers
@@ -663,6 +705,40 @@ class RESTTransport(RESTBase):
 
         return Result(code=response.code, result=self._decode(response.body))
 
+    @gen.coroutine
+    def file_call(self, method, file_hash, content=None):
+        """
+            Download (GET) or upload (PUT) the raw content of a file through the file store routes of the server. The content
+            is not encoded in a json body.
+
+            :return: A result with the content of the file as result of a successful download
+        """
+        url = "%s/api/v1/filestore/%s" % (self._get_client_config(), file_hash)
+
+        headers = {}
+        if self.token is not None:
+            headers["Authorization"] = "Bearer " + self.token
+
+        ca_certs = inmanta_config.Config.get(self.id, "ssl_ca_cert_file", None)
+        LOGGER.debug("Calling server %s %s", method, url)
+
+        try:
+            request = HTTPRequest(url=url, method=method, headers=headers, body=content,
+                                  connect_timeout=self.connection_timout, request_timeout=120, ca_certs=ca_certs)
+            response = yield AsyncHTTPClient().fetch(request)
+        except HTTPError as e:
+            result = {"message": str(e)}
+            if e.response is not None and len(e.response.body) > 0:
+                try:
+                    result = self._decode(e.response.body)
+                except ValueError:
+                    pass
+            return Result(code=e.code, result=result)
+
+        if method == "GET":
+            return Result(code=response.code, result=response.body)
+        return Result(code=response.code, result={})
+
     def validate_sid(self, sid):
         return self.endpoint.validate_sid(sid)
 
@@ -925,7 +1001,26 @@ def get_method_name(properties):
     return method_class.__method_name__
 
 
-class Client(Endpoint, metaclass=ClientMeta):
+class FileTransferMixin(object):
+    """
+        Transfer the raw content of files with the file store of the server. Servers that do not have the file store routes
+        reply with 404, callers fall back to the get_file and upload_file methods for them.
+    """
+
+    def get_file_content(self, file_hash):
+        """
+            Download the content of a file. The result is the content as bytes when the code is 200.
+        """
+        return self._transport_instance.file_call("GET", file_hash)
+
+    def put_file_content(self, file_hash, content):
+        """
+            Upload the content of a file
+        """
+        return self._transport_instance.file_call("PUT", file_hash, content)
+
+
+class Client(Endpoint, FileTransferMixin, metaclass=ClientMeta):
     """
         A client that communicates with end-point based on its configuration
     """
@@ -976,7 +1071,7 @@ class SyncClient(object):
         return async_call
 
 
-class AgentClient(Endpoint, metaclass=ClientMeta):
+class AgentClient(Endpoint, FileTransferMixin, metaclass=ClientMeta):
     """
         A client that communicates with end-point based on its configuration
     """
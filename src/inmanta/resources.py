@@ -16,6 +16,7 @@
     Contact: code@inmanta.com
 """
 
+import copy
 import hashlib
 import inspect
 import logging
@@ -396,6 +397,28 @@ class Resource(metaclass=ResourceMeta):
 
         return res
 
+    def copy_for_version(self, version: int) -> "Resource":
+        """
+            Create a copy of this resource for another version of the configuration model. The copy shares the values of
+            its fields with this resource. When the resource class was replaced in the meantime (new code was loaded), the
+            copy is an instance of the new class.
+
+            :return: The resource with the id and requires in the given version
+        """
+        requires = [req.copy(version) for req in self.requires]
+        cls, _options = resource.get_class(self.id.entity_type)
+        if cls is not self.__class__:
+            obj_map = self.serialize()
+            obj_map["id"] = str(self.id.copy(version))
+            obj_map["requires"] = [str(req) for req in requires]
+            return Resource.deserialize(obj_map)
+
+        res = copy.copy(self)
+        res.id = self.id.copy(version)
+        res.requires = set(requires)
+        res.unknowns = set(self.unknowns)
+        return res
+
     def serialize(self):
         """
             Serialize this resource to its dictionary representation
@@ -476,6 +499,12 @@ class Id(object):
 
         self._version = version
 
+    def copy(self, version: int) -> "Id":
+        """
+            Create a copy of this id with the given version
+        """
+        return Id(self._entity_type, self._agent_name, self._attribute, self._attribute_value, version)
+
     def __str__(self):
         if self._version > 0:
             return "%(type)s[%(agent)s,%(attribute)s=%(value)s],v=%(version)s" % {
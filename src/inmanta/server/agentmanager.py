@@ -38,6 +38,7 @@ from inmanta.server import config as opt
 from tornado.ioloop import IOLoop
 from inmanta.protocol import encode_token
 from inmanta.resources import Id
+from typing import List
 
 
 LOGGER = logging.getLogger(__name__)
@@ -158,6 +159,22 @@ class AgentManager(ServerSlice):
                 agent = yield self.create_default_agent(env, nodename)
                 return agent
 
+    @gen.coroutine
+    def ensure_agents_registered(self, env: data.Environment, nodenames: List[str]):
+        """
+            Make sure that all given agents have been created in the database. The missing agents are created at once.
+        """
+        with (yield self.session_lock.acquire()):
+            existing = yield data.Agent.query({"environment": env.id, "name": {"$in": list(nodenames)}})
+            known = set(agent.name for agent in existing)
+            missing = sorted(set(nodenames) - known)
+            if len(missing) == 0:
+                return
+
+            yield data.Agent.insert_many([data.Agent(environment=env.id, name=name, paused=False) for name in missing],
+                                         ordered=False)
+            yield self.verify_reschedule(env, missing)
+
     @gen.coroutine
     def create_default_agent(self, env: data.Environment, nodename: str):
         saved = data.Agent(environment=env.id, name=nodename, paused=False)
@@ -0,0 +1,138 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+
+import datetime
+import logging
+from collections import OrderedDict, defaultdict
+from uuid import UUID
+
+from inmanta import const
+from typing import Dict, List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AgentResourceCache(object):
+    """
+        Cache of the resources that are served to the agents by get_resources_for_agent. It holds the latest released
+        version of each environment and the serialized resources of each (environment, version, agent).
+
+        The cache of an environment is invalidated when a version is added, released or deleted. The status of the cached
+        resources is kept up to date with update_status, so a deploy does not invalidate the cache.
+
+        Reading from the database and storing the result is not atomic. A caller first takes a token with get_token and
+        passes it to the store methods. When the environment changed in between, the result is not stored.
+    """
+
+    def __init__(self) -> None:
+        # environment -> latest released version
+        self._latest = {}
+        # (environment, version, agent) -> (list of resource dicts, resource version id -> resource dict)
+        self._resources = {}
+        # environment -> number of changes, used to detect changes while reading from the database
+        self._generation = defaultdict(int)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_token(self, environment: UUID) -> int:
+        return self._generation[environment]
+
+    def invalidate(self, environment: UUID) -> None:
+        """
+            Drop all cached entries of the given environment
+        """
+        self._generation[environment] += 1
+        self._latest.pop(environment, None)
+        for key in [key for key in self._resources.keys() if key[0] == environment]:
+            del self._resources[key]
+
+    def get_latest_version(self, environment: UUID) -> Optional[int]:
+        return self._latest.get(environment)
+
+    def set_latest_version(self, environment: UUID, version: int, token: int) -> None:
+        if token == self._generation[environment]:
+            self._latest[environment] = version
+
+    def get_resources(self, environment: UUID, version: int, agent: str) -> Optional[List[dict]]:
+        """
+            Get the serialized resources of an agent in the given version or None when they are not cached
+        """
+        entry = self._resources.get((environment, version, agent))
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry[0]
+
+    def set_resources(self, environment: UUID, version: int, agent: str, resources: List[dict], token: int) -> None:
+        if token == self._generation[environment]:
+            self._resources[(environment, version, agent)] = (resources, {res["id"]: res for res in resources})
+
+    def update_status(self, environment: UUID, resources: List[Tuple[int, str, str]], status: const.ResourceState,
+                      last_deploy: datetime.datetime) -> None:
+        """
+            Update the status of resources that were deployed
+
+            :param resources: A list of (version, agent, resource version id) tuples
+        """
+        # a read of the database that is in progress may not see this update
+        self._generation[environment] += 1
+        for version, agent, resource_version_id in resources:
+            entry = self._resources.get((environment, version, agent))
+            if entry is not None and resource_version_id in entry[1]:
+                entry[1][resource_version_id]["status"] = status
+                entry[1][resource_version_id]["last_deploy"] = last_deploy
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._resources)}
+
+
+class CodeBundleCache(object):
+    """
+        Cache of the compressed code bundles that are served to the agents by get_code_bundle. A bundle is stored under the
+        hash of its content, so an entry never has to be invalidated. The least recently used bundles are dropped when the
+        cache holds more than max_entries bundles.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        # bundle hash -> compressed sources
+        self._bundles = OrderedDict()  # type: Dict[str, str]
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bundle_hash: str) -> Optional[str]:
+        if bundle_hash not in self._bundles:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._bundles.move_to_end(bundle_hash)
+        return self._bundles[bundle_hash]
+
+    def put(self, bundle_hash: str, bundle: str) -> None:
+        self._bundles[bundle_hash] = bundle
+        self._bundles.move_to_end(bundle_hash)
+        while len(self._bundles) > self._max_entries:
+            self._bundles.popitem(last=False)
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._bundles)}
@@ -104,6 +104,11 @@ server_wait_after_param = Option("server", "wait-after-param", 5,
 agent_timeout = Option("server", "agent-timeout", 30,
                        "Time before an agent is considered to be offline", is_time)
 
+server_compile_daemon = Option("server", "compile-daemon", False,
+                               "Run the compiler of each environment in a long lived process that keeps the project loaded "
+                               "between recompiles. Only files that changed since the previous compile are parsed again.",
+                               is_bool)
+
 server_delete_currupt_files = Option("server", "delete_currupt_files", True,
                                      "The server logs an error when it detects a file got corrupted. When set to true, the "
                                      "server will also delete the file, so on subsequent compiles the missing file will be "
@@ -0,0 +1,324 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import re
+import tempfile
+from collections import defaultdict
+
+import tornado.web
+
+from inmanta import config as inmanta_config, const
+from inmanta.protocol import UnauhorizedError, authorize_request, json_encode
+from inmanta.server import config as opt
+from inmanta.server.protocol import get_auth_token
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+HASH_RE = re.compile("^[0-9a-f]{40}$")
+# the number of characters of the hash that is used as the name of the directory a file is stored in
+SHARD_PREFIX_LENGTH = 2
+# the client types that are allowed to use the raw file routes, the same as the file methods of the api
+FILE_CLIENT_TYPES = ["api", "agent", "compiler"]
+
+
+def hash_file_at(path: str) -> str:
+    """
+        Hash the file at the given path without reading it in memory
+    """
+    sha1sum = hashlib.new("sha1")
+    with open(path, "rb") as fd:
+        if os.fstat(fd.fileno()).st_size > 0:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                sha1sum.update(content)
+
+    return sha1sum.hexdigest()
+
+
+class FileStore(object):
+    """
+        A content addressed store of files. A file is stored under the sha1 hash of its content in a directory named after
+        the first characters of that hash, so no directory grows to hold all files.
+
+        The content of a file is verified when it is written. On a read, the file is only hashed again when its size or
+        modification time differs from when it was last verified.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        # hash -> (size, mtime) of the file when it was last verified
+        self._verified = {}  # type: Dict[str, Tuple[int, int]]
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """
+            Move files that are stored in the root directory by an older version of the server to their shard
+        """
+        moved = 0
+        for name in os.listdir(self._root):
+            path = os.path.join(self._root, name)
+            if HASH_RE.match(name) and os.path.isfile(path):
+                os.makedirs(self._shard(name), exist_ok=True)
+                os.rename(path, self.get_path(name))
+                moved += 1
+
+        if moved > 0:
+            LOGGER.info("Moved %d files in %s to sharded directories", moved, self._root)
+
+    root = property(lambda self: self._root)
+
+    def _shard(self, file_hash: str) -> str:
+        return os.path.join(self._root, file_hash[:SHARD_PREFIX_LENGTH])
+
+    def get_path(self, file_hash: str) -> str:
+        """
+            Get the path on disk of the file with the given hash
+        """
+        if not HASH_RE.match(file_hash):
+            raise ValueError("%s is not a valid file hash" % file_hash)
+
+        return os.path.join(self._shard(file_hash), file_hash)
+
+    def exists(self, file_hash: str) -> bool:
+        if not HASH_RE.match(file_hash):
+            return False
+
+        return file_hash in self._verified or os.path.exists(self.get_path(file_hash))
+
+    def get_missing(self, file_hashes: Iterable[str]) -> List[str]:
+        """
+            Return the hashes of the files that are not in the store. This lists each shard that is involved once instead of
+            checking every file.
+        """
+        missing = []
+        per_shard = defaultdict(list)
+        for file_hash in file_hashes:
+            if not HASH_RE.match(file_hash):
+                missing.append(file_hash)
+            elif file_hash not in self._verified:
+                per_shard[file_hash[:SHARD_PREFIX_LENGTH]].append(file_hash)
+
+        for shard, shard_hashes in per_shard.items():
+            try:
+                present = set(os.listdir(os.path.join(self._root, shard)))
+            except FileNotFoundError:
+                present = set()
+
+            missing.extend(file_hash for file_hash in shard_hashes if file_hash not in present)
+
+        return missing
+
+    def _mark_verified(self, file_hash: str, path: str) -> None:
+        stat = os.stat(path)
+        self._verified[file_hash] = (stat.st_size, stat.st_mtime_ns)
+
+    def open_upload(self, file_hash: str):
+        """
+            Open a temporary file to write an upload to. The upload is added to the store with commit_upload.
+        """
+        shard = self._shard(file_hash)
+        os.makedirs(shard, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=shard, prefix=".upload-", delete=False)
+
+    def commit_upload(self, file_hash: str, tmp_path: str, actual_hash: str) -> None:
+        """
+            Move a completely written upload to its place in the store. The rename is atomic, so a file in the store is
+            always complete.
+
+            :param actual_hash: The hash of the content that was written to tmp_path
+        """
+        if actual_hash != file_hash:
+            os.remove(tmp_path)
+            raise ValueError("The hash does not match the content")
+
+        path = self.get_path(file_hash)
+        os.rename(tmp_path, path)
+        self._mark_verified(file_hash, path)
+
+    def put(self, file_hash: str, content: bytes) -> None:
+        """
+            Store the given content under its hash
+
+            :raises FileExistsError: The file is already stored
+            :raises ValueError: The hash does not match the content
+        """
+        if self.exists(file_hash):
+            raise FileExistsError("A file with this id already exists.")
+
+        actual_hash = hashlib.sha1(content).hexdigest()
+        if actual_hash != file_hash:
+            raise ValueError("The hash does not match the content")
+
+        with self.open_upload(file_hash) as fd:
+            fd.write(content)
+
+        self.commit_upload(file_hash, fd.name, actual_hash)
+
+    def verify(self, file_hash: str) -> Optional[str]:
+        """
+            Verify that the file with the given hash is not corrupt. The file is only hashed when it changed since the last
+            verification.
+
+            :return: None when the file is valid, otherwise a message that describes the problem. Depending on the
+                     delete_currupt_files option a corrupt file is removed from the store.
+        """
+        path = self.get_path(file_hash)
+        stat = os.stat(path)
+        if self._verified.get(file_hash) == (stat.st_size, stat.st_mtime_ns):
+            return None
+
+        actual_hash = hash_file_at(path)
+        if actual_hash == file_hash:
+            self._verified[file_hash] = (stat.st_size, stat.st_mtime_ns)
+            return None
+
+        self._verified.pop(file_hash, None)
+        if not opt.server_delete_currupt_files.get():
+            LOGGER.error("File corrupt, expected hash %s but found %s at %s" % (file_hash, actual_hash, path))
+            return ("File corrupt, expected hash %s but found %s,"
+                    " please contact the server administrator") % (file_hash, actual_hash)
+
+        LOGGER.error("File corrupt, expected hash %s but found %s at %s, Deleting file" % (file_hash, actual_hash, path))
+        try:
+            os.remove(path)
+        except OSError:
+            LOGGER.exception("Failed to delete file %s" % (path))
+            return ("File corrupt, expected hash %s but found %s,"
+                    " Failed to delete file, please contact the server administrator") % (file_hash, actual_hash)
+
+        return ("File corrupt, expected hash %s but found %s, "
+                "Deleting file, please re-upload the corrupt file") % (file_hash, actual_hash)
+
+    def read(self, file_hash: str) -> bytes:
+        """
+            Read the content of a file. Call verify first to check the content.
+        """
+        with open(self.get_path(file_hash), "rb") as fd:
+            return fd.read()
+
+    def get_handlers(self, location: str) -> List[tuple]:
+        """
+            The handlers that serve the raw content of the files in this store under the given location
+        """
+        return [(r"%s/([0-9a-f]{40})" % location, FileHandler, {"store": self})]
+
+
+def authorize_file_request(handler: tornado.web.RequestHandler) -> None:
+    """
+        Apply the same authorization to the raw file routes as to the file methods of the api
+    """
+    if not inmanta_config.Config.get("server", "auth", False):
+        return
+
+    try:
+        auth_token = get_auth_token(handler.request.headers)
+        if auth_token is None:
+            raise tornado.web.HTTPError(401, "Access to this resource is unauthorized.")
+
+        authorize_request(auth_token, {const.INMANTA_URN + "env": "all"}, {}, ({"client_types": FILE_CLIENT_TYPES},))
+    except UnauhorizedError as e:
+        raise tornado.web.HTTPError(403, "Access denied: " + e.args[0])
+
+
+@tornado.web.stream_request_body
+class FileHandler(tornado.web.StaticFileHandler):
+    """
+        Serve the raw content of a file with GET and HEAD and accept the raw content of a new file with PUT. Downloads
+        are streamed from disk in chunks and support range requests. Uploads are hashed and written to disk while they
+        are received.
+    """
+
+    def initialize(self, store: FileStore) -> None:
+        super().initialize(path=store.root)
+        self._store = store
+        self._upload = None
+        self._upload_hash = None
+
+    def prepare(self) -> None:
+        authorize_file_request(self)
+
+        if self.request.method == "PUT":
+            file_hash = self.path_args[0]
+            if self._store.exists(file_hash):
+                raise tornado.web.HTTPError(500, "A file with this id already exists.")
+
+            self._upload = self._store.open_upload(file_hash)
+            self._upload_hash = hashlib.sha1()
+
+    def data_received(self, chunk: bytes) -> None:
+        if self._upload is not None:
+            self._upload.write(chunk)
+            self._upload_hash.update(chunk)
+
+    def put(self, file_hash: str) -> None:
+        self._upload.close()
+        try:
+            self._store.commit_upload(file_hash, self._upload.name, self._upload_hash.hexdigest())
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        finally:
+            self._upload = None
+
+        self.set_status(200)
+
+    def _discard_upload(self) -> None:
+        if self._upload is not None:
+            self._upload.close()
+            os.remove(self._upload.name)
+            self._upload = None
+
+    def on_connection_close(self) -> None:
+        self._discard_upload()
+
+    def on_finish(self) -> None:
+        self._discard_upload()
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        message = self._reason
+        if "exc_info" in kwargs:
+            exception = kwargs["exc_info"][1]
+            if isinstance(exception, tornado.web.HTTPError) and exception.log_message:
+                message = exception.log_message
+
+        self.set_header("Content-Type", "application/json")
+        self.finish(json_encode({"message": message}))
+
+    def get_absolute_path(self, root: str, path: str) -> str:
+        return self._store.get_path(path)
+
+    def validate_absolute_path(self, root: str, absolute_path: str) -> str:
+        if not os.path.isfile(absolute_path):
+            raise tornado.web.HTTPError(404)
+
+        error = self._store.verify(os.path.basename(absolute_path))
+        if error is not None:
+            raise tornado.web.HTTPError(500, error)
+
+        return absolute_path
+
+    def get_content_type(self) -> str:
+        return "application/octet-stream"
+
+    @classmethod
+    def get_content_version(cls, abspath: str) -> str:
+        # the content is addressed by its hash
+        return os.path.basename(abspath)
@@ -16,7 +16,7 @@
     Contact: code@inmanta.com
 """
 from inmanta.util import Scheduler
-from inmanta.protocol import RESTBase, decode_token, json_encode, UnauhorizedError, ReturnClient, handle
+from inmanta.protocol import RESTBase, ArgumentBinder, decode_token, json_encode, UnauhorizedError, ReturnClient, handle
 
 from inmanta import config as inmanta_config, methods
 from inmanta.server import config as opt, SLICE_SESSION_MANAGER
@@ -85,13 +85,15 @@ class RESTServer(RESTBase):
                         if "header" in opts:
                             self.headers.add(opts["header"])
 
+                binder = ArgumentBinder.get(properties, method.__wrapped__)
+
                 url = self._create_base_url(properties)
                 properties["api_version"] = "1"
-                url_map[url][properties["operation"]] = (properties, call, method.__wrapped__)
+                url_map[url][properties["operation"]] = (properties, call, method.__wrapped__, binder)
                 url = self._create_base_url(properties, versioned=False)
                 properties = properties.copy()
                 properties["api_version"] = None
-                url_map[url][properties["operation"]] = (properties, call, method.__wrapped__)
+                url_map[url][properties["operation"]] = (properties, call, method.__wrapped__, binder)
         return url_map
 
     def start(self):
@@ -469,6 +471,22 @@ class SessionManager(ServerSlice):
             LOGGER.warning("could not deliver agent reply with sid=%s and reply_id=%s" % (sid, reply_id), exc_info=True)
 
 
+def get_auth_token(headers: dict):
+    """
+        Get the auth token provided by the caller. The token is provided as a bearer token.
+    """
+    if "Authorization" not in headers:
+        return None
+
+    parts = headers["Authorization"].split(" ")
+    if len(parts) == 0 or parts[0].lower() != "bearer" or len(parts) > 2 or len(parts) == 1:
+        LOGGER.warning("Invalid authentication header, Inmanta expects a bearer token. (%s was provided)",
+                       headers["Authorization"])
+        return None
+
+    return decode_token(parts[1])
+
+
 class RESTHandler(tornado.web.RequestHandler):
     """
         A generic class use by the transport
@@ -489,19 +507,7 @@ class RESTHandler(tornado.web.RequestHandler):
         return self._config[http_method]
 
     def get_auth_token(self, headers: dict):
-        """
-            Get the auth token provided by the caller. The token is provided as a bearer token.
-        """
-        if "Authorization" not in headers:
-            return None
-
-        parts = headers["Authorization"].split(" ")
-        if len(parts) == 0 or parts[0].lower() != "bearer" or len(parts) > 2 or len(parts) == 1:
-            LOGGER.warning("Invalid authentication header, Inmanta expects a bearer token. (%s was provided)",
-                           headers["Authorization"])
-            return None
-
-        return decode_token(parts[1])
+        return get_auth_token(headers)
 
     def respond(self, body, headers, status):
         if body is not None:
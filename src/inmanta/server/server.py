@@ -20,6 +20,7 @@ import base64
 from collections import defaultdict
 import datetime
 import difflib
+import hashlib
 import logging
 import os
 import re
@@ -39,12 +40,15 @@ from tornado import process
 from inmanta import const
 from inmanta import data, config
 from inmanta import methods
+from inmanta.compiledaemon import CompileDaemonClient
 from inmanta.server import protocol, SLICE_SERVER
+from inmanta.server.cache import AgentResourceCache, CodeBundleCache
+from inmanta.server.filestore import FileStore
 from inmanta.ast import type
 from inmanta.resources import Id
 from inmanta.server import config as opt
 import json
-from inmanta.util import hash_file
+from inmanta.util import compress_payload, hash_file, hash_resource_attributes
 from inmanta.const import UNDEPLOYABLE_STATES
 from inmanta.protocol import encode_token
 
@@ -52,6 +56,17 @@ LOGGER = logging.getLogger(__name__)
 agent_lock = locks.Lock()
 
 DBLIMIT = 100000
+# the number of code bundles the server keeps in memory
+CODE_BUNDLE_CACHE_SIZE = 10
+
+
+def parse_fields(fields):
+    """
+        Parse the comma separated list of fields the list methods accept
+    """
+    if fields is None:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip() != ""]
 
 
 class Server(protocol.ServerSlice):
@@ -65,6 +80,8 @@ class Server(protocol.ServerSlice):
         LOGGER.info("Starting server endpoint")
 
         self._server_storage = self.check_storage()
+        self._file_store = FileStore(self._server_storage["files"])
+        self._handlers.extend(self._file_store.get_handlers("/api/v1/filestore"))
         self._agent_no_log = agent_no_log
 
         self._db = None
@@ -78,6 +95,9 @@ class Server(protocol.ServerSlice):
         LOGGER.info("Connected to mongodb database %s on %s:%d", opt.db_name.get(), database_host, database_port)
 
         self._io_loop.add_callback(data.create_indexes)
+        # status updates wait for the migration, it recomputes the done counter of the versions it migrates
+        self._migrated = locks.Event()
+        self._io_loop.add_callback(self._migrate_embedded_results)
 
         self._fact_expire = opt.server_fact_expire.get()
         self._fact_renew = opt.server_fact_renew.get()
@@ -88,6 +108,9 @@ class Server(protocol.ServerSlice):
         self._io_loop.add_callback(self._purge_versions)
 
         self._recompiles = defaultdict(lambda: None)
+        self._compile_daemons = {}
+        self._resource_cache = AgentResourceCache()
+        self._code_bundles = CodeBundleCache(CODE_BUNDLE_CACHE_SIZE)
 
         self.setup_dashboard()
         self.dryrun_lock = locks.Lock()
@@ -100,6 +123,9 @@ class Server(protocol.ServerSlice):
 
     def stop(self):
         super().stop()
+        for daemon in self._compile_daemons.values():
+            daemon.stop()
+        self._compile_daemons = {}
 
     def get_agent_client(self, tid: UUID, endpoint):
         return self.agentmanager.get_agent_client(tid, endpoint)
@@ -141,6 +167,15 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         self.add_static_content("/dashboard/config.js", content=content)
         self.add_static_handler("/dashboard", dashboard_path, start=True)
 
+    @gen.coroutine
+    def _migrate_embedded_results(self):
+        try:
+            yield data.migrate_embedded_results()
+        except Exception:
+            LOGGER.exception("Failed to migrate the embedded resource status and dryrun results")
+        finally:
+            self._migrated.set()
+
     @gen.coroutine
     def _purge_versions(self):
         """
@@ -160,6 +195,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
                 for v in delete_list:
                     yield version_dict[v].delete_cascade()
+                self._resource_cache.invalidate(env_item.id)
 
     def check_storage(self):
         """
@@ -365,15 +401,38 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         return 200
 
+    @gen.coroutine
+    def _get_page(self, document_type, query, sort, start, limit, after, fields):
+        """
+            Get a page of documents for a list method
+
+            :return: A tuple with the documents and a dict with the paging information for the reply
+            :raises ValueError: The paging arguments are not valid
+        """
+        if start is None:
+            start = 0
+        if limit is None:
+            limit = data.DBLIMIT
+
+        documents, next_key = yield document_type.get_page(query, sort=sort, start=start, limit=limit, after=after,
+                                                           fields=parse_fields(fields))
+        return documents, {"start": start, "limit": limit, "count": len(documents), "next": next_key}
+
     @protocol.handle(methods.ParameterMethod.list_params, env="tid")
     @gen.coroutine
-    def list_param(self, env, query):
+    def list_param(self, env, query, start=None, limit=None, after=None, fields=None):
         m_query = {"environment": env.id}
         for k, v in query.items():
             m_query["metadata." + k] = v
 
-        params = yield data.Parameter.get_list(**m_query)
-        return 200, {"parameters": params, "expire": self._fact_expire, "now": datetime.datetime.now().isoformat()}
+        try:
+            params, page = yield self._get_page(data.Parameter, m_query, [("name", pymongo.ASCENDING)], start, limit, after,
+                                                fields)
+        except ValueError as e:
+            return 400, {"message": str(e)}
+
+        page.update({"parameters": params, "expire": self._fact_expire, "now": datetime.datetime.now().isoformat()})
+        return 200, page
 
     @protocol.handle(methods.FormMethod.put_form, form_id="id", env="tid")
     @gen.coroutine
@@ -524,25 +583,19 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         return self.upload_file_internal(file_hash, content)
 
     def upload_file_internal(self, file_hash, content):
-        file_name = os.path.join(self._server_storage["files"], file_hash)
-
-        if os.path.exists(file_name):
-            return 500, {"message": "A file with this id already exists."}
-
-        if hash_file(content) != file_hash:
-            return 400, {"message": "The hash does not match the content"}
-
-        with open(file_name, "wb+") as fd:
-            fd.write(content)
+        try:
+            self._file_store.put(file_hash, content)
+        except FileExistsError as e:
+            return 500, {"message": str(e)}
+        except ValueError as e:
+            return 400, {"message": str(e)}
 
         return 200
 
     @protocol.handle(methods.FileMethod.stat_file, file_hash="id")
     @gen.coroutine
     def stat_file(self, file_hash):
-        file_name = os.path.join(self._server_storage["files"], file_hash)
-
-        if os.path.exists(file_name):
+        if self._file_store.exists(file_hash):
             return 200
         else:
             return 404
@@ -558,35 +611,14 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
     def get_file_internal(self, file_hash):
         """get_file, but on return code 200, content is not encoded """
+        if not self._file_store.exists(file_hash):
+            return 404, {"message": "The file with hash %s does not exist" % file_hash}
 
-        file_name = os.path.join(self._server_storage["files"], file_hash)
-
-        if not os.path.exists(file_name):
-            return 404
+        error = self._file_store.verify(file_hash)
+        if error is not None:
+            return 500, {"message": error}
 
-        else:
-            with open(file_name, "rb") as fd:
-                content = fd.read()
-                actualhash = hash_file(content)
-                if actualhash != file_hash:
-                    if opt.server_delete_currupt_files.get():
-                        LOGGER.error("File corrupt, expected hash %s but found %s at %s, Deleting file" %
-                                     (file_hash, actualhash, file_name))
-                        try:
-                            os.remove(file_name)
-                        except OSError:
-                            LOGGER.exception("Failed to delete file %s" % (file_name))
-                            return 500, {"message": ("File corrupt, expected hash %s but found %s,"
-                                                     " Failed to delete file, please contact the server administrator"
-                                                     ) % (file_hash, actualhash)}
-                        return 500, {"message": ("File corrupt, expected hash %s but found %s, "
-                                                 "Deleting file, please re-upload the corrupt file"
-                                                 ) % (file_hash, actualhash)}
-                    else:
-                        LOGGER.error("File corrupt, expected hash %s but found %s at %s" % (file_hash, actualhash, file_name))
-                        return 500, {"message": ("File corrupt, expected hash %s but found %s,"
-                                                 " please contact the server administrator") % (file_hash, actualhash)}
-                return 200, content
+        return 200, self._file_store.read(file_hash)
 
     @protocol.handle(methods.FileMethod.stat_files)
     @gen.coroutine
@@ -594,13 +626,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         """
             Return which files in the list exist on the server
         """
-        response = []
-        for f in files:
-            f_path = os.path.join(self._server_storage["files"], f)
-            if not os.path.exists(f_path):
-                response.append(f)
-
-        return 200, {"files": response}
+        return 200, {"files": self._file_store.get_missing(files)}
 
     @protocol.handle(methods.FileDiff.diff)
     @gen.coroutine
@@ -611,9 +637,9 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         if a == "" or a == "0":
             a_lines = []
         else:
-            a_path = os.path.join(self._server_storage["files"], a)
-            if not os.path.exists(a_path):
+            if not self._file_store.exists(a):
                 return 404
+            a_path = self._file_store.get_path(a)
 
             with open(a_path, "r") as fd:
                 a_lines = fd.readlines()
@@ -621,9 +647,9 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         if b == "" or b == "0":
             b_lines = []
         else:
-            b_path = os.path.join(self._server_storage["files"], b)
-            if not os.path.exists(b_path):
+            if not self._file_store.exists(b):
                 return 404
+            b_path = self._file_store.get_path(b)
 
             with open(b_path, "r") as fd:
                 b_lines = fd.readlines()
@@ -657,28 +683,51 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
     @protocol.handle(methods.ResourceMethod.get_resources_for_agent, env="tid")
     @gen.coroutine
-    def get_resources_for_agent(self, env, agent, version):
+    def get_resources_for_agent(self, env, agent, version, since_version):
         started = datetime.datetime.now()
+        token = self._resource_cache.get_token(env.id)
         if version is None:
-            cm = yield data.ConfigurationModel.get_latest_version(env.id)
-            if cm is None:
-                return 404, {"message": "No version available"}
+            version = self._resource_cache.get_latest_version(env.id)
+            if version is None:
+                cm = yield data.ConfigurationModel.get_latest_version(env.id)
+                if cm is None:
+                    return 404, {"message": "No version available"}
 
-            version = cm.version
+                version = cm.version
+                self._resource_cache.set_latest_version(env.id, version, token)
 
-        else:
+        deploy_model = self._resource_cache.get_resources(env.id, version, agent)
+        if deploy_model is None:
             cm = yield data.ConfigurationModel.get_version(environment=env.id, version=version)
             if cm is None:
                 return 404, {"message": "The given version does not exist"}
 
-        deploy_model = []
-
-        resources = yield data.Resource.get_resources_for_version(env.id, version, agent)
+            resources = yield data.Resource.get_resources_for_version(env.id, version, agent)
+            deploy_model = [rv.to_dict() for rv in resources]
+            self._resource_cache.set_resources(env.id, version, agent, deploy_model, token)
+
+        resource_ids = [rv["id"] for rv in deploy_model]
+        reply = {"environment": env.id, "agent": agent, "version": version, "resources": deploy_model}
+
+        if since_version is not None and since_version != version:
+            previous = self._resource_cache.get_resources(env.id, since_version, agent)
+            if previous is None:
+                previous = yield data.Resource.get_resources_for_version(env.id, since_version, agent,
+                                                                         include_attributes=False, no_obj=True)
+
+            if len(previous) > 0:
+                previous_hashes = {res["resource_id"]: res.get("attribute_hash") for res in previous}
+                changed = []
+                unchanged = []
+                for res in deploy_model:
+                    previous_hash = previous_hashes.pop(res["resource_id"], None)
+                    if previous_hash is not None and previous_hash == res.get("attribute_hash"):
+                        unchanged.append({"id": res["id"], "status": res["status"]})
+                    else:
+                        changed.append(res)
 
-        resource_ids = []
-        for rv in resources:
-            deploy_model.append(rv.to_dict())
-            resource_ids.append(rv.resource_version_id)
+                reply.update(since_version=since_version, resources=changed, unchanged=unchanged,
+                             removed=list(previous_hashes.keys()))
 
         now = datetime.datetime.now()
         ra = data.ResourceAction(environment=env.id, resource_version_ids=resource_ids, action=const.ResourceAction.pull,
@@ -688,29 +737,21 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
                                                             agent=agent)])
         yield ra.insert()
 
-        return 200, {"environment": env.id, "agent": agent, "version": version, "resources": deploy_model}
+        return 200, reply
 
     @protocol.handle(methods.VersionMethod.list_versions, env="tid")
     @gen.coroutine
-    def list_version(self, env, start=None, limit=None):
-        if (start is None and limit is not None) or (limit is None and start is not None):
+    def list_version(self, env, start=None, limit=None, after=None, fields=None):
+        if after is None and ((start is None and limit is not None) or (limit is None and start is not None)):
             return 500, {"message": "Start and limit should always be set together."}
 
-        if start is None:
-            start = 0
-            limit = data.DBLIMIT
-
-        models = yield data.ConfigurationModel.get_versions(env.id, start, limit)
-        count = len(models)
-
-        d = {"versions": models}
-
-        if start is not None:
-            d["start"] = start
-            d["limit"] = limit
-
-        d["count"] = count
+        try:
+            models, d = yield self._get_page(data.ConfigurationModel, {"environment": env.id},
+                                             [("version", pymongo.DESCENDING)], start, limit, after, fields)
+        except ValueError as e:
+            return 400, {"message": str(e)}
 
+        d["versions"] = models
         return 200, d
 
     @protocol.handle(methods.VersionMethod.get_version, version_id="id", env="tid")
@@ -726,18 +767,33 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         d = {"model": version}
 
-        d["resources"] = []
-        for res_dict in resources:
-            if bool(include_logs):
-                res_dict["actions"] = yield data.ResourceAction.get_log(env.id, res_dict["resource_version_id"],
-                                                                        log_filter, limit)
+        if bool(include_logs):
+            logs = yield data.ResourceAction.get_logs_for_version(env.id, [x["resource_version_id"] for x in resources],
+                                                                  log_filter, limit)
+            for res_dict in resources:
+                res_dict["actions"] = logs[res_dict["resource_version_id"]]
 
-            d["resources"].append(res_dict)
+        d["resources"] = resources
 
         d["unknowns"] = yield data.UnknownParameter.get_list(environment=env.id, version=version_id)
 
         return 200, d
 
+    @protocol.handle(methods.VersionStatusMethod.get_version_status, version_id="id", env="tid")
+    @gen.coroutine
+    def get_version_status(self, env, version_id, start=None, limit=None):
+        version = yield data.ConfigurationModel.get_version(env.id, version_id)
+        if version is None:
+            return 404, {"message": "The given configuration model does not exist yet."}
+
+        if start is None:
+            start = 0
+        if limit is None:
+            limit = data.DBLIMIT
+
+        status = yield version.get_resource_status(start, limit)
+        return 200, {"model": version, "status": status, "start": start, "limit": limit, "count": len(status)}
+
     @protocol.handle(methods.VersionMethod.delete_version, version_id="id", env="tid")
     @gen.coroutine
     def delete_version(self, env, version_id):
@@ -746,12 +802,22 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             return 404, {"message": "The given configuration model does not exist yet."}
 
         yield version.delete_cascade()
+        self._resource_cache.invalidate(env.id)
         return 200
 
     @protocol.handle(methods.VersionMethod.put_version, env="tid")
     @gen.coroutine
     def put_version(self, env, version, resources, resource_state, unknowns, version_info):
         started = datetime.datetime.now()
+        # duration of each stage of storing the version
+        timings = []
+        stage_start = time.time()
+
+        def end_stage(name):
+            nonlocal stage_start
+            now = time.time()
+            timings.append((name, now - stage_start))
+            stage_start = now
 
         agents = set()
         # lookup for all RV's, lookup by resource id
@@ -819,7 +885,9 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         metadata = safe_get(version_info, const.EXPORT_META_DATA, {})
         compile_state = safe_get(metadata, const.META_DATA_COMPILE_STATE, "")
         failed = compile_state == const.Compilestate.failed.name
+        end_stage("build")
 
+        resources_to_purge = []
         if not failed:
             # search for deleted resources
             resources_to_purge = yield data.Resource.get_deleted_resources(env.id, version, set(rv_dict.keys()))
@@ -850,6 +918,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
                         req_res.attributes["requires"].append(res_obj.resource_version_id)
                         res_obj.provides.append(req_res.resource_version_id)
+        end_stage("purge")
 
         undeployable = [res.resource_id for res in undeployable]
         # get skipped for undeployable
@@ -872,9 +941,16 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         except pymongo.errors.DuplicateKeyError:
             return 500, {"message": "The given version is already defined. Versions should be unique."}
 
-        yield data.Resource.insert_many(resource_objects)
+        for res_obj in resource_objects:
+            res_obj.attribute_hash = hash_resource_attributes(res_obj.attributes)
+        end_stage("graph")
+
+        yield data.Resource.insert_many(resource_objects, ordered=False)
         yield cm.update_fields(total=cm.total + len(resources_to_purge))
+        self._resource_cache.invalidate(env.id)
+        end_stage("resources")
 
+        unknown_objects = []
         for uk in unknowns:
             if "resource" not in uk:
                 uk["resource"] = ""
@@ -882,20 +958,22 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             if "metadata" not in uk:
                 uk["metadata"] = {}
 
-            up = data.UnknownParameter(resource_id=uk["resource"], name=uk["parameter"],
-                                       source=uk["source"], environment=env.id,
-                                       version=version, metadata=uk["metadata"])
-            yield up.insert()
-
-        for agent in agents:
-            yield self.agentmanager.ensure_agent_registered(env, agent)
+            unknown_objects.append(data.UnknownParameter(resource_id=uk["resource"], name=uk["parameter"],
+                                                         source=uk["source"], environment=env.id,
+                                                         version=version, metadata=uk["metadata"]))
 
         ra = data.ResourceAction(environment=env.id, resource_version_ids=resource_version_ids, action_id=uuid.uuid4(),
                                  action=const.ResourceAction.store, started=started, finished=datetime.datetime.now(),
                                  messages=[data.LogLine.log(logging.INFO, "Successfully stored version %(version)d",
                                                             version=version)])
-        yield ra.insert()
-        LOGGER.debug("Successfully stored version %d", version)
+
+        yield [data.UnknownParameter.insert_many(unknown_objects, ordered=False),
+               self.agentmanager.ensure_agents_registered(env, agents),
+               ra.insert()]
+        end_stage("unknowns, agents and log")
+
+        LOGGER.debug("Successfully stored version %d with %d resources (%s)", version, len(resource_objects),
+                     ", ".join("%s: %.3fs" % timing for timing in timings))
 
         auto_deploy = yield env.get(data.AUTO_DEPLOY)
         if auto_deploy:
@@ -913,6 +991,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             return 404, {"message": "The request version does not exist."}
 
         yield model.update_fields(released=True, result=const.VersionState.deploying)
+        self._resource_cache.invalidate(env.id)
 
         # Already mark undeployable resources as deployed to create a better UX (change the version counters)
         undep = yield model.get_undeployable()
@@ -979,28 +1058,26 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             undeployableids = [rid + ",v=%s" % version_id for rid in undeployableids]
             undeployable = yield data.Resource.get_resources(environment=env.id,
                                                              resource_version_ids=undeployableids)
-            for res in undeployable:
-                payload = {"changes": {}, "id_fields": {"entity_type": res.resource_type, "agent_name": res.agent,
-                                                        "attribute": res.id_attribute_name,
-                                                        "attribute_value": res.id_attribute_value,
-                                                        "version": res.model}, "id": res.resource_version_id}
-                yield data.DryRun.update_resource(dryrun.id, res.resource_version_id, payload)
 
             skipundeployableids = yield model.get_skipped_for_undeployable()
             skipundeployableids = [rid + ",v=%s" % version_id for rid in skipundeployableids]
             skipundeployable = yield data.Resource.get_resources(environment=env.id, resource_version_ids=skipundeployableids)
-            for res in skipundeployable:
-                payload = {"changes": {}, "id_fields": {"entity_type": res.resource_type, "agent_name": res.agent,
-                                                        "attribute": res.id_attribute_name,
-                                                        "attribute_value": res.id_attribute_value,
-                                                        "version": res.model}, "id": res.resource_version_id}
-                yield data.DryRun.update_resource(dryrun.id, res.resource_version_id, payload)
+
+            payloads = {}
+            for res in undeployable + skipundeployable:
+                payloads[res.resource_version_id] = {"changes": {},
+                                                     "id_fields": {"entity_type": res.resource_type, "agent_name": res.agent,
+                                                                   "attribute": res.id_attribute_name,
+                                                                   "attribute_value": res.id_attribute_value,
+                                                                   "version": res.model},
+                                                     "id": res.resource_version_id}
+            yield data.DryRun.update_resources(dryrun.id, payloads)
 
         return 200, {"dryrun": dryrun}
 
     @protocol.handle(methods.DryRunMethod.dryrun_list, env="tid")
     @gen.coroutine
-    def dryrun_list(self, env, version=None):
+    def dryrun_list(self, env, version=None, start=None, limit=None, after=None):
         query_args = {}
         query_args["environment"] = env.id
         if version is not None:
@@ -1010,19 +1087,30 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
             query_args["model"] = version
 
-        dryruns = yield data.DryRun.get_list(**query_args)
+        try:
+            dryruns, page = yield self._get_page(data.DryRun, query_args, [("date", pymongo.DESCENDING)], start, limit,
+                                                 after, None)
+        except ValueError as e:
+            return 400, {"message": str(e)}
 
-        return 200, {"dryruns": [{"id": x.id, "version": x.model, "date": x.date, "total": x.total, "todo": x.todo}
-                                 for x in dryruns]}
+        page["dryruns"] = [x.get_progress() for x in dryruns]
+        return 200, page
 
     @protocol.handle(methods.DryRunMethod.dryrun_report, dryrun_id="id", env="tid")
     @gen.coroutine
-    def dryrun_report(self, env, dryrun_id):
+    def dryrun_report(self, env, dryrun_id, start=None, limit=None):
         dryrun = yield data.DryRun.get_by_id(dryrun_id)
         if dryrun is None:
             return 404, {"message": "The given dryrun does not exist!"}
 
-        return 200, {"dryrun": dryrun}
+        if start is None:
+            start = 0
+        if limit is None:
+            limit = data.DBLIMIT
+
+        report = dryrun.to_dict()
+        report["resources"] = yield dryrun.get_resources(start, limit)
+        return 200, {"dryrun": report, "start": start, "limit": limit, "count": len(report["resources"])}
 
     @protocol.handle(methods.DryRunMethod.dryrun_update, dryrun_id="id", env="tid")
     @gen.coroutine
@@ -1033,6 +1121,20 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         return 200
 
+    @protocol.handle(methods.DryRunBatchedMethod.dryrun_update_batched, dryrun_id="id", env="tid")
+    @gen.coroutine
+    def dryrun_update_batched(self, env, dryrun_id, resources):
+        try:
+            payloads = {resource: {"changes": changes, "id_fields": Id.parse_id(resource).to_dict(), "id": resource}
+                        for resource, changes in resources.items()}
+        except Exception as e:
+            return 400, {"message": "Invalid resource id: %s" % e}
+
+        with (yield self.dryrun_lock.acquire()):
+            yield data.DryRun.update_resources(dryrun_id, payloads)
+
+        return 200
+
     @protocol.handle(methods.CodeMethod.upload_code, code_id="id", env="tid")
     @gen.coroutine
     def upload_code(self, env, code_id, resource, sources):
@@ -1130,6 +1232,50 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         return 200, {"version": code_id, "environment": env.id, "resource": resource, "sources": sources}
 
+    @protocol.handle(methods.CodeBundleMethod.get_code_bundle, code_id="id", env="tid")
+    @gen.coroutine
+    def get_code_bundle(self, env, code_id, code_hash=None):
+        codes = yield data.Code.get_versions(environment=env.id, version=code_id)
+
+        # the hash of the bundle is computed from the code documents, so the files are only read when the bundle is sent
+        resources = {}
+        manifest = {}
+        for code in codes:
+            keys = []
+            if code.sources is not None:
+                keys.extend(code.sources.keys())
+                manifest.update(code.sources)
+            if code.source_refs is not None:
+                keys.extend(code.source_refs.keys())
+                manifest.update(code.source_refs)
+            resources[code.resource] = sorted(keys)
+
+        bundle_hash = hashlib.sha1(json.dumps([resources, manifest], sort_keys=True).encode()).hexdigest()
+        if bundle_hash == code_hash:
+            return 200, {"version": code_id, "hash": bundle_hash, "unchanged": True}
+
+        bundle = self._code_bundles.get(bundle_hash)
+        if bundle is None:
+            sources = {}
+            for code in codes:
+                if code.sources is not None:
+                    sources.update(code.sources)
+
+                if code.source_refs is not None:
+                    for file_hash, (file_name, module, req) in code.source_refs.items():
+                        if file_hash in sources:
+                            continue
+
+                        ret, c = self.get_file_internal(file_hash)
+                        if ret != 200:
+                            return ret, c
+                        sources[file_hash] = (file_name, module, c.decode(), req)
+
+            bundle = compress_payload(sources)
+            self._code_bundles.put(bundle_hash, bundle)
+
+        return 200, {"version": code_id, "hash": bundle_hash, "unchanged": False, "resources": resources, "sources": bundle}
+
     @protocol.handle(methods.ResourceMethod.resource_action_update, env="tid")
     @gen.coroutine
     def resource_action_update(self, env, resource_ids, action_id, action, started, finished, status, messages, changes,
@@ -1185,6 +1331,9 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         if done and action in const.STATE_UPDATE:
             model_version = None
+            self._resource_cache.update_status(env.id, [(res.model, res.agent, res.resource_version_id) for res in resources],
+                                               status, finished)
+            yield self._migrated.wait()
             for res in resources:
                 yield res.update_fields(last_deploy=finished, status=status)
                 yield data.ConfigurationModel.set_ready(env.id, res.model, res.id, res.resource_id, status)
@@ -1196,11 +1345,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             model = yield data.ConfigurationModel.get_version(env.id, model_version)
 
             if model.done == model.total:
-                result = const.VersionState.success
-                for state in model.status.values():
-                    if state["status"] != "deployed":
-                        result = const.VersionState.failed
-
+                result = yield model.get_deploy_result()
                 yield model.update_fields(deployed=True, result=result)
 
             waiting_agents = set([(Id.parse_id(prov).get_agent_name(), res.resource_version_id)
@@ -1213,6 +1358,129 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
         return 200
 
+    def _parse_finished_action(self, action):
+        """
+            Convert a finished resource action, as received by resource_action_update_batched, to the arguments of
+            resource_action_update
+        """
+        def parse_date(value):
+            if isinstance(value, datetime.datetime):
+                return value
+            return dateutil.parser.parse(value)
+
+        change = action.get("change")
+        return dict(resource_ids=[str(x) for x in action["resource_ids"]],
+                    action_id=uuid.UUID(str(action["action_id"])),
+                    action=const.ResourceAction[action["action"]],
+                    started=parse_date(action["started"]),
+                    finished=parse_date(action["finished"]),
+                    status=const.ResourceState[action["status"]],
+                    messages=list(action.get("messages", [])),
+                    changes=dict(action.get("changes", {})),
+                    change=const.Change[change] if change is not None else None,
+                    send_events=config.is_bool(action.get("send_events", False)))
+
+    @protocol.handle(methods.ResourceActionBatchedMethod.resource_action_update_batched, env="tid")
+    @gen.coroutine
+    def resource_action_update_batched(self, env, actions):
+        results = [None] * len(actions)
+
+        parsed = []
+        for i, action in enumerate(actions):
+            try:
+                parsed.append((i, self._parse_finished_action(action)))
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                results[i] = {"code": 500, "message": "Invalid resource action: %s" % e}
+
+        # actions that were already (partially) reported take the regular path
+        action_ids = [a["action_id"] for _, a in parsed]
+        existing = yield data.ResourceAction.query({"environment": env.id, "action_id": {"$in": action_ids}})
+        existing = set(x.action_id for x in existing)
+
+        resource_ids = set(rid for _, a in parsed for rid in a["resource_ids"])
+        resources = yield data.Resource.get_resources(env.id, list(resource_ids))
+        resources = {res.resource_version_id: res for res in resources}
+
+        new_actions = []
+        for i, action in parsed:
+            if action["action_id"] in existing:
+                result = yield self.resource_action_update(env, **action)
+                if isinstance(result, tuple):
+                    results[i] = {"code": result[0], "message": result[1]["message"]}
+                else:
+                    results[i] = {"code": result}
+                continue
+
+            action_resources = [resources[rid] for rid in action["resource_ids"] if rid in resources]
+            if len(action_resources) == 0 or len(action_resources) != len(action["resource_ids"]):
+                results[i] = {"code": 404, "message": "The resources with the given ids do not exist in the given environment. "
+                              "Only %s of %s resources found." % (len(action_resources), len(action["resource_ids"]))}
+                continue
+
+            if (action["status"] not in UNDEPLOYABLE_STATES and
+                    any([res.status in UNDEPLOYABLE_STATES for res in action_resources])):
+                LOGGER.error("Attempting to set undeployable resource to deployable state")
+                results[i] = {"code": 500, "message": "Attempting to set undeployable resource to deployable state"}
+                continue
+
+            new_actions.append((i, action, action_resources))
+
+        yield data.ResourceAction.insert_many([data.ResourceAction(environment=env.id,
+                                                                   resource_version_ids=action["resource_ids"],
+                                                                   action_id=action["action_id"], action=action["action"],
+                                                                   started=action["started"], finished=action["finished"],
+                                                                   messages=action["messages"], changes=action["changes"],
+                                                                   status=action["status"], change=action["change"],
+                                                                   send_event=action["send_events"])
+                                               for _, action, _ in new_actions])
+
+        # group all state updates per configuration model
+        resource_updates = []
+        ready = defaultdict(list)
+        purged = set()
+        for _, action, action_resources in new_actions:
+            if action["action"] not in const.STATE_UPDATE:
+                continue
+
+            for res in action_resources:
+                resource_updates.append((res, dict(last_deploy=action["finished"], status=action["status"])))
+                ready[res.model].append((res.id, res.resource_id, action["status"]))
+                if "purged" in res.attributes and res.attributes["purged"] and action["status"] == const.ResourceState.deployed:
+                    purged.add(res.resource_id)
+
+        yield data.Resource.update_fields_many(resource_updates)
+        for res, fields in resource_updates:
+            self._resource_cache.update_status(env.id, [(res.model, res.agent, res.resource_version_id)],
+                                               fields["status"], fields["last_deploy"])
+        for resource_id in purged:
+            yield data.Parameter.delete_all(environment=env.id, resource_id=resource_id)
+
+        if len(ready) > 0:
+            yield self._migrated.wait()
+        for version, entries in ready.items():
+            yield data.ConfigurationModel.set_ready_many(env.id, version, entries)
+            model = yield data.ConfigurationModel.get_version(env.id, version)
+
+            if model.done == model.total:
+                result = yield model.get_deploy_result()
+                yield model.update_fields(deployed=True, result=result)
+
+        for i, action, action_resources in new_actions:
+            results[i] = {"code": 200}
+            if action["action"] not in const.STATE_UPDATE:
+                continue
+
+            waiting_agents = set([(Id.parse_id(prov).get_agent_name(), res.resource_version_id)
+                                  for res in action_resources for prov in res.provides])
+
+            for agent, resource_id in waiting_agents:
+                aclient = self.get_agent_client(env.id, agent)
+                if aclient is not None:
+                    yield aclient.resource_event(env.id, agent, resource_id, action["send_events"], action["status"],
+                                                 action["change"], action["changes"])
+
+        return 200, {"results": results}
+
     # Project handlers
     @protocol.handle(methods.Project.create_project)
     @gen.coroutine
@@ -1232,7 +1500,10 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         if project is None:
             return 404, {"message": "The project with given id does not exist."}
 
+        environments = yield data.Environment.get_list(project=project_id)
         yield project.delete_cascade()
+        for env in environments:
+            self._resource_cache.invalidate(env.id)
         return 200, {}
 
     @protocol.handle(methods.Project.modify_project, project_id="id")
@@ -1250,6 +1521,11 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         except pymongo.errors.DuplicateKeyError:
             return 500, {"message": "A project with name %s already exists." % name}
 
+    @protocol.handle(methods.CacheStatisticsMethod.get_cache_statistics)
+    @gen.coroutine
+    def get_cache_statistics(self):
+        return 200, {"resources": self._resource_cache.get_statistics(), "code_bundles": self._code_bundles.get_statistics()}
+
     @protocol.handle(methods.Project.list_projects)
     @gen.coroutine
     def list_projects(self):
@@ -1359,6 +1635,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             return 404, {"message": "The environment with given id does not exist."}
 
         yield env.delete_cascade()
+        self._resource_cache.invalidate(env.id)
 
         return 200
 
@@ -1491,6 +1768,45 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
             out.close()
             err.close()
 
+    def _get_compile_daemon(self, environment_id, project_dir, restart=False):
+        """
+            Get the compile daemon of an environment, start a new daemon when restart is true
+        """
+        daemon = self._compile_daemons.get(environment_id)
+        if daemon is not None and restart:
+            daemon.stop()
+            daemon = None
+
+        if daemon is None:
+            cmd = [sys.executable, "-m", "inmanta.app", "-vv", "compile", "--daemon"]
+            log_file = os.path.join(self._server_storage["logs"], "compile-daemon-%s.log" % environment_id)
+            daemon = CompileDaemonClient(cmd, project_dir, log_file=log_file, env=os.environ.copy())
+            self._compile_daemons[environment_id] = daemon
+
+        return daemon
+
+    @gen.coroutine
+    def _run_compile_stage_in_daemon(self, name, environment_id, args, cwd, restart=False):
+        """
+            Run an inmanta command in the compile daemon of the environment. When the daemon fails, the command is executed
+            in a new process.
+        """
+        start = datetime.datetime.now()
+        cmd = [sys.executable, "-m", "inmanta.app"] + args
+        daemon = self._get_compile_daemon(environment_id, cwd, restart)
+        try:
+            returncode, out, err = yield daemon.run(args)
+        except Exception:
+            LOGGER.exception("Compile daemon of environment %s failed, compiling in a new process", environment_id)
+            daemon.stop()
+            del self._compile_daemons[environment_id]
+            result = yield self._run_compile_stage(name, cmd, cwd, env=os.environ.copy())
+            return result
+
+        stop = datetime.datetime.now()
+        return data.Report(started=start, completed=stop, name=name, command=" ".join(cmd),
+                           errstream=err, outstream=out, returncode=returncode)
+
     @gen.coroutine
     def _recompile_environment(self, environment_id, update_repo=False, wait=0, metadata={}):
         """
@@ -1552,8 +1868,8 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
             LOGGER.info("Recompiling configuration model")
             server_address = opt.server_address.get()
-            cmd = inmanta_path + ["-vvv", "export", "-e", str(environment_id), "--server_address", server_address,
-                                  "--server_port", opt.transport_port.get(), "--metadata", json.dumps(metadata)]
+            cmd = ["-vvv", "export", "-e", str(environment_id), "--server_address", server_address,
+                   "--server_port", opt.transport_port.get(), "--metadata", json.dumps(metadata)]
             if config.Config.get("server", "auth", False):
                 token = encode_token(["compiler", "api"], str(environment_id))
                 cmd.append("--token")
@@ -1566,7 +1882,13 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
                 cmd.append("--ssl-ca-cert")
                 cmd.append(opt.server_ssl_ca_cert.get())
 
-            result = yield self._run_compile_stage("Recompiling configuration model", cmd, project_dir, env=os.environ.copy())
+            if opt.server_compile_daemon.get():
+                # installing and updating modules can change the virtual env, so start a new daemon in that case
+                result = yield self._run_compile_stage_in_daemon("Recompiling configuration model", environment_id, cmd,
+                                                                 project_dir, restart=update_repo)
+            else:
+                result = yield self._run_compile_stage("Recompiling configuration model", inmanta_path + cmd, project_dir,
+                                                       env=os.environ.copy())
 
             stages.append(result)
         except Exception:
@@ -1619,9 +1941,15 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
 
     @protocol.handle(methods.Snapshot.list_snapshots, env="tid")
     @gen.coroutine
-    def list_snapshots(self, env):
-        snapshots = yield data.Snapshot.get_list(environment=env.id)
-        return 200, {"snapshots": snapshots}
+    def list_snapshots(self, env, start=None, limit=None, after=None, fields=None):
+        try:
+            snapshots, page = yield self._get_page(data.Snapshot, {"environment": env.id}, [("started", pymongo.DESCENDING)],
+                                                   start, limit, after, fields)
+        except ValueError as e:
+            return 400, {"message": str(e)}
+
+        page["snapshots"] = snapshots
+        return 200, page
 
     @protocol.handle(methods.Snapshot.get_snapshot, snapshot_id="id", env="tid")
     @gen.coroutine
@@ -1819,6 +2147,7 @@ angular.module('inmantaApi.config', []).constant('inmantaConfig', {
         """
         yield self.agentmanager.stop_agents(env)
         yield env.delete_cascade(only_content=True)
+        self._resource_cache.invalidate(env.id)
         return 200
 
     @protocol.handle(methods.EnvironmentAuth.create_token, env="tid")
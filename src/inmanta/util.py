@@ -16,8 +16,12 @@
     Contact: code@inmanta.com
 """
 
+import base64
 import functools
+import json
 import logging
+import re
+import zlib
 
 from pkg_resources import DistributionNotFound
 import pkg_resources
@@ -66,6 +70,20 @@ def hash_file(content):
     return sha1sum.hexdigest()
 
 
+def hash_resource_attributes(attributes: dict) -> str:
+    """
+        Create a hash of the desired state of a resource. The hash does not depend on the version of the configuration
+        model the resource belongs to, so the hashes of a resource in two versions are equal when its state did not change.
+
+        :param attributes: The attributes of the resource, as they are exported
+    """
+    attributes = {k: v for k, v in attributes.items() if k not in ("id", "version")}
+    if "requires" in attributes:
+        attributes["requires"] = sorted(re.sub(",v=[0-9]+$", "", str(req)) for req in attributes["requires"])
+
+    return hash_file(json.dumps(attributes, sort_keys=True, default=str).encode())
+
+
 def is_call_ok(result):
     if isinstance(result, tuple):
         if len(result) == 2:
@@ -122,3 +140,17 @@ class Scheduler(object):
         """
         if action in self._scheduled:
             self._scheduled.remove(action)
+
+
+def compress_payload(value) -> str:
+    """
+        Encode a json serializable value as a compressed string that can be sent over the api
+    """
+    return base64.b64encode(zlib.compress(json.dumps(value).encode())).decode()
+
+
+def decompress_payload(payload: str):
+    """
+        Decode a value that was encoded with compress_payload
+    """
+    return json.loads(zlib.decompress(base64.b64decode(payload)).decode())
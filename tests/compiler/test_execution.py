@@ -15,6 +15,8 @@
 
     Contact: code@inmanta.com
 """
+import logging
+import tracemalloc
 
 import pytest
 
@@ -22,6 +24,9 @@ from inmanta.ast import AttributeException
 from inmanta.ast import MultiException
 
 import inmanta.compiler as compiler
+from inmanta.execute.scheduler import SchedulerStatistics
+
+LOGGER = logging.getLogger(__name__)
 
 
 def test_issue_139_scheduler(snippetcompiler):
@@ -460,3 +465,85 @@ t1 = Test1()
         "The object __config__::Test1 (instantiated at {dir}/main.cf:10) is not complete: "
         "attribute a ({dir}/main.cf:5) is not set",
     )
+
+
+def test_scheduler_statistics(snippetcompiler):
+    snippetcompiler.setup_for_snippet(
+        """
+entity Test:
+end
+implement Test using std::none
+
+Test.others [0:] -- Test
+
+a = Test()
+b = Test(others=a)
+c = Test(others=[a, b])
+"""
+    )
+    statistics = SchedulerStatistics()
+    compiler.do_compile(statistics=statistics)
+
+    assert len(statistics.iterations) >= 1
+    assert [it.iteration for it in statistics.iterations] == list(range(1, len(statistics.iterations) + 1))
+    assert statistics.get_total("executed") > 0
+    # all relations are delayed result variables that have to be frozen
+    assert statistics.get_total("freezes") >= 3
+
+    table = statistics.format().split("\n")
+    assert len(table) == len(statistics.iterations) + 3
+    assert table[-1].startswith("total")
+
+
+LARGE_MODEL = """
+entity Host:
+    string name
+end
+implement Host using std::none
+
+entity File extends std::Entity:
+    string path
+    string content = ""
+end
+implement File using std::none
+
+Host.files [0:] -- File.host [1]
+
+h = Host(name="test")
+for i in std::sequence(%d):
+    File(host=h, path="/tmp/{{i}}")
+end
+"""
+
+
+def test_unused_attributes_are_not_stored(snippetcompiler):
+    snippetcompiler.setup_for_snippet(LARGE_MODEL % 10)
+    (types, _) = compiler.do_compile()
+
+    files = types["__config__::File"].get_all_instances()
+    assert len(files) == 10
+    for f in files:
+        # the requires and provides relations of std::Entity are never used
+        assert f.slots.get_used("requires") is None
+        assert f.slots.get_used("provides") is None
+        assert f.get_attribute("requires").get_value() == []
+        assert f.get_attribute("host").get_value().get_attribute("name").get_value() == "test"
+
+
+@pytest.mark.slowtest
+def test_memory_large_model(snippetcompiler):
+    """
+        Measure the peak memory used to compile a model with many instances
+    """
+    nr_of_files = 20000
+    snippetcompiler.setup_for_snippet(LARGE_MODEL % nr_of_files)
+
+    tracemalloc.start()
+    try:
+        (types, _) = compiler.do_compile()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    LOGGER.info("Compiling %d instances used %.1f MB, %d bytes per instance", nr_of_files, peak / 1e6, peak / nr_of_files)
+    assert len(types["__config__::File"].get_all_instances()) == nr_of_files
@@ -23,6 +23,7 @@ from inmanta.ast import IndexException
 from inmanta.ast import NotFoundException, TypingException
 from inmanta.ast import RuntimeException, DuplicateException, TypeNotFoundException
 import inmanta.compiler as compiler
+from inmanta.execute.scheduler import SchedulerStatistics
 
 
 def test_issue_121_non_matching_index(snippetcompiler):
@@ -395,3 +396,34 @@ caused by:
 \t\tset at {dir}/main.cf:15:34
  (reported in Construct(Test) ({dir}/main.cf:15))""",  # nopep8
     )
+
+
+def test_index_statistics(snippetcompiler):
+    snippetcompiler.setup_for_snippet("""
+entity Test:
+    string name
+    number nr
+end
+implement Test using std::none
+
+index Test(name, nr)
+index Test(nr, name)
+
+a = Test(name="a", nr=1)
+b = Test[nr=2, name="b"]
+c = Test(name="b", nr=2)
+d = Test[name="a", nr=1]
+""")
+    statistics = SchedulerStatistics()
+    (_, scopes) = compiler.do_compile(statistics=statistics)
+
+    root = scopes.get_child("__config__")
+    assert root.lookup("b").value is root.lookup("c").value
+    assert root.lookup("d").value is root.lookup("a").value
+
+    stat = statistics.indices["__config__::Test"]
+    assert stat["indices"] == 1
+    assert stat["size"] == 2
+    assert stat["pending"] == 0
+    assert stat["queued"] >= 1
+    assert "__config__::Test" in statistics.format_indices()
@@ -552,3 +552,35 @@ def test_670_assign_on_relation(snippetcompiler):
         "The object at h.files is not an Entity but a <class 'list'> with value \[std::ConfigFile [0-9a-fA-F]+\]"
         " \(reported in h.files.path = '1' \({dir}/main.cf:5\)\)",
     )
+
+
+def test_relation_list_unique_and_ordered(snippetcompiler):
+    snippetcompiler.setup_for_snippet(
+        """
+entity Host:
+end
+
+entity File:
+    string path
+end
+
+implement Host using std::none
+implement File using std::none
+
+Host.files [0:] -- File.host [1]
+
+h = Host()
+a = File(path="a")
+b = File(path="b")
+c = File(path="c", host=h)
+
+h.files = [b, a, b]
+h.files = a
+h.files = [c, b]
+"""
+    )
+    (_, scopes) = compiler.do_compile()
+
+    root = scopes.get_child("__config__")
+    files = root.lookup("h").value.get_attribute("files").get_value()
+    assert [f.get_attribute("path").get_value() for f in files] == ["c", "b", "a"]
@@ -15,8 +15,14 @@
 
     Contact: code@inmanta.com
 """
-from inmanta import agent
+from threading import Barrier
+import uuid
+
+from inmanta import agent, protocol
+from inmanta.agent.handler import provider, ResourceHandler
+from inmanta.resources import Id
 import pytest
+from tornado import gen
 from utils import retry_limited
 from inmanta.agent import reporting
 from inmanta.server import SLICE_SESSION_MANAGER
@@ -39,3 +45,130 @@ def test_agent_get_status(io_loop, server, environment):
     status = status.get_result()
     for name in reporting.reports.keys():
         assert name in status and status[name] != "ERROR"
+
+
+class StatusClient(object):
+
+    def __init__(self, batched_code=200):
+        self.batched_code = batched_code
+        self.calls = []
+
+    @gen.coroutine
+    def resource_action_update(self, tid, **action):
+        self.calls.append([action])
+        return protocol.Result(code=200)
+
+    @gen.coroutine
+    def resource_action_update_batched(self, tid, actions):
+        if self.batched_code != 200:
+            return protocol.Result(code=self.batched_code)
+        self.calls.append(actions)
+        return protocol.Result(code=200, result={"results": [{"code": 200} for _ in actions]})
+
+
+class StatusProcess(object):
+
+    def __init__(self, io_loop, client):
+        self._io_loop = io_loop
+        self._env_id = uuid.uuid4()
+        self._client = client
+        self.futures = []
+
+    def add_future(self, future):
+        self.futures.append(future)
+
+
+@pytest.mark.gen_test
+def test_status_buffer(io_loop):
+    client = StatusClient()
+    process = StatusProcess(io_loop, client)
+    buffer = agent.agent.ResourceActionUpdateBuffer(process, 3, 0.05)
+
+    for i in range(4):
+        buffer.add(resource_ids=["test::Resource[agent1,key=%d],v=1" % i])
+
+    # a full batch is sent immediately
+    yield process.futures
+    assert [len(x) for x in client.calls] == [3]
+
+    # the remainder is sent after the flush interval
+    yield retry_limited(lambda: len(process.futures) == 2, 1)
+    yield process.futures
+    assert [len(x) for x in client.calls] == [3, 1]
+
+
+@pytest.mark.gen_test
+def test_status_buffer_fallback(io_loop):
+    client = StatusClient(batched_code=404)
+    process = StatusProcess(io_loop, client)
+    buffer = agent.agent.ResourceActionUpdateBuffer(process, 10, 10)
+
+    for i in range(4):
+        buffer.add(resource_ids=["test::Resource[agent1,key=%d],v=1" % i])
+    buffer.flush()
+
+    yield process.futures
+    assert [len(x) for x in client.calls] == [1, 1, 1, 1]
+
+
+class PrefetchProvider(object):
+
+    def __init__(self, barrier, prefetched):
+        self.barrier = barrier
+        self.prefetched = prefetched
+
+    def prefetch(self, resources):
+        # both types have to prefetch at the same time to pass the barrier
+        self.barrier.wait()
+        self.prefetched.append(sorted(str(r.id) for r in resources))
+
+    def close(self):
+        pass
+
+
+class PrefetchResource(object):
+
+    def __init__(self, resource_id):
+        self.id = Id.parse_id(resource_id)
+
+
+@pytest.mark.gen_test
+def test_prefetch(io_loop):
+    """
+        Only the handlers that override prefetch are called, concurrently
+    """
+    for resource_type in ["test::PrefetchA", "test::PrefetchB"]:
+        @provider(resource_type, name="prefetch")
+        class Prefetch(ResourceHandler):
+            def prefetch(self, resources):
+                pass
+
+    @provider("test::NoPrefetch", name="prefetch")
+    class NoPrefetch(ResourceHandler):
+        pass
+
+    myagent = agent.Agent(io_loop, hostname="node1", environment=uuid.uuid4(), agent_map={"agent1": "localhost"},
+                          code_loader=False)
+    myagent.add_end_point_name("agent1")
+    instance = myagent._instances["agent1"]
+
+    barrier = Barrier(2, timeout=5)
+    prefetched = []
+    providers = []
+
+    @gen.coroutine
+    def get_provider(resource):
+        providers.append(resource.id.entity_type)
+        return PrefetchProvider(barrier, prefetched)
+
+    instance.get_provider = get_provider
+
+    resources = [PrefetchResource(resource_id) for resource_id in ["test::PrefetchA[agent1,key=a1],v=1",
+                                                                   "test::PrefetchA[agent1,key=a2],v=1",
+                                                                   "test::PrefetchB[agent1,key=b],v=1",
+                                                                   "test::NoPrefetch[agent1,key=n],v=1"]]
+    yield instance.prefetch(resources)
+
+    assert sorted(providers) == ["test::PrefetchA", "test::PrefetchB"]
+    assert sorted(prefetched) == [["test::PrefetchA[agent1,key=a1],v=1", "test::PrefetchA[agent1,key=a2],v=1"],
+                                  ["test::PrefetchB[agent1,key=b],v=1"]]
@@ -20,6 +20,9 @@ from time import sleep
 
 from inmanta.agent.handler import cache
 from inmanta.agent.cache import AgentCache
+from inmanta.agent import filecache
+from inmanta.agent.filecache import FileCache
+from inmanta.util import hash_file
 from inmanta.resources import resource, Resource, Id
 import pytest
 from _pytest.fixtures import fixture
@@ -348,3 +351,114 @@ class CacheTests(unittest.TestCase):
         assert 2 == test.c2
         assert "X" == test.test_method_3()
         assert 2 == test.c2
+
+
+def test_file_cache(tmpdir):
+    files = {hash_file(content): content for content in [b"a" * 10, b"b" * 10, b"c" * 10]}
+    ha, hb, hc = files.keys()
+
+    cache = FileCache(str(tmpdir), 25)
+    assert cache.get(ha) is None
+
+    cache.put(ha, files[ha])
+    cache.put(hb, files[hb])
+    # wrong content is not cached
+    cache.put(hc, files[ha])
+    assert cache.get(hc) is None
+
+    assert cache.get(ha) == files[ha]
+    # hb is the least recently used file
+    cache.put(hc, files[hc])
+    assert cache.get(hb) is None
+    assert cache.get(ha) == files[ha]
+    assert cache.get(hc) == files[hc]
+    assert cache.get_statistics() == {"hits": 3, "misses": 3, "entries": 2, "size": 20}
+
+    # the files survive a restart
+    cache = FileCache(str(tmpdir), 25)
+    assert cache.get(ha) == files[ha]
+    assert cache.get(hc) == files[hc]
+
+    # corrupt files are dropped
+    with open(str(tmpdir.join(ha[:2], ha)), "wb") as fd:
+        fd.write(b"corrupt")
+    assert cache.get(ha) is None
+    assert cache.get_statistics()["entries"] == 1
+
+
+def test_file_cache_read_without_lock(tmpdir, monkeypatch):
+    content = b"a" * 10
+    file_hash = hash_file(content)
+    cache = FileCache(str(tmpdir), 25)
+    cache.put(file_hash, content)
+
+    locked = []
+
+    def check_hash(data):
+        locked.append(cache._lock.locked())
+        return hash_file(data)
+
+    monkeypatch.setattr(filecache, "hash_file", check_hash)
+    assert cache.get(file_hash) == content
+    assert locked == [False]
+
+    # a file that is evicted while it is read is still returned
+    def evict(data):
+        cache._remove(file_hash)
+        return hash_file(data)
+
+    cache.put(file_hash, content)
+    monkeypatch.setattr(filecache, "hash_file", evict)
+    assert cache.get(file_hash) == content
+    assert cache.get_statistics()["entries"] == 0
+
+
+def test_cache_expiry_and_eviction():
+    cache = AgentCache(max_size=2)
+    version = 5
+    cache.open_version(version)
+
+    deleted = []
+    cache.cache_value("expire", "a", version=version, timeout=0.1, call_on_delete=deleted.append)
+    cache.cache_value("b", "b", version=version)
+    sleep(0.2)
+    cache.cache_value("c", "c", version=version)
+    # the expired item is removed from its version
+    assert deleted == ["a"]
+    assert cache.keysforVersion[version] == {"b__5", "c__5"}
+
+    # b becomes the most recently used item, so c is evicted
+    assert cache.find("b", version=version) == "b"
+    cache.cache_value("d", "d", version=version, call_on_delete=deleted.append)
+    with pytest.raises(KeyError):
+        cache.find("c", version=version)
+    assert cache.keysforVersion[version] == {"b__5", "d__5"}
+
+    cache.close_version(version)
+    assert deleted == ["a", "d"]
+    assert cache.get_statistics() == {"hits": 1, "misses": 1, "evictions": 1, "expirations": 1, "entries": 0}
+
+
+def test_cache_single_flight():
+    cache = AgentCache()
+    loads = []
+    release = Lock()
+    release.acquire()
+
+    def load():
+        loads.append(True)
+        with release:
+            return "value"
+
+    threads = [Thread(target=lambda: cache.get_or_else("key", load)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+
+    sleep(0.1)
+    release.release()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert cache.keyLocks == {}
+    assert cache.find("key") == "value"
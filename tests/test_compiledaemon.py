@@ -0,0 +1,75 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+import os
+import sys
+
+import pytest
+
+from inmanta.compiledaemon import CompileDaemonClient
+
+
+@pytest.mark.gen_test(timeout=120)
+def test_compile_daemon(snippetcompiler, tmpdir):
+    snippetcompiler.setup_for_snippet("""
+import std
+
+a = 1
+""")
+    cmd = [sys.executable, "-m", "inmanta.app", "-vv", "compile", "--daemon"]
+    log_file = str(tmpdir.join("daemon.log"))
+    daemon = CompileDaemonClient(cmd, snippetcompiler.project_dir, log_file=log_file)
+    try:
+        returncode, _, err = yield daemon.run(["compile"])
+        assert returncode == 0, err
+        assert daemon.is_running()
+
+        # the daemon picks up changes to the model
+        with open(snippetcompiler.main, "w") as fd:
+            fd.write("""
+import std
+
+a = 1
+a = 2
+""")
+        returncode, _, err = yield daemon.run(["compile"])
+        assert returncode == 1
+        assert "main.cf:5" in err
+
+        os.remove(snippetcompiler.main)
+        with open(snippetcompiler.main, "w") as fd:
+            fd.write("""
+import std
+
+a = 1
+std::print(a)
+""")
+        returncode, out, err = yield daemon.run(["compile"])
+        assert returncode == 0, err
+        assert out == "1\n"
+
+        # nothing changed, the loaded project is reused
+        returncode, out, err = yield daemon.run(["compile"])
+        assert returncode == 0, err
+        assert out == "1\n"
+    finally:
+        daemon.stop()
+
+    assert not daemon.is_running()
+    with open(log_file, "r") as fd:
+        log = fd.read()
+    assert log.count("Loading project in") == 3
@@ -21,6 +21,7 @@ import time
 
 from inmanta import data
 from inmanta import const
+from inmanta.resources import Id
 import pytest
 import pymongo
 import logging
@@ -415,6 +416,99 @@ def test_issue_422(data_module):
     assert to_purge[0].resource_id == "std::File[agent1,path=/etc/motd]"
 
 
+@pytest.mark.gen_test
+def test_get_deleted_resources_latest_deployed(data_module):
+    """
+        The purge status of a deleted resource is based on the latest released version in which it was deployed
+    """
+    env_id = uuid.uuid4()
+    for version in [1, 2]:
+        cm = data.ConfigurationModel(environment=env_id, version=version, date=datetime.datetime.now(), total=3,
+                                     version_info={}, released=True, deployed=True)
+        yield cm.insert()
+
+        for agent in ["agent1", "agent2", "agent3"]:
+            # agent1 was purged in version 2, agent2 failed in version 2 and agent3 is still present
+            purged = agent == "agent1" and version == 2
+            status = const.ResourceState.failed if agent == "agent2" and version == 2 else const.ResourceState.deployed
+            res = data.Resource.new(environment=env_id,
+                                    resource_version_id="std::File[%s,path=/etc/motd],v=%s" % (agent, version),
+                                    status=status, attributes={"path": "/etc/motd", "purge_on_delete": True,
+                                                               "purged": purged})
+            yield res.insert()
+
+    version = 3
+    cm = data.ConfigurationModel(environment=env_id, version=version, date=datetime.datetime.now(), total=1, version_info={})
+    yield cm.insert()
+
+    to_purge = yield data.Resource.get_deleted_resources(env_id, version, {"std::File[agent3,path=/etc/motd]"})
+
+    assert len(to_purge) == 1
+    assert to_purge[0].model == 1
+    assert to_purge[0].resource_id == "std::File[agent2,path=/etc/motd]"
+
+
+@pytest.mark.gen_test
+def test_get_resources_report(data_module):
+    env_id = uuid.uuid4()
+    last_deploy = datetime.datetime(2018, 7, 1, 12, 0, 0)
+    for version in range(1, 4):
+        # agent1 is deployed in version 1 and 2, agent2 is never deployed
+        for agent in ["agent1", "agent2"]:
+            kwargs = {}
+            if agent == "agent1" and version < 3:
+                kwargs = {"status": const.ResourceState.deployed, "last_deploy": last_deploy + datetime.timedelta(days=version)}
+            res = data.Resource.new(environment=env_id,
+                                    resource_version_id="std::File[%s,path=/etc/motd],v=%s" % (agent, version),
+                                    attributes={"path": "/etc/motd"}, **kwargs)
+            yield res.insert()
+
+    report = yield data.Resource.get_resources_report(env_id)
+    assert report == [{"resource_id": "std::File[agent1,path=/etc/motd]",
+                       "resource_type": "std::File",
+                       "agent": "agent1",
+                       "id_attribute_name": "path",
+                       "id_attribute_value": "/etc/motd",
+                       "latest_version": 3,
+                       "deployed_version": 2,
+                       "last_deploy": last_deploy + datetime.timedelta(days=2)},
+                      {"resource_id": "std::File[agent2,path=/etc/motd]",
+                       "resource_type": "std::File",
+                       "agent": "agent2",
+                       "id_attribute_name": "path",
+                       "id_attribute_value": "/etc/motd",
+                       "latest_version": 3,
+                       "deployed_version": None,
+                       "last_deploy": None}]
+
+
+@pytest.mark.slowtest
+@pytest.mark.gen_test(timeout=120)
+def test_get_resources_report_benchmark(data_module):
+    """
+        Time the resources report of an environment with many resources and retained versions
+    """
+    env_id = uuid.uuid4()
+    n_resources = 10000
+    n_versions = 10
+    now = datetime.datetime.now()
+    for version in range(1, n_versions + 1):
+        resources = [data.Resource.new(environment=env_id,
+                                       resource_version_id="std::File[agent1,path=/tmp/%d],v=%d" % (i, version),
+                                       status=const.ResourceState.deployed, last_deploy=now, attributes={"path": "/tmp/%d" % i})
+                     for i in range(n_resources)]
+        yield data.Resource.insert_many(resources, ordered=False)
+
+    start = time.time()
+    report = yield data.Resource.get_resources_report(env_id)
+    duration = time.time() - start
+    logging.getLogger(__name__).info("Resources report of %d resources with %d versions took %.3fs", n_resources, n_versions,
+                                     duration)
+
+    assert len(report) == n_resources
+    assert all(res["latest_version"] == n_versions and res["deployed_version"] == n_versions for res in report)
+
+
 @pytest.mark.gen_test
 def test_get_latest_resource(data_module):
     env_id = uuid.uuid4()
@@ -639,3 +733,177 @@ def test_undeployable_skip_cache_lazy(data_module):
 
     undep = yield cm1.get_skipped_for_undeployable()
     assert undep == ["std::File[agent1,path=/tmp/%d]" % (4), "std::File[agent1,path=/tmp/%d]" % (5)]
+
+
+@pytest.mark.gen_test
+def test_config_model_status(data_module):
+    env_id = uuid.uuid4()
+    version = 1
+
+    cm = data.ConfigurationModel(environment=env_id, version=version, date=datetime.datetime.now(), total=3, version_info={})
+    yield cm.insert()
+
+    ids = ["std::File[agent1,path=/tmp/%d],v=%d" % (i, version) for i in range(3)]
+    uuids = [uuid.uuid4() for _ in ids]
+
+    yield data.ConfigurationModel.set_ready(env_id, version, uuids[0], ids[0], const.ResourceState.failed)
+    yield data.ConfigurationModel.set_ready_many(env_id, version, [(uuids[0], ids[0], const.ResourceState.deployed),
+                                                                   (uuids[1], ids[1], const.ResourceState.deployed)])
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert cm.done == 2
+
+    yield data.ConfigurationModel.set_ready(env_id, version, uuids[2], ids[2], const.ResourceState.skipped)
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert cm.done == 3
+    result = yield cm.get_deploy_result()
+    assert result == const.VersionState.failed
+
+    yield data.ConfigurationModel.set_ready(env_id, version, uuids[2], ids[2], const.ResourceState.deployed)
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert cm.done == 3
+    result = yield cm.get_deploy_result()
+    assert result == const.VersionState.success
+
+    status = yield cm.get_resource_status(start=1, limit=10)
+    assert [x.to_dict() for x in status] == [{"id": ids[1], "status": const.ResourceState.deployed},
+                                             {"id": ids[2], "status": const.ResourceState.deployed}]
+
+    yield cm.delete_cascade()
+    assert (yield data.ConfigurationModelStatus.get_list(environment=env_id)) == []
+
+
+@pytest.mark.gen_test
+def test_dryrun_results(data_module):
+    env_id = uuid.uuid4()
+    dryrun = data.DryRun(environment=env_id, model=1, date=datetime.datetime.now(), total=3, todo=3)
+    yield dryrun.insert()
+
+    ids = ["std::File[agent1,path=/tmp/%d],v=1" % i for i in range(3)]
+
+    def payload(resource_id, changes):
+        return {"changes": changes, "id_fields": Id.parse_id(resource_id).to_dict(), "id": resource_id}
+
+    yield data.DryRun.update_resource(dryrun.id, ids[0], payload(ids[0], {"handler": {"current": "FAILED",
+                                                                                      "desired": "Handler failed"}}))
+    yield data.DryRun.update_resources(dryrun.id, {ids[0]: payload(ids[0], {}),
+                                                   ids[1]: payload(ids[1], {"a.b": {"current": 1, "desired": 2}})})
+
+    dryrun = yield data.DryRun.get_by_id(dryrun.id)
+    assert dryrun.todo == 1
+    assert dryrun.failed == 1
+    assert dryrun.last_update is not None
+
+    resources = yield dryrun.get_resources()
+    assert sorted(resources.keys()) == ids[:2]
+    assert resources[ids[0]]["changes"] == {"handler": {"current": "FAILED", "desired": "Handler failed"}}
+    assert resources[ids[1]]["changes"] == {"a.b": {"current": 1, "desired": 2}}
+
+    resources = yield dryrun.get_resources(start=1, limit=1)
+    assert list(resources.keys()) == [ids[1]]
+
+    yield dryrun.delete_cascade()
+    assert (yield data.DryRunResult.get_list(dryrun=dryrun.id)) == []
+
+
+@pytest.mark.gen_test
+def test_migrate_embedded_results(data_module):
+    env_id = uuid.uuid4()
+    version = 1
+    resource_id = "std::File[agent1,path=/tmp/1],v=%d" % version
+    entry = str(uuid.uuid4())
+
+    yield data.ConfigurationModel._coll.insert_one({"_id": uuid.uuid4(), "environment": env_id, "version": version,
+                                                    "total": 1, "status": {entry: {"id": resource_id,
+                                                                                   "status": "deployed"}}})
+    dryrun_id = uuid.uuid4()
+    yield data.DryRun._coll.insert_one({"_id": dryrun_id, "environment": env_id, "model": version, "total": 1, "todo": 0,
+                                        "resources": {entry: {"id": resource_id, "changes": {}, "id_fields": {}}}})
+
+    # a resource that is deployed before the migration runs
+    other_id = "std::File[agent1,path=/tmp/2],v=%d" % version
+    yield data.ConfigurationModel.set_ready_many(env_id, version, [(uuid.uuid4(), other_id, const.ResourceState.deployed)])
+
+    # documents that are not migrated yet can be loaded, the embedded results are not returned
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert "status" not in cm.to_dict()
+    dryrun = yield data.DryRun.get_by_id(dryrun_id)
+    assert "resources" not in dryrun.to_dict()
+
+    yield data.migrate_embedded_results()
+
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert cm.done == 2
+    status = yield cm.get_resource_status()
+    assert sorted([x.to_dict()["id"] for x in status]) == [resource_id, other_id]
+
+    # the migration can be repeated
+    yield data.migrate_embedded_results()
+    cm = yield data.ConfigurationModel.get_version(env_id, version)
+    assert cm.done == 2
+
+    dryrun = yield data.DryRun.get_by_id(dryrun_id)
+    resources = yield dryrun.get_resources()
+    assert resources == {resource_id: {"id": resource_id, "changes": {}, "id_fields": {}}}
+
+
+def test_page_key():
+    values = [3, uuid.uuid4(), "name"]
+    assert data.decode_page_key(data.encode_page_key(values)) == values
+
+    with pytest.raises(ValueError):
+        data.decode_page_key("not a key")
+
+
+@pytest.mark.gen_test
+def test_get_page(data_module):
+    env_id = uuid.uuid4()
+    params = [data.Parameter(name="param%d" % (i % 3), value=str(i), environment=env_id, source="fact") for i in range(7)]
+    yield data.Parameter.insert_many(params)
+
+    expected = sorted(params, key=lambda x: (x.name, x.id))
+    sort = [("name", pymongo.ASCENDING)]
+
+    page, next_key = yield data.Parameter.get_page({"environment": env_id}, sort=sort, limit=3)
+    assert [x.id for x in page] == [x.id for x in expected[:3]]
+    assert next_key is not None
+
+    page, next_key = yield data.Parameter.get_page({"environment": env_id}, sort=sort, limit=3, after=next_key)
+    assert [x.id for x in page] == [x.id for x in expected[3:6]]
+
+    page, next_key = yield data.Parameter.get_page({"environment": env_id}, sort=sort, limit=3, after=next_key,
+                                                   fields=["name", "value"])
+    assert page == [{"name": expected[6].name, "value": expected[6].value}]
+    assert next_key is None
+
+    page, next_key = yield data.Parameter.get_page({"environment": env_id}, sort=sort, start=6)
+    assert [x.id for x in page] == [expected[6].id]
+    assert next_key is None
+
+    with pytest.raises(ValueError):
+        yield data.Parameter.get_page({"environment": env_id}, fields=["unknown"])
+
+
+@pytest.mark.gen_test
+def test_get_logs_for_version(data_module):
+    env_id = uuid.uuid4()
+    ids = ["std::File[agent1,path=/tmp/%d],v=1" % i for i in range(3)]
+    now = datetime.datetime.now()
+
+    actions = []
+    for i in range(3):
+        started = now + datetime.timedelta(seconds=i)
+        actions.append(data.ResourceAction(environment=env_id, resource_version_ids=ids[:2], action_id=uuid.uuid4(),
+                                           action=const.ResourceAction.deploy, started=started, finished=started))
+    actions.append(data.ResourceAction(environment=env_id, resource_version_ids=ids, action_id=uuid.uuid4(),
+                                       action=const.ResourceAction.store, started=now - datetime.timedelta(seconds=1),
+                                       finished=now))
+    yield data.ResourceAction.insert_many(actions)
+
+    logs = yield data.ResourceAction.get_logs_for_version(env_id, ids)
+    for rvid in ids:
+        single = yield data.ResourceAction.get_log(env_id, rvid)
+        assert [x.action_id for x in logs[rvid]] == [x.action_id for x in single]
+
+    logs = yield data.ResourceAction.get_logs_for_version(env_id, ids, const.ResourceAction.deploy, 2)
+    assert [x.action_id for x in logs[ids[0]]] == [actions[2].action_id, actions[1].action_id]
+    assert logs[ids[2]] == []
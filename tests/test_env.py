@@ -85,3 +85,43 @@ def test_gen_req_file(tmpdir):
 
     req_lines = [x for x in e._gen_requirements_file(req).split("\n") if len(x) > 0]
     assert(len(req_lines) == 3)
+
+
+def test_install_planner(tmpdir, monkeypatch):
+    e = env.VirtualEnv(tmpdir)
+
+    installed = []
+    monkeypatch.setattr(e, "_install", lambda requirements_list: installed.append(requirements_list))
+
+    assert e._get_missing_requirements(["pytest", "pytest >= 1000", "inmanta-not-installed", "pytest-tornado",
+                                        "git+https://github.com/bartv/python3-iplib",
+                                        "pytest@git+https://github.com/pytest-dev/pytest"]) == \
+        ["pytest", "pytest >= 1000", "inmanta-not-installed", "git+https://github.com/bartv/python3-iplib",
+         "pytest@git+https://github.com/pytest-dev/pytest"]
+
+    # everything is installed already
+    e.install_from_list(["pytest", "pytest-tornado > 0.1"])
+    assert installed == []
+
+    e.install_from_list(["pytest", "inmanta-not-installed"])
+    assert installed == [["inmanta-not-installed"]]
+
+    # without the cache, pip installs everything
+    e.install_from_list(["pytest", "inmanta-not-installed"], cache=False)
+    assert installed[-1] == ["inmanta-not-installed", "pytest"]
+
+
+def test_install_unwritable_wheel_cache(tmpdir, monkeypatch):
+    e = env.VirtualEnv(str(tmpdir.mkdir("env")))
+    # the cache directory can not be created below a file
+    blocker = tmpdir.join("blocker")
+    blocker.write("")
+    e.wheel_cache_dir = str(blocker.join("wheels"))
+
+    calls = []
+    monkeypatch.setattr(e, "_run_pip", lambda args: calls.append(args) or True)
+
+    e._install(["inmanta-not-installed"])
+    assert len(calls) == 1
+    assert calls[0][0] == "install"
+    assert "--no-index" not in calls[0]
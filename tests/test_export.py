@@ -15,7 +15,10 @@
 
     Contact: code@inmanta.com
 """
+import base64
+
 from inmanta import config, const
+from inmanta.util import hash_file
 import pytest
 
 
@@ -170,6 +173,32 @@ def test_server_export(snippetcompiler, server, client, environment):
     assert result.result["versions"][0]["total"] == 1
 
 
+@pytest.mark.gen_test
+def test_server_export_files(snippetcompiler, server, client, environment):
+    """
+        Upload more files than the upload concurrency allows at the same time
+    """
+    config.Config.set("config", "upload-concurrency", "2")
+    snippetcompiler.setup_for_snippet("""
+            h = std::Host(name="test", os=std::linux)
+            for i in std::sequence(10):
+                std::ConfigFile(host=h, path="/etc/motd{{i}}", content="test{{i}}")
+            end
+        """)
+    snippetcompiler.do_export(deploy=True)
+
+    result = yield client.list_versions(tid=environment)
+    assert result.code == 200
+    assert len(result.result["versions"]) == 1
+    assert result.result["versions"][0]["total"] == 10
+
+    for i in range(10):
+        content = ("test%d" % i).encode()
+        result = yield client.get_file(id=hash_file(content))
+        assert result.code == 200
+        assert base64.b64decode(result.result["content"]) == content
+
+
 @pytest.mark.gen_test
 def test_dict_export_server(snippetcompiler, server, client, environment):
     config.Config.set("config", "environment", environment)
@@ -0,0 +1,221 @@
+"""
+    Copyright 2018 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import tornado.web
+from tornado import gen
+from tornado.httpclient import HTTPError
+
+from inmanta import config, protocol
+from inmanta.agent.filecache import FileCache
+from inmanta.agent.handler import ResourceHandler
+from inmanta.export import Exporter
+from inmanta.server import filestore
+from inmanta.server.filestore import FileStore
+from inmanta.util import hash_file
+
+
+@pytest.fixture
+def store(tmpdir):
+    return FileStore(str(tmpdir))
+
+
+@pytest.fixture
+def app(store):
+    return tornado.web.Application(store.get_handlers("/api/v1/filestore"))
+
+
+def test_filestore_shards(tmpdir):
+    content = b"old layout"
+    old_hash = hash_file(content)
+    with open(os.path.join(str(tmpdir), old_hash), "wb") as fd:
+        fd.write(content)
+
+    store = FileStore(str(tmpdir))
+    assert store.get_path(old_hash) == os.path.join(str(tmpdir), old_hash[:2], old_hash)
+    assert not os.path.exists(os.path.join(str(tmpdir), old_hash))
+    assert store.read(old_hash) == content
+
+    new_hash = hash_file(b"new")
+    store.put(new_hash, b"new")
+    assert os.path.exists(os.path.join(str(tmpdir), new_hash[:2], new_hash))
+
+    with pytest.raises(FileExistsError):
+        store.put(new_hash, b"new")
+
+    with pytest.raises(ValueError):
+        store.put(hash_file(b"other"), b"new")
+
+    missing = hash_file(b"missing")
+    assert store.get_missing([old_hash, new_hash, missing, "invalid"]) == ["invalid", missing]
+
+
+def test_filestore_verify_once(tmpdir, monkeypatch):
+    content = b"verify me"
+    file_hash = hash_file(content)
+    FileStore(str(tmpdir)).put(file_hash, content)
+
+    hashed = []
+
+    def hash_file_at(path):
+        hashed.append(path)
+        with open(path, "rb") as fd:
+            return hash_file(fd.read())
+
+    monkeypatch.setattr(filestore, "hash_file_at", hash_file_at)
+
+    store = FileStore(str(tmpdir))
+    assert store.verify(file_hash) is None
+    assert store.verify(file_hash) is None
+    assert len(hashed) == 1
+
+    with open(store.get_path(file_hash), "wb") as fd:
+        fd.write(b"corrupt")
+
+    config.Config.set("server", "delete_currupt_files", "false")
+    assert store.verify(file_hash) is not None
+    assert store.exists(file_hash)
+
+    config.Config.set("server", "delete_currupt_files", "true")
+    assert store.verify(file_hash) is not None
+    assert not store.exists(file_hash)
+
+
+@pytest.mark.gen_test
+def test_filestore_raw_routes(store, http_client, base_url):
+    content = os.urandom(1024 * 1024)
+    file_hash = hash_file(content)
+    url = base_url + "/api/v1/filestore/" + file_hash
+
+    with pytest.raises(HTTPError) as e:
+        yield http_client.fetch(url)
+    assert e.value.code == 404
+
+    with pytest.raises(HTTPError) as e:
+        yield http_client.fetch(url, method="PUT", body=content[1:])
+    assert e.value.code == 400
+    assert not store.exists(file_hash)
+
+    response = yield http_client.fetch(url, method="PUT", body=content)
+    assert response.code == 200
+    assert store.read(file_hash) == content
+    assert [name for name in os.listdir(os.path.join(store.root, file_hash[:2])) if name != file_hash] == []
+
+    with pytest.raises(HTTPError) as e:
+        yield http_client.fetch(url, method="PUT", body=content)
+    assert e.value.code == 500
+
+    response = yield http_client.fetch(url)
+    assert response.body == content
+
+    response = yield http_client.fetch(url, headers={"Range": "bytes=0-9"})
+    assert response.code == 206
+    assert response.body == content[:10]
+
+
+@pytest.fixture
+def transport_port(http_server, http_port):
+    for section in ("agent_rest_transport", "compiler_rest_transport"):
+        config.Config.set(section, "host", "localhost")
+        config.Config.set(section, "port", str(http_port))
+    return http_port
+
+
+class FakeAgent(object):
+    def __init__(self, cache_dir):
+        self.sessionid = None
+        self._file_cache = FileCache(cache_dir, 1024 * 1024)
+
+    def get_file_cache(self):
+        return self._file_cache
+
+
+@pytest.mark.gen_test
+def test_filestore_agent_client(store, transport_port, tmpdir):
+    """
+        Download and upload raw files from a handler of an agent
+    """
+    content = b"agent file"
+    file_hash = hash_file(content)
+    cache_dir = tmpdir.mkdir("cache")
+
+    handler = ResourceHandler(FakeAgent(str(cache_dir)), io=object())
+    client = handler.get_client()
+
+    calls = []
+
+    def rpc_call(*args, **kwargs):
+        calls.append(args)
+        raise Exception("The json methods should not be used")
+
+    client.get_file = rpc_call
+    client.upload_file = rpc_call
+
+    with ThreadPoolExecutor(1) as pool:
+        yield pool.submit(handler.upload_file, file_hash, content)
+        assert store.read(file_hash) == content
+
+        assert (yield pool.submit(handler.get_file, file_hash)) == content
+        assert handler._agent.get_file_cache().get(file_hash) == content
+
+    assert calls == []
+
+
+@pytest.mark.gen_test
+def test_filestore_exporter_client(store, transport_port):
+    """
+        Upload the files of an export through the raw route and fall back to the json method when the route is missing
+    """
+    files = [("file%d" % i).encode() for i in range(3)]
+    exporter = Exporter()
+    for content in files:
+        exporter.upload_file(content)
+
+    conn = protocol.Client("compiler")
+
+    @gen.coroutine
+    def stat_files(files):
+        return protocol.Result(code=200, result={"files": files})
+
+    conn.stat_files = stat_files
+    yield exporter._upload_files(conn)
+
+    for content in files:
+        assert store.read(hash_file(content)) == content
+
+    result = yield conn.get_file_content(hash_file(files[0]))
+    assert result.code == 200
+    assert result.result == files[0]
+
+    result = yield conn.get_file_content(hash_file(b"missing"))
+    assert result.code == 404
+
+    uploaded = []
+
+    @gen.coroutine
+    def upload_file(id, content):
+        uploaded.append(id)
+        return protocol.Result(code=200, result={})
+
+    conn.upload_file = upload_file
+    conn._transport_instance.file_call = lambda *args: gen.maybe_future(protocol.Result(code=404, result={}))
+    exporter._file_store = {hash_file(b"old server"): b"old server"}
+    yield exporter._upload_files(conn)
+    assert uploaded == [hash_file(b"old server")]
@@ -0,0 +1,98 @@
+"""
+    Copyright 2017 Inmanta
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Contact: code@inmanta.com
+"""
+from inmanta import const, resources
+from inmanta.agent.handler import CRUDHandler, HandlerContext, ResourcePurged, SkipResource
+from inmanta.resources import resource
+
+
+def test_crud_execute_batch():
+
+    @resource("test_handler::BatchResource", agent="agent", id_attribute="key")
+    class BatchResource(resources.PurgeableResource):
+        fields = ("key", "value", "agent")
+
+    class BatchHandler(CRUDHandler):
+
+        def __init__(self, state):
+            super().__init__(None, io=object())
+            self.state = state
+            self.reads = []
+            self.applied = []
+
+        def can_execute_batch(self):
+            return True
+
+        def read_resources(self, items):
+            self.reads.append(sorted(current.key for _, current in items))
+            super().read_resources(items)
+
+        def read_resource(self, ctx, resource):
+            if resource.key == "skip":
+                raise SkipResource("skip me")
+            if resource.key == "fail":
+                raise Exception("read failed")
+            if resource.key not in self.state:
+                raise ResourcePurged()
+            resource.value = self.state[resource.key]
+
+        def apply_changes(self, items):
+            self.applied.append(sorted(resource.key for _, resource, _ in items))
+            super().apply_changes(items)
+
+        def create_resource(self, ctx, resource):
+            self.state[resource.key] = resource.value
+
+        def delete_resource(self, ctx, resource):
+            del self.state[resource.key]
+
+        def update_resource(self, ctx, changes, resource):
+            self.state[resource.key] = resource.value
+
+    def make(key, value="new", purged=False):
+        return resources.Resource.deserialize({"id": "test_handler::BatchResource[agent1,key=%s],v=1" % key, "key": key,
+                                               "value": value, "agent": "agent1", "send_event": False, "requires": [],
+                                               "purged": purged, "purge_on_delete": False})
+
+    def run(handler, dry_run):
+        items = [(HandlerContext(res, dry_run=dry_run), res)
+                 for res in [make("create"), make("update"), make("same", "old"), make("delete", purged=True),
+                             make("skip"), make("fail")]]
+        handler.execute_batch(items, dry_run=dry_run)
+        return {res.key: ctx for ctx, res in items}
+
+    state = {"update": "old", "same": "old", "delete": "old"}
+    handler = BatchHandler(state)
+
+    ctxs = run(handler, dry_run=True)
+    assert handler.reads == [["create", "delete", "fail", "same", "skip", "update"]]
+    assert handler.applied == []
+    assert state == {"update": "old", "same": "old", "delete": "old"}
+    assert ctxs["create"].status == const.ResourceState.dry
+    assert ctxs["create"].changes == {"purged": {"current": True, "desired": False}}
+    assert ctxs["update"].changes == {"value": {"current": "old", "desired": "new"}}
+    assert ctxs["same"].changes == {}
+
+    handler = BatchHandler(state)
+    ctxs = run(handler, dry_run=False)
+    assert handler.reads == [["create", "delete", "fail", "same", "skip", "update"]]
+    assert handler.applied == [["create", "delete", "update"]]
+    assert state == {"create": "new", "update": "new", "same": "old"}
+    for key in ["create", "update", "same", "delete"]:
+        assert ctxs[key].status == const.ResourceState.deployed
+    assert ctxs["skip"].status == const.ResourceState.skipped
+    assert ctxs["fail"].status == const.ResourceState.failed
@@ -20,7 +20,9 @@ import os
 import pwd
 import shutil
 import subprocess
+import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
@@ -28,6 +30,7 @@ import grp
 from inmanta.agent.io import parse_agent_uri
 from inmanta.agent.io.local import BashIO
 from inmanta.agent.io.local import LocalIO
+from inmanta.agent.io.remote import SshIO, RemoteException
 
 
 io_list = [LocalIO("local:", {}), BashIO("local:", {}), BashIO("local:", {}, run_as="root")]
@@ -271,3 +274,66 @@ def test_uri_parse():
     assert config["port"] == "22"
     assert config["host"] == "1.2.3.4"
     assert config["python"] == "/usr/bin/python2"
+
+
+@pytest.mark.parametrize("io", io_list)
+def test_batched_operations(io, testdir):
+    paths = []
+    for i in range(3):
+        path = os.path.join(testdir, "batch file %d" % i)
+        with open(path, "w+") as fd:
+            fd.write("test")
+        paths.append(path)
+    # a name with a backslash and a newline
+    path = os.path.join(testdir, "batch\\file\nwith newline")
+    with open(path, "w+") as fd:
+        fd.write("test")
+    paths.append(path)
+    missing = os.path.join(testdir, "batch_missing")
+
+    stats = io.file_stat_many(paths + [missing])
+    assert stats[missing] is None
+    for path in paths:
+        assert stats[path] == io.file_stat(path)
+
+    hashes = io.hash_files(paths + [missing])
+    assert hashes == dict([(path, "a94a8fe5ccb19ba61c4c0873d391e987982fbbd3") for path in paths] + [(missing, None)])
+
+    contents = io.read_many(paths + [missing])
+    assert contents == dict([(path, "test") for path in paths] + [(missing, None)])
+
+
+class PopenIO(SshIO):
+    """
+        Run the remote side of the ssh io in a local python process
+    """
+    def _build_connect_string(self):
+        return "popen//python=%s" % sys.executable
+
+
+def test_remote_channel_pool(testdir):
+    io = PopenIO("popen", {"host": "localhost", "channels": "2"})
+    try:
+        filename = os.path.join(testdir, "remotefile")
+        with open(filename, "w+") as fd:
+            fd.write("test")
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: io.hash_file(filename), range(20)))
+        assert results == ["a94a8fe5ccb19ba61c4c0873d391e987982fbbd3"] * 20
+        # the channels are reused
+        assert len(io._idle_channels) <= 2
+
+        assert io.batch([("file_exists", (filename,), {}), ("read", (filename,), {})]) == [True, "test"]
+        assert io.file_stat_many([filename]) == {filename: io.file_stat(filename)}
+
+        with pytest.raises(RemoteException):
+            io.unknown_method()
+
+        with pytest.raises(RemoteException):
+            io.read(os.path.join(testdir, "does_not_exist"))
+
+        # a failing call does not break the channels
+        assert io.read(filename) == "test"
+    finally:
+        io.close()
@@ -34,3 +34,35 @@ def test_param(client, environment):
 
     result = yield client.list_params(tid=environment)
     assert(result.code == 200)
+
+
+@pytest.mark.gen_test(timeout=60)
+def test_param_list_pages(client, environment):
+    """
+        Test listing parameters in pages
+    """
+    for i in range(5):
+        result = yield client.set_param(tid=environment, id="param%d" % i, source="user", value=str(i), recompile=False)
+        assert(result.code == 200)
+
+    names = []
+    next_key = None
+    while True:
+        result = yield client.list_params(tid=environment, limit=2, after=next_key, fields="name,value")
+        assert(result.code == 200)
+        assert(len(result.result["parameters"]) <= 2)
+        assert all(set(param.keys()) == {"name", "value"} for param in result.result["parameters"])
+        names.extend(param["name"] for param in result.result["parameters"])
+
+        next_key = result.result["next"]
+        if next_key is None:
+            break
+
+    assert(names == ["param%d" % i for i in range(5)])
+
+    result = yield client.list_params(tid=environment, start=4)
+    assert(result.code == 200)
+    assert([param["name"] for param in result.result["parameters"]] == ["param4"])
+
+    result = yield client.list_params(tid=environment, fields="unknown")
+    assert(result.code == 400)
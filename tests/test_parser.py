@@ -22,6 +22,7 @@ from inmanta.ast import Namespace, LocatableString
 from inmanta.ast.statements import define, Literal
 from inmanta.parser.plyInmantaParser import parse
 from inmanta.parser import ParserException
+from inmanta.parser.cache import ParseCache
 from inmanta.ast.statements.define import (
     DefineImplement,
     DefineTypeConstraint,
@@ -1302,3 +1303,43 @@ a = c["test"]["xx"]
     assert stmt.value.key.value == "xx"
     assert isinstance(stmt.value.themap.key, Literal)
     assert stmt.value.themap.key.value == "test"
+
+
+def test_parse_cache(tmpdir):
+    cache = ParseCache(str(tmpdir.join("cache")))
+    cf_file = tmpdir.join("main.cf")
+    cf_file.write("""
+entity Test:
+    string a
+end
+""")
+
+    def parse_with_cache():
+        root_ns = Namespace("__root__")
+        main_ns = Namespace("__config__")
+        main_ns.parent = root_ns
+        return main_ns, cache.parse(main_ns, str(cf_file))
+
+    ns1, statements1 = parse_with_cache()
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    ns2, statements2 = parse_with_cache()
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(statements1) == len(statements2) == 1
+    stmt = statements2[0]
+    assert isinstance(stmt, DefineEntity)
+    assert str(stmt.name) == "Test"
+    # the cached statements are bound to the namespace they are loaded in
+    assert stmt.namespace is ns2
+    assert stmt.attributes[0].type.namespace is ns2
+
+    cf_file.write("""
+entity Test2:
+end
+""")
+    _, statements3 = parse_with_cache()
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert str(statements3[0].name) == "Test2"
+    # the entry of the previous content is removed
+    entries = [f for f in tmpdir.join("cache").visit() if f.isfile()]
+    assert len(entries) == 1
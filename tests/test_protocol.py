@@ -19,10 +19,13 @@ import random
 import base64
 import threading
 import time
+import uuid
+import datetime
 
 import pytest
+from tornado import gen
 from tornado.httpclient import HTTPRequest, AsyncHTTPClient
-from inmanta import config, protocol
+from inmanta import config, protocol, const, methods
 from inmanta.util import hash_file
 from inmanta.server import config as opt
 import os
@@ -166,7 +169,7 @@ def test_client_files_corrupt(client):
 
     file_dir = os.path.join(state_dir, "server", "files")
 
-    file_name = os.path.join(file_dir, hash)
+    file_name = os.path.join(file_dir, hash[:2], hash)
 
     with open(file_name, "wb+") as fd:
         fd.write("Haha!".encode())
@@ -210,3 +213,38 @@ def test_gzip_encoding(server):
     response = yield client.fetch(request)
     assert response.code == 200
     assert response.headers["X-Consumed-Content-Encoding"] == "gzip"
+
+
+@pytest.mark.gen_test
+def test_argument_binder():
+    @gen.coroutine
+    def getter(value, metadata):
+        metadata["getter"] = value
+        return value + 1
+
+    def method(self, tid: uuid.UUID, when: datetime.datetime, state: const.ResourceState, flag: bool=False, count: int=0):
+        pass
+
+    properties = {"arg_options": {"tid": {"header": "X-Inmanta-tid", "reply_header": True},
+                                  "count": {"getter": getter}}}
+    binder = protocol.ArgumentBinder(properties, method)
+    assert not binder.accepts_kwargs
+
+    tid = uuid.uuid4()
+    message = {"when": "2018-07-01T12:00:00.000000", "state": "deployed", "flag": "true", "count": "1", "other": 1}
+    headers = {}
+    metadata, fields = yield binder.bind(message, {"X-Inmanta-tid": str(tid)}, headers)
+
+    assert message == {"tid": tid, "when": datetime.datetime(2018, 7, 1, 12), "state": const.ResourceState.deployed,
+                       "flag": True, "count": 2, "other": 1}
+    assert headers == {"X-Inmanta-tid": str(tid)}
+    assert metadata == {"getter": 1}
+    assert fields == {"other"}
+
+    # missing argument
+    with pytest.raises(methods.HTTPException):
+        yield binder.bind({"state": "deployed"}, {"X-Inmanta-tid": str(tid)}, {})
+
+    # invalid type
+    with pytest.raises(methods.HTTPException):
+        yield binder.bind({"when": "2018-07-01T12:00:00.000000", "state": "unknown_state"}, {"X-Inmanta-tid": str(tid)}, {})
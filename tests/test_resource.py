@@ -16,7 +16,7 @@
     Contact: code@inmanta.com
 """
 
-from inmanta import resources
+from inmanta import resources, util
 import pytest
 from inmanta.resources import resource, ResourceException
 
@@ -184,3 +184,45 @@ def test_resource_with_private_method(snippetcompiler):
 
     with pytest.raises(ResourceException):
         snippetcompiler.do_export()
+
+
+def test_copy_for_version():
+
+    @resource("test_resource::CopyResource", agent="agent", id_attribute="key")
+    class MyResource(resources.Resource):
+        fields = ("key", "value", "agent")
+
+    res = resources.Resource.deserialize({"id": "test_resource::CopyResource[agent1,key=key],v=1", "key": "key",
+                                          "value": [1], "agent": "agent1", "send_event": False,
+                                          "requires": ["test_resource::CopyResource[agent1,key=other],v=1"]})
+
+    copy = res.copy_for_version(2)
+    assert isinstance(copy, MyResource)
+    assert str(copy.id) == "test_resource::CopyResource[agent1,key=key],v=2"
+    assert [str(x) for x in copy.requires] == ["test_resource::CopyResource[agent1,key=other],v=2"]
+    assert copy.value == [1]
+
+    # the original resource is not changed
+    assert str(res.id) == "test_resource::CopyResource[agent1,key=key],v=1"
+    assert [str(x) for x in res.requires] == ["test_resource::CopyResource[agent1,key=other],v=1"]
+
+    # a copy of a resource of which the class was replaced, uses the new class
+    @resource("test_resource::CopyResource", agent="agent", id_attribute="key")
+    class MyNewResource(resources.Resource):
+        fields = ("key", "value", "agent")
+
+    copy = res.copy_for_version(3)
+    assert isinstance(copy, MyNewResource)
+    assert str(copy.id) == "test_resource::CopyResource[agent1,key=key],v=3"
+    assert copy.value == [1]
+
+
+def test_hash_resource_attributes():
+    attributes = {"id": "test_resource::Resource[agent1,b=key],v=1", "b": "key", "version": 1,
+                  "requires": ["test_resource::Resource[agent1,b=x],v=1", "test_resource::Resource[agent1,b=y],v=1"]}
+    same = {"id": "test_resource::Resource[agent1,b=key],v=2", "b": "key", "version": 2,
+            "requires": ["test_resource::Resource[agent1,b=y],v=2", "test_resource::Resource[agent1,b=x],v=2"]}
+    other = dict(same, b="other")
+
+    assert util.hash_resource_attributes(attributes) == util.hash_resource_attributes(same)
+    assert util.hash_resource_attributes(attributes) != util.hash_resource_attributes(other)
@@ -29,13 +29,26 @@ from inmanta.server import config as opt, SLICE_AGENT_MANAGER, SLICE_SESSION_MAN
 from datetime import datetime
 from uuid import UUID
 from inmanta.export import upload_code
-from inmanta.util import hash_file
+from inmanta.util import decompress_payload, hash_file
 from inmanta.export import unknown_parameters
 from threading import Thread
 
 LOGGER = logging.getLogger(__name__)
 
 
+@pytest.mark.gen_test
+def test_ensure_agents_registered(server, environment):
+    env = yield data.Environment.get_by_id(uuid.UUID(environment))
+    agentmanager = server.get_endpoint(SLICE_AGENT_MANAGER)
+
+    yield agentmanager.ensure_agent_registered(env, "agent1")
+    yield agentmanager.ensure_agents_registered(env, {"agent1", "agent2", "agent3"})
+    yield agentmanager.ensure_agents_registered(env, {"agent3"})
+
+    agents = yield data.Agent.get_list(environment=env.id)
+    assert sorted(agent.name for agent in agents) == ["agent1", "agent2", "agent3"]
+
+
 @pytest.mark.gen_test(timeout=60)
 @pytest.mark.slowtest
 def test_autostart(server, client, environment):
@@ -387,6 +400,199 @@ def test_resource_update(io_loop, client, server, environment):
     assert result.result["model"]["done"] == 10
 
 
+@pytest.mark.gen_test
+def test_resource_update_batched(io_loop, client, server, environment):
+    """
+        Test reporting multiple finished resource actions in a single call
+    """
+    agent = Agent(io_loop, "localhost", {"blah": "localhost"}, environment=environment)
+    agent.start()
+    aclient = agent._client
+
+    version = int(time.time())
+
+    resources = []
+    for j in range(10):
+        resources.append({
+            'group': 'root',
+            'hash': '89bf880a0dc5ffc1156c8d958b4960971370ee6a',
+            'id': 'std::File[vm1,path=/tmp/file%d],v=%d' % (j, version),
+            'owner': 'root',
+            'path': '/tmp/file%d' % j,
+            'permissions': 644,
+            'purged': False,
+            'reload': False,
+            'requires': [],
+            'version': version})
+
+    res = yield client.put_version(tid=environment, version=version, resources=resources, unknowns=[], version_info={})
+    assert res.code == 200
+
+    result = yield client.release_version(environment, version, push=False)
+    assert result.code == 200
+
+    resource_ids = [x["id"] for x in resources]
+
+    def action(resource_id, status="deployed"):
+        now = datetime.now()
+        return dict(resource_ids=[resource_id], action_id=uuid.uuid4(), action=const.ResourceAction.deploy, started=now,
+                    finished=now, status=status, changes={resource_id: {"owner": {"old": "root", "current": "inmanta"}}},
+                    messages=[data.LogLine.log(const.LogLevel.INFO, "Test log %(a)s", a="a")], change=const.Change.updated,
+                    send_events=False)
+
+    actions = [action(rid) for rid in resource_ids[:9]]
+    actions.append(action("std::File[vm1,path=/tmp/unknown],v=%d" % version))
+    actions.append(action(resource_ids[9], status="failed"))
+    result = yield aclient.resource_action_update_batched(environment, actions)
+    assert result.code == 200
+    assert [x["code"] for x in result.result["results"]] == [200] * 9 + [404, 200]
+
+    result = yield client.get_resource(tid=environment, id=resource_ids[0], status=True)
+    assert result.code == 200
+    assert result.result["status"] == "deployed"
+
+    result = yield client.get_resource(tid=environment, id=resource_ids[0], logs=True)
+    assert result.code == 200
+    logs = {x["action"]: x for x in result.result["logs"]}
+    assert logs["deploy"]["messages"][0]["msg"] == "Test log a"
+    assert logs["deploy"]["changes"][resource_ids[0]]["owner"]["current"] == "inmanta"
+    assert "finished" in logs["deploy"]
+
+    result = yield client.get_version(environment, version)
+    assert result.code == 200
+    assert result.result["model"]["done"] == 10
+    assert result.result["model"]["deployed"]
+    assert result.result["model"]["result"] == "failed"
+
+    result = yield client.get_version_status(environment, version, start=8, limit=5)
+    assert result.code == 200
+    assert result.result["count"] == 2
+    assert result.result["status"] == [{"id": resource_ids[8], "status": "deployed"},
+                                       {"id": resource_ids[9], "status": "failed"}]
+
+
+@pytest.mark.gen_test
+def test_resources_for_agent_cache(io_loop, client, server, environment):
+    """
+        Test that the resources for an agent are cached and that the cache follows new versions and deploys
+    """
+    agent = Agent(io_loop, "localhost", {"blah": "localhost"}, environment=environment)
+    agent.start()
+    aclient = agent._client
+    cache = server.get_endpoint("server")._resource_cache
+
+    def put_version(version):
+        resources = [{'group': 'root',
+                      'hash': '89bf880a0dc5ffc1156c8d958b4960971370ee6a',
+                      'id': 'std::File[vm1,path=/tmp/file%d],v=%d' % (j, version),
+                      'owner': 'root',
+                      'path': '/tmp/file%d' % j,
+                      'permissions': 644,
+                      'purged': False,
+                      'reload': False,
+                      'requires': [],
+                      'version': version} for j in range(3)]
+        return client.put_version(tid=environment, version=version, resources=resources, unknowns=[], version_info={})
+
+    version = int(time.time())
+    result = yield put_version(version)
+    assert result.code == 200
+    result = yield client.release_version(environment, version, push=False)
+    assert result.code == 200
+
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert len(result.result["resources"]) == 3
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert len(result.result["resources"]) == 3
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    result = yield client.get_cache_statistics()
+    assert result.code == 200
+    assert result.result["resources"] == {"hits": 1, "misses": 1, "entries": 1}
+    assert result.result["code_bundles"] == {"hits": 0, "misses": 0, "entries": 0}
+
+    # a deploy updates the cached status
+    rvid = result.result["resources"][0]["id"]
+    now = datetime.now()
+    result = yield aclient.resource_action_update(environment, [rvid], uuid.uuid4(), "deploy", now, now, "deployed", [], {})
+    assert result.code == 200
+
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert cache.hits == 2
+    assert {x["id"]: x["status"] for x in result.result["resources"]}[rvid] == "deployed"
+
+    # a new version is served once it is released
+    result = yield put_version(version + 1)
+    assert result.code == 200
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert result.result["version"] == version
+
+    result = yield client.release_version(environment, version + 1, push=False)
+    assert result.code == 200
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert result.result["version"] == version + 1
+
+    # deleting the latest version falls back to the previous one
+    result = yield client.delete_version(environment, version + 1)
+    assert result.code == 200
+    result = yield aclient.get_resources_for_agent(environment, "vm1")
+    assert result.code == 200
+    assert result.result["version"] == version
+
+
+@pytest.mark.gen_test
+def test_resources_for_agent_since_version(io_loop, client, server, environment):
+    """
+        Test pulling only the resources that changed since a previous version
+    """
+    agent = Agent(io_loop, "localhost", {"blah": "localhost"}, environment=environment)
+    agent.start()
+    aclient = agent._client
+
+    def put_version(version, files):
+        resources = [{'group': 'root',
+                      'hash': '89bf880a0dc5ffc1156c8d958b4960971370ee6a',
+                      'id': 'std::File[vm1,path=/tmp/file%d],v=%d' % (j, version),
+                      'owner': owner,
+                      'path': '/tmp/file%d' % j,
+                      'permissions': 644,
+                      'purged': False,
+                      'reload': False,
+                      'requires': ['std::File[vm1,path=/tmp/file0],v=%d' % version] if j > 0 else [],
+                      'version': version} for j, owner in files.items()]
+        return client.put_version(tid=environment, version=version, resources=resources, unknowns=[], version_info={})
+
+    version = int(time.time())
+    result = yield put_version(version, {0: "root", 1: "root", 2: "root"})
+    assert result.code == 200
+    result = yield put_version(version + 1, {0: "root", 1: "inmanta", 3: "root"})
+    assert result.code == 200
+    result = yield client.release_version(environment, version + 1, push=False)
+    assert result.code == 200
+
+    result = yield aclient.get_resources_for_agent(environment, "vm1", since_version=version)
+    assert result.code == 200
+    assert result.result["version"] == version + 1
+    assert result.result["since_version"] == version
+    changed = sorted(x["resource_id"] for x in result.result["resources"])
+    assert changed == ["std::File[vm1,path=/tmp/file1]", "std::File[vm1,path=/tmp/file3]"]
+    assert [x["id"] for x in result.result["unchanged"]] == ["std::File[vm1,path=/tmp/file0],v=%d" % (version + 1)]
+    assert result.result["removed"] == ["std::File[vm1,path=/tmp/file2]"]
+
+    # an unknown version returns everything
+    result = yield aclient.get_resources_for_agent(environment, "vm1", since_version=version - 1)
+    assert result.code == 200
+    assert "since_version" not in result.result
+    assert len(result.result["resources"]) == 3
+
+
 @pytest.mark.gen_test
 def test_environment_settings(io_loop, client, server, environment):
     """
@@ -999,6 +1205,47 @@ def test_batched_code_upload(io_loop, motor, server_multi, client_multi, environ
         assert res.result["sources"] == sourcemap
 
 
+@pytest.mark.gen_test(timeout=30)
+def test_code_bundle(io_loop, motor, server_multi, client_multi, environment):
+    """
+        Test getting the code of all resource types of a version in a single bundle
+    """
+    asources = make_source({}, "a.py", "std.test", "wlkvsdbhewvsbk vbLKBVWE wevbhbwhBH", [])
+    asources = make_source(asources, "b.py", "std.xxx", "rvvWBVWHUvejIVJE UWEBVKW", ["pytest"])
+    bsources = make_source({}, "c.py", "std.other", "enhkahEUWLGBVFEHJ UWEBVKW", ["pytest"])
+
+    agent = protocol.Client("agent")
+    hashes = []
+    for version, sources in [(1, {"std::File": asources, "std::Other": bsources}),
+                             (2, {"std::File": asources, "std::Other": bsources}),
+                             (3, {"std::File": asources})]:
+        resources = [{'id': 'std::File[vm1,path=/tmp/a],v=%d' % version, 'path': '/tmp/a', 'purged': False, 'requires': [],
+                      'version': version}]
+        res = yield client_multi.put_version(tid=environment, version=version, resources=resources, unknowns=[],
+                                             version_info={})
+        assert res.code == 200
+        yield upload_code(client_multi, environment, version, sources)
+
+        res = yield agent.get_code_bundle(tid=environment, id=version)
+        assert res.code == 200
+        assert not res.result["unchanged"]
+        assert res.result["resources"] == {name: sorted(sourcemap.keys()) for name, sourcemap in sources.items()}
+        expected = {}
+        for sourcemap in sources.values():
+            expected.update(sourcemap)
+        assert decompress_payload(res.result["sources"]) == expected
+        hashes.append(res.result["hash"])
+
+    # the same code has the same hash
+    assert hashes[0] == hashes[1]
+    assert hashes[1] != hashes[2]
+
+    res = yield agent.get_code_bundle(tid=environment, id=2, code_hash=hashes[0])
+    assert res.code == 200
+    assert res.result["unchanged"]
+    assert "sources" not in res.result
+
+
 @pytest.mark.gen_test(timeout=30)
 def test_legacy_code(io_loop, motor, server_multi, client_multi, environment):
     """
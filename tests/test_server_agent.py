@@ -168,7 +168,11 @@ def resource_container():
         def do_reload(self, ctx, resource):
             self.__class__._RELOAD_COUNT[resource.id.get_agent_name()][resource.key] += 1
 
+        def prefetch(self, resources):
+            self.__class__._PREFETCHED.append(sorted(resource.key for resource in resources))
+
         _STATE = defaultdict(dict)
+        _PREFETCHED = []
         _WRITE_COUNT = defaultdict(lambda: defaultdict(lambda: 0))
         _RELOAD_COUNT = defaultdict(lambda: defaultdict(lambda: 0))
         _READ_COUNT = defaultdict(lambda: defaultdict(lambda: 0))
@@ -244,9 +248,14 @@ def resource_container():
         def reloadcount(cls, agent, key):
             return cls._RELOAD_COUNT[agent][key]
 
+        @classmethod
+        def prefetched(cls):
+            return cls._PREFETCHED
+
         @classmethod
         def reset(cls):
             cls._STATE = defaultdict(dict)
+            cls._PREFETCHED = []
             cls._EVENTS = defaultdict(lambda: defaultdict(lambda: []))
             cls._WRITE_COUNT = defaultdict(lambda: defaultdict(lambda: 0))
             cls._READ_COUNT = defaultdict(lambda: defaultdict(lambda: 0))
@@ -679,6 +688,88 @@ def test_deploy_with_undefined(io_loop, server_multi, client_multi, resource_con
     inmanta.agent.agent.GET_RESOURCE_BACKOFF = backoff
 
 
+@pytest.mark.gen_test(timeout=30)
+def test_incremental_deploy(io_loop, server, client, resource_container, environment):
+    """
+        Test that an incremental deploy does not call the handler of resources that did not change
+    """
+    # agent backoff makes this test unreliable or slow, so we turn it off
+    backoff = inmanta.agent.agent.GET_RESOURCE_BACKOFF
+    inmanta.agent.agent.GET_RESOURCE_BACKOFF = 0
+
+    agentmanager = server.get_endpoint(SLICE_AGENT_MANAGER)
+
+    Config.set("config", "agent-interval", "100")
+    resource_container.Provider.reset()
+
+    result = yield client.set_setting(environment, data.INCREMENTAL_DEPLOY, True)
+    assert result.code == 200
+
+    agent = Agent(io_loop, hostname="node1", environment=environment, agent_map={"agent1": "localhost"},
+                  code_loader=False)
+    agent.add_end_point_name("agent1")
+    agent.start()
+
+    yield retry_limited(lambda: len(agentmanager.sessions) == 1, 10)
+
+    def get_resources(version, value):
+        return [{'key': 'key1',
+                 'value': 'value1',
+                 'id': 'test::Resource[agent1,key=key1],v=%d' % version,
+                 'send_event': False,
+                 'purged': False,
+                 'requires': [],
+                 },
+                {'key': 'key2',
+                 'value': value,
+                 'id': 'test::Resource[agent1,key=key2],v=%d' % version,
+                 'send_event': False,
+                 'purged': False,
+                 'requires': ['test::Resource[agent1,key=key1],v=%d' % version],
+                 }]
+
+    @gen.coroutine
+    def deploy(version, value):
+        result = yield client.put_version(tid=environment, version=version, resources=get_resources(version, value),
+                                          unknowns=[], version_info={})
+        assert result.code == 200
+
+        result = yield client.release_version(environment, version, True)
+        assert result.code == 200
+
+        result = yield client.get_version(environment, version)
+        while result.result["model"]["total"] - result.result["model"]["done"] > 0:
+            result = yield client.get_version(environment, version)
+            yield gen.sleep(0.1)
+
+        assert result.result["model"]["result"] == const.VersionState.success.name
+
+    version = int(time.time())
+    yield deploy(version, "value2")
+    assert resource_container.Provider.readcount("agent1", "key1") == 1
+    assert resource_container.Provider.readcount("agent1", "key2") == 1
+    # the handler prefetches all resources of its type once before they are deployed
+    assert resource_container.Provider.prefetched() == [["key1", "key2"]]
+
+    # only key2 changed in the new version
+    yield deploy(version + 1, "value3")
+    assert resource_container.Provider.readcount("agent1", "key1") == 1
+    assert resource_container.Provider.readcount("agent1", "key2") == 2
+    assert resource_container.Provider.get("agent1", "key2") == "value3"
+
+    # a full deploy of the agent checks all resources again
+    yield agent._instances["agent1"].get_latest_version_for_agent(reason="repair")
+
+    def done():
+        return resource_container.Provider.readcount("agent1", "key1") == 2 and \
+            resource_container.Provider.readcount("agent1", "key2") == 3
+
+    yield retry_limited(done, 10)
+
+    agent.stop()
+    inmanta.agent.agent.GET_RESOURCE_BACKOFF = backoff
+
+
 @pytest.mark.gen_test(timeout=30)
 def test_server_restart(resource_container, io_loop, server, mongo_db, client):
     """
@@ -2142,9 +2233,15 @@ def test_dryrun_scale(resource_container, io_loop, server, client):
         result = yield client.dryrun_list(env_id, version)
         yield gen.sleep(0.1)
 
-    dry_run_id = result.result["dryruns"][0]["id"]
+    progress = result.result["dryruns"][0]
+    assert progress["done"] == len(resources)
+    assert progress["failed"] == 0
+    assert progress["last_update"] is not None
+
+    dry_run_id = progress["id"]
     result = yield client.dryrun_report(env_id, dry_run_id)
     assert result.code == 200
+    assert len(result.result["dryrun"]["resources"]) == len(resources)
 
     agent.stop()
 
@@ -2222,6 +2319,7 @@ def test_dryrun_failures(resource_container, io_loop, server, client):
         print(result.result)
         yield gen.sleep(0.1)
 
+    assert result.result["dryruns"][0]["failed"] == len(resources)
     dry_run_id = result.result["dryruns"][0]["id"]
     result = yield client.dryrun_report(env_id, dry_run_id)
     assert result.code == 200
@@ -3147,3 +3245,77 @@ def test_reload(io_loop, client, server, environment, resource_container, dep_st
     assert result.result["model"]["done"] == len(resources)
 
     assert dep_state.index == resource_container.Provider.reloadcount("agent1", "key2")
+
+
+@pytest.mark.gen_test(timeout=30)
+def test_batch_deploy(io_loop, server, client, environment):
+    """
+        Test that the resources of a handler that supports batch execution are deployed with a single call, even when the
+        agent only has a single slot to deploy resources
+    """
+    @resource("test::Batch", agent="agent", id_attribute="key")
+    class BatchResource(Resource):
+        fields = ("key", "value", "purged")
+
+    batches = []
+
+    @provider("test::Batch", name="test_batch")
+    class BatchProvider(ResourceHandler):
+
+        def can_execute_batch(self):
+            return True
+
+        def execute_batch(self, items, dry_run=False):
+            batches.append(sorted(res.key for _, res in items))
+            if any(res.value == "raise" for _, res in items):
+                raise Exception("The batch failed")
+
+            for ctx, res in items:
+                if res.value == "fail":
+                    ctx.set_status(const.ResourceState.failed)
+                else:
+                    ctx.set_status(const.ResourceState.deployed)
+
+    Config.set("config", "agent-batch-window", "0.5")
+    agentmanager = server.get_endpoint(SLICE_AGENT_MANAGER)
+
+    agent = Agent(io_loop, hostname="node1", environment=environment, agent_map={"agent1": "localhost"},
+                  code_loader=False, poolsize=1)
+    agent.add_end_point_name("agent1")
+    agent.start()
+    yield retry_limited(lambda: len(agentmanager.sessions) == 1, 10)
+
+    @gen.coroutine
+    def deploy(version, values):
+        resources = [{'key': 'key%d' % i,
+                      'value': value,
+                      'id': 'test::Batch[agent1,key=key%d],v=%d' % (i, version),
+                      'send_event': False,
+                      'purged': False,
+                      'requires': [],
+                      } for i, value in enumerate(values)]
+        result = yield client.put_version(tid=environment, version=version, resources=resources, unknowns=[],
+                                          version_info={})
+        assert result.code == 200
+
+        result = yield client.release_version(environment, version, True)
+        assert result.code == 200
+
+        result = yield client.get_version(environment, version)
+        while result.result["model"]["total"] - result.result["model"]["done"] > 0:
+            result = yield client.get_version(environment, version)
+            yield gen.sleep(0.1)
+
+        return [x["status"] for x in sorted(result.result["resources"], key=lambda x: x["id"])]
+
+    version = int(time.time())
+    states = yield deploy(version, ["value", "fail", "value"])
+    assert batches == [["key0", "key1", "key2"]]
+    assert states == ["deployed", "failed", "deployed"]
+
+    # all resources of a batch that raises an exception fail
+    states = yield deploy(version + 1, ["value", "raise", "value"])
+    assert batches[1:] == [["key0", "key1", "key2"]]
+    assert states == ["failed", "failed", "failed"]
+
+    agent.stop()